@@ -0,0 +1,546 @@
+"""
+@file benchmark.py
+@brief Lokale Benchmarks mit mehreren Peers für den Peer-to-Peer-Chat "Plauderkiste".
+
+Startet N Peers ohne Benutzeroberfläche auf dem Loopback-Interface. Jeder Peer bekommt eine
+eigene, generierte Konfigurationsdatei (wie config1.toml) und besteht wie beim normalen Start
+aus einem Discovery- und einem Netzwerkprozess mit eigener Peer-Tabelle. Das Benchmark-Skript
+übernimmt die Rolle des CLI: Es legt Kommandos in die Queues der Peers und wertet die Ereignisse
+aus ihren UI-Queues aus.
+
+Gemessen werden:
+ - Start: Zeit vom Aufruf von start.py bis zum Eingabe-Prompt (Ziel: TIME_TO_PROMPT_TARGET) und
+   bis beide Dienste bereit sind
+ - Discovery: Zeit, bis alle Peers einander kennen (gemeinsamer Start und Beitritt eines Peers)
+ - Latenz: Round-Trip-Zeit einer Textnachricht (Perzentile)
+ - Durchsatz: Textnachrichten pro Sekunde zwischen zwei Peers
+ - Bilder: Übertragungsrate je Dateigröße und Inhalt (Zufallsdaten wie JPEG/PNG oder ein
+   unkomprimiertes Bitmap) sowie die tatsächlich gesendeten Bytes. Auf dem Loopback-Interface
+   begrenzt die CPU, nicht die Leitung; für eine langsame Leitung mit Rate R ergibt sich die
+   effektive Übertragungsrate etwa als R / wire_ratio.
+ - Ressourcen: Speicher (RSS, Spitzenwert) und CPU-Zeit jedes Prozesses
+
+Die Ergebnisse werden als JSON gespeichert, damit sich Läufe vergleichen lassen. Es wird kein
+Netzwerk außerhalb des Rechners benötigt; CPU- und Speicherwerte stammen aus /proc (Linux).
+
+Aufruf:
+
+    python benchmark.py [--peers 8] [--messages 2000] [--samples 200] [--sizes 1,16,64]
+                        [--content random,bitmap] [--startup-runs 3] [--out benchmark.json]
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import toml
+from discovery_comm import discovery_service
+from network_comm import network_service
+from peer_table import create_peer_table, close_peer_table, peer_snapshot
+from flow_control import UI_QUEUE_LIMIT, COMMAND_QUEUE_LIMIT
+from events import EVENT_MESSAGE, EVENT_IMAGE, EVENT_ERROR, EVENT_METRICS
+from protocol import CMD_MSG, CMD_IMG_SEND, CMD_STATS
+
+## Broadcast-Adresse, über die sich die Peers auf dem Loopback-Interface finden.
+LOOPBACK_BROADCAST = "127.255.255.255"
+## Maximale Wartezeit auf ein einzelnes Ergebnis in Sekunden.
+WAIT_TIMEOUT = 60
+## Höchstzahl gesendeter, noch nicht empfangener Nachrichten im Durchsatztest.
+THROUGHPUT_WINDOW = 500
+## Breite des Test-Bitmaps in Pixeln (24 Bit pro Pixel).
+BITMAP_WIDTH = 1024
+## Zielwert für die Zeit bis zum Eingabe-Prompt in Sekunden.
+TIME_TO_PROMPT_TARGET = 0.5
+## Ausgaben, an denen der Startbenchmark Prompt und bereite Dienste erkennt.
+STARTUP_MARKS = {
+    "prompt": b"Plauderkiste >",
+    "discovery": b"Eigene IP",
+    "network": b"Lausche auf TCP-Port",
+}
+
+
+## Liefert einen freien Port auf dem Loopback-Interface.
+def free_port(kind=socket.SOCK_STREAM):
+    """
+    @param kind: socket.SOCK_STREAM (TCP) oder socket.SOCK_DGRAM (UDP)
+    @return: Portnummer
+    """
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+## Schreibt die Konfigurationsdatei eines Benchmark-Peers.
+def write_config(workdir, index, udp_port):
+    """
+    @param workdir: Arbeitsverzeichnis des Laufs
+    @param index: Nummer des Peers
+    @param udp_port: Gemeinsamer UDP-Port für Discovery
+    @return: Pfad der Konfigurationsdatei
+    """
+    config = {
+        "handle": f"Bench{index}",
+        "port": free_port(),
+        "whoisport": udp_port,
+        "imagepath": os.path.join(workdir, f"images{index}"),
+        "historypath": os.path.join(workdir, f"verlauf{index}"),
+        "outboxpath": os.path.join(workdir, f"outbox{index}"),
+        "openimages": False,
+        "ip": "127.0.0.1",
+        "broadcast": LOOPBACK_BROADCAST,
+        "ratelimit": 0,   # Durchsatz ohne Drosselung pro Peer messen
+    }
+    path = os.path.join(workdir, f"config{index}.toml")
+    with open(path, "w", encoding="utf-8") as f:
+        toml.dump(config, f)
+    return path
+
+
+## Startet einen Peer ohne Benutzeroberfläche.
+def start_peer(config_path):
+    """
+    @param config_path: Pfad der Konfigurationsdatei
+    @return: Peer (dict) mit Konfiguration, Peer-Tabelle, Queues und Prozessen
+    """
+    config = toml.load(config_path)
+    config["config_path"] = config_path
+    peer = {
+        "config": config,
+        "name": config["handle"],
+        "table": create_peer_table(),
+        "ui_queue": multiprocessing.Queue(UI_QUEUE_LIMIT),
+        "disc_queue": multiprocessing.Queue(COMMAND_QUEUE_LIMIT),
+        "net_queue": multiprocessing.Queue(COMMAND_QUEUE_LIMIT),
+        "started": time.monotonic(),
+    }
+    peer["processes"] = {
+        "discovery": multiprocessing.Process(
+            target=discovery_service,
+            args=(peer["ui_queue"], peer["disc_queue"], config, peer["table"]["name"]), daemon=True),
+        "network": multiprocessing.Process(
+            target=network_service,
+            args=(peer["ui_queue"], peer["net_queue"], config, peer["table"]["name"]), daemon=True),
+    }
+    for proc in peer["processes"].values():
+        proc.start()
+    return peer
+
+
+## Beendet einen Peer und gibt seine Peer-Tabelle frei.
+def stop_peer(peer):
+    """
+    @param peer: Peer aus start_peer
+    @return: None
+    """
+    for proc in peer["processes"].values():
+        proc.terminate()
+    for proc in peer["processes"].values():
+        proc.join()
+    close_peer_table(peer["table"], unlink=True)
+
+
+## Holt alle wartenden Ereignisse aus der UI-Queue eines Peers.
+def drain(peer):
+    """
+    @param peer: Peer aus start_peer
+    @return: Liste der Ereignisse (kind, text, meta)
+    """
+    events = []
+    while True:
+        try:
+            events.append(peer["ui_queue"].get_nowait())
+        except queue.Empty:
+            return events
+
+
+## Wartet auf ein Ereignis eines Peers, das eine Bedingung erfüllt.
+def wait_event(peer, match, timeout=WAIT_TIMEOUT):
+    """
+    Andere Ereignisse werden verworfen.
+
+    @param peer: Peer aus start_peer
+    @param match: Funktion match(kind, text, meta) -> bool
+    @param timeout: Maximale Wartezeit in Sekunden
+    @return: Ereignis (kind, text, meta)
+    @throws TimeoutError: wenn das Ereignis nicht rechtzeitig eintrifft
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Kein passendes Ereignis von {peer['name']}")
+        try:
+            event = peer["ui_queue"].get(timeout=remaining)
+        except queue.Empty:
+            continue
+        if event[0] == EVENT_ERROR:
+            raise RuntimeError(f"{peer['name']}: {event[1]}")
+        if match(*event):
+            return event
+
+
+## Bedingung für wait_event: Textnachricht eines bestimmten Absenders.
+def message_from(sender):
+    """
+    @param sender: Nutzername des Absenders
+    @return: Funktion match(kind, text, meta) -> bool
+    """
+    return lambda kind, text, meta: kind == EVENT_MESSAGE and meta.get("sender") == sender
+
+
+## Wartet, bis jeder Peer alle anderen kennt.
+def wait_converged(peers, since):
+    """
+    @param peers: Liste der Peers
+    @param since: Startzeitpunkt der Messung (time.monotonic)
+    @return: Sekunden bis zur vollständigen Peer-Liste bei allen Peers
+    @throws TimeoutError: wenn die Peers sich nicht rechtzeitig finden
+    """
+    deadline = since + WAIT_TIMEOUT
+    while any(len(peer_snapshot(p["table"])) < len(peers) for p in peers):
+        if time.monotonic() > deadline:
+            raise TimeoutError("Discovery ist nicht konvergiert")
+        for p in peers:
+            drain(p)
+        time.sleep(0.001)
+    return time.monotonic() - since
+
+
+## Misst die Discovery: gemeinsamer Start aller Peers und Beitritt eines weiteren Peers.
+def bench_discovery(config_paths):
+    """
+    Beide Zeiten enthalten den Start der Prozesse, so wie ihn auch ein Nutzer erlebt.
+
+    @param config_paths: Konfigurationsdateien aller Peers; der letzte Peer tritt nachträglich bei
+    @return: (Peers, Ergebnis-dict)
+    """
+    since = time.monotonic()
+    peers = [start_peer(path) for path in config_paths[:-1]]
+    startup = wait_converged(peers, since)
+    since = time.monotonic()
+    peers.append(start_peer(config_paths[-1]))
+    join = wait_converged(peers, since)
+    return peers, {"peers": len(peers), "startup_s": startup, "join_s": join}
+
+
+## Misst die Startzeit des vollständigen Programms (start.py mit CLI).
+def bench_startup(config_path, runs):
+    """
+    Startet start.py als eigenen Prozess (wie ein Benutzer), liest seine Ausgabe mit und beendet
+    ihn über das Schließen der Eingabe. Gemessen wird ab dem Aufruf, also einschließlich des
+    Interpreterstarts.
+
+    @param config_path: Pfad der Konfigurationsdatei
+    @param runs: Anzahl der Starts
+    @return: Ergebnis (dict) mit Medianen, Einzelwerten und ob TIME_TO_PROMPT_TARGET erreicht wurde
+    @throws RuntimeError: wenn start.py nicht alle Startmeldungen ausgibt
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "start.py")
+    prompt, ready = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, script, config_path], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                cwd=os.path.dirname(config_path))
+        output, marks = b"", {}
+        try:
+            while len(marks) < len(STARTUP_MARKS) and time.perf_counter() - started < WAIT_TIMEOUT:
+                chunk = os.read(proc.stdout.fileno(), 4096)
+                if not chunk:
+                    break
+                output += chunk
+                for name, text in STARTUP_MARKS.items():
+                    if name not in marks and text in output:
+                        marks[name] = time.perf_counter() - started
+        finally:
+            proc.stdin.close()
+            proc.stdout.read()
+            proc.wait(WAIT_TIMEOUT)
+        if len(marks) < len(STARTUP_MARKS):
+            raise RuntimeError("start.py hat nicht alle Startmeldungen ausgegeben")
+        prompt.append(marks["prompt"])
+        ready.append(max(marks["discovery"], marks["network"]))
+    time_to_prompt = sorted(prompt)[len(prompt) // 2]
+    return {
+        "runs": runs,
+        "time_to_prompt_s": time_to_prompt,
+        "services_ready_s": sorted(ready)[len(ready) // 2],
+        "target_s": TIME_TO_PROMPT_TARGET,
+        "target_met": time_to_prompt <= TIME_TO_PROMPT_TARGET,
+        "samples_s": {"prompt": prompt, "ready": ready},
+    }
+
+
+## Berechnet Perzentile einer Messreihe.
+def percentiles(values, points=(50, 90, 99)):
+    """
+    @param values: Messwerte
+    @param points: Gewünschte Perzentile
+    @return: dict mit p50, p90, ... sowie min, max und mean
+    """
+    ordered = sorted(values)
+    result = {f"p{p}": ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in points}
+    result.update(min=ordered[0], max=ordered[-1], mean=sum(ordered) / len(ordered))
+    return result
+
+
+## Misst die Round-Trip-Zeit einer Textnachricht zwischen zwei Peers.
+def bench_latency(a, b, samples):
+    """
+    a sendet eine Nachricht an b; sobald sie bei b ankommt, antwortet b an a.
+
+    @param a: Sendender Peer
+    @param b: Antwortender Peer
+    @param samples: Anzahl der Messungen
+    @return: Ergebnis-dict mit Perzentilen in Millisekunden
+    """
+    times = []
+    for i in range(samples):
+        start = time.perf_counter()
+        a["net_queue"].put((CMD_MSG, b["name"], f"ping {i}"))
+        wait_event(b, message_from(a["name"]))
+        b["net_queue"].put((CMD_MSG, a["name"], f"pong {i}"))
+        wait_event(a, message_from(b["name"]))
+        times.append((time.perf_counter() - start) * 1000)
+    return {"samples": samples, "rtt_ms": percentiles(times)}
+
+
+## Misst, wie viele Textnachrichten pro Sekunde von einem Peer zum anderen gelangen.
+def bench_throughput(a, b, count):
+    """
+    Es sind höchstens THROUGHPUT_WINDOW Nachrichten gleichzeitig unterwegs, damit die
+    Warteschlange des Empfängers im Netzwerkprozess nicht überläuft.
+
+    @param a: Sendender Peer
+    @param b: Empfangender Peer
+    @param count: Anzahl der Nachrichten
+    @return: Ergebnis-dict
+    """
+    sent = received = 0
+    start = time.perf_counter()
+    while received < count:
+        while sent < count and sent - received < THROUGHPUT_WINDOW:
+            a["net_queue"].put((CMD_MSG, b["name"], f"durchsatz {sent}"))
+            sent += 1
+        wait_event(b, message_from(a["name"]))
+        received += 1
+        drain(a)
+    elapsed = time.perf_counter() - start
+    return {"messages": count, "seconds": elapsed, "messages_per_s": count / elapsed}
+
+
+## Schreibt eine Testdatei mit Zufallsdaten (nicht komprimierbar, wie JPEG/PNG).
+def write_random_file(path, size):
+    """
+    @param path: Zieldatei
+    @param size: Größe in Bytes
+    @return: None
+    """
+    with open(path, "wb") as f:
+        for _ in range(0, size, 1024 * 1024):
+            f.write(os.urandom(min(1024 * 1024, size - f.tell())))
+
+
+## Schreibt ein unkomprimiertes 24-Bit-Bitmap (BMP) mit Farbverläufen und etwas Rauschen.
+def write_bitmap_file(path, size):
+    """
+    Ähnelt einem Screenshot: große gleichmäßige Flächen, dazwischen zufällige Stellen.
+
+    @param path: Zieldatei
+    @param size: Ungefähre Größe in Bytes (ganze Zeilen)
+    @return: None
+    """
+    row_bytes = BITMAP_WIDTH * 3
+    height = max(1, size // row_bytes)
+    patterns = [bytes((x // 4 + y * 3) & 0xFF for x in range(row_bytes)) for y in range(64)]
+    with open(path, "wb") as f:
+        # BITMAPFILEHEADER und BITMAPINFOHEADER (unkomprimiert, 24 Bit)
+        f.write(struct.pack("<2sIHHI", b"BM", 54 + height * row_bytes, 0, 0, 54))
+        f.write(struct.pack("<IiiHHIIiiII", 40, BITMAP_WIDTH, height, 1, 24, 0, height * row_bytes, 2835, 2835, 0, 0))
+        for y in range(height):
+            row = bytearray(patterns[y // 16 % len(patterns)])
+            spot = (y * 97) % (row_bytes - 96)
+            row[spot:spot + 96] = os.urandom(96)
+            f.write(row)
+
+
+## Fragt die Metriken des Netzwerkprozesses ab und liefert die bisher gesendeten Bytes.
+def bytes_sent(peer):
+    """
+    @param peer: Peer aus start_peer
+    @return: Zähler bytes_sent_total des Netzwerkprozesses
+    """
+    drain(peer)
+    peer["net_queue"].put((CMD_STATS,))
+    _, _, meta = wait_event(peer, lambda kind, text, meta: kind == EVENT_METRICS and meta.get("process") == "network")
+    return meta["metrics"]["counters"].get(("bytes_sent_total", ()), 0)
+
+
+## Misst die Übertragungsrate von Bildern verschiedener Größe und verschiedenen Inhalts.
+def bench_images(a, b, sizes_mb, workdir, contents=("random",)):
+    """
+    @param a: Sendender Peer
+    @param b: Empfangender Peer
+    @param sizes_mb: Dateigrößen in MiB
+    @param workdir: Arbeitsverzeichnis für die Testdateien
+    @param contents: Dateiinhalte ("random" und/oder "bitmap")
+    @return: Liste von Ergebnis-dicts (eines pro Inhalt und Dateigröße)
+    """
+    writers = {"random": write_random_file, "bitmap": write_bitmap_file}
+    results = []
+    for content in contents:
+        for size_mb in sizes_mb:
+            filename = f"bench_{content}_{size_mb}mb.{'bmp' if content == 'bitmap' else 'bin'}"
+            path = os.path.join(workdir, filename)
+            writers[content](path, int(size_mb * 1024 * 1024))
+            size = os.path.getsize(path)
+            sent_before = bytes_sent(a)
+            start = time.perf_counter()
+            a["net_queue"].put((CMD_IMG_SEND, b["name"], filename, path))
+            wait_event(b, lambda kind, text, meta: kind == EVENT_IMAGE and meta.get("filename") == filename)
+            elapsed = time.perf_counter() - start
+            wire = bytes_sent(a) - sent_before
+            results.append({"content": content, "size_bytes": size, "seconds": elapsed,
+                            "mb_per_s": size / elapsed / 1e6, "wire_bytes": wire, "wire_ratio": wire / size})
+            os.remove(path)
+    return results
+
+
+## Liest Speicherverbrauch und CPU-Zeit eines Prozesses aus /proc.
+def process_stats(pid):
+    """
+    @param pid: Prozess-ID
+    @return: dict mit rss_kb, peak_rss_kb und cpu_s (None, wenn /proc nicht verfügbar ist)
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return {
+        "rss_kb": int(status["VmRSS"].split()[0]),
+        "peak_rss_kb": int(status["VmHWM"].split()[0]),
+        # utime und stime sind Feld 14 und 15 von /proc/<pid>/stat (hier ab Feld 3 gezählt)
+        "cpu_s": (int(fields[11]) + int(fields[12])) / ticks,
+    }
+
+
+## Sammelt die Ressourcenwerte aller Prozesse aller Peers.
+def collect_process_stats(peers):
+    """
+    @param peers: Liste der Peers
+    @return: Liste von dicts (Peer, Prozessart, Werte)
+    """
+    return [
+        {"peer": p["name"], "process": kind, **(process_stats(proc.pid) or {})}
+        for p in peers for kind, proc in p["processes"].items()
+    ]
+
+
+## Führt alle Benchmarks aus und liefert die Ergebnisse.
+def run_benchmarks(peer_count, messages, samples, sizes_mb, workdir, contents=("random",), startup_runs=3):
+    """
+    @param peer_count: Anzahl der Peers (mindestens 2)
+    @param messages: Anzahl der Nachrichten im Durchsatztest
+    @param samples: Anzahl der Latenzmessungen
+    @param sizes_mb: Bildgrößen in MiB
+    @param workdir: Arbeitsverzeichnis
+    @param contents: Inhalte der Testbilder ("random", "bitmap")
+    @param startup_runs: Anzahl der Starts im Startbenchmark (0 überspringt ihn)
+    @return: Ergebnisse (dict)
+    """
+    # Eigener UDP-Port, damit der gemessene Start nicht auf die Benchmark-Peers trifft.
+    startup = None
+    if startup_runs:
+        startup = bench_startup(write_config(workdir, 0, free_port(socket.SOCK_DGRAM)), startup_runs)
+    udp_port = free_port(socket.SOCK_DGRAM)
+    config_paths = [write_config(workdir, i + 1, udp_port) for i in range(peer_count)]
+    peers = []
+    try:
+        peers, discovery = bench_discovery(config_paths)
+        a, b = peers[0], peers[1]
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "startup": startup,
+            "discovery": discovery,
+            "latency": bench_latency(a, b, samples),
+            "throughput": bench_throughput(a, b, messages),
+            "images": bench_images(a, b, sizes_mb, workdir, contents),
+            "processes": collect_process_stats(peers),
+        }
+    finally:
+        for p in peers:
+            stop_peer(p)
+
+
+## Einstiegspunkt: Liest die Argumente, führt die Benchmarks aus und schreibt das JSON.
+def main():
+    """
+    @return: None
+    """
+    parser = argparse.ArgumentParser(description="Lokale Benchmarks für Plauderkiste")
+    parser.add_argument("--peers", type=int, default=8, help="Anzahl der Peers (mindestens 2)")
+    parser.add_argument("--messages", type=int, default=2000, help="Nachrichten im Durchsatztest")
+    parser.add_argument("--samples", type=int, default=200, help="Latenzmessungen")
+    parser.add_argument("--sizes", default="1,16,64", help="Bildgrößen in MiB, kommagetrennt")
+    parser.add_argument("--content", default="random,bitmap",
+                        help="Inhalt der Testbilder, kommagetrennt: random (wie JPEG/PNG), bitmap (BMP)")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Starts von start.py im Startbenchmark (0: aus)")
+    parser.add_argument("--out", default="benchmark.json", help="Ausgabedatei (JSON)")
+    parser.add_argument("--keep", action="store_true", help="Arbeitsverzeichnis nicht löschen")
+    args = parser.parse_args()
+    if args.peers < 2:
+        parser.error("--peers muss mindestens 2 sein")
+    contents = [c for c in args.content.split(",") if c]
+    if not contents or not set(contents) <= {"random", "bitmap"}:
+        parser.error("--content erlaubt nur random und bitmap")
+
+    multiprocessing.set_start_method("spawn")
+    workdir = tempfile.mkdtemp(prefix="plauderkiste_bench_")
+    try:
+        results = run_benchmarks(args.peers, args.messages, args.samples,
+                                 [float(s) for s in args.sizes.split(",") if s], workdir, contents,
+                                 args.startup_runs)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    d, lat, thr = results["discovery"], results["latency"]["rtt_ms"], results["throughput"]
+    if results["startup"]:
+        st = results["startup"]
+        print(f"Start: Prompt nach {st['time_to_prompt_s']:.3f} s (Ziel {st['target_s']:.1f} s "
+              f"{'erreicht' if st['target_met'] else 'verfehlt'}), Dienste bereit nach {st['services_ready_s']:.3f} s")
+    print(f"Discovery ({d['peers']} Peers): Start {d['startup_s']:.3f} s, Beitritt {d['join_s']:.3f} s")
+    print(f"Latenz (RTT): p50 {lat['p50']:.2f} ms, p90 {lat['p90']:.2f} ms, p99 {lat['p99']:.2f} ms")
+    print(f"Durchsatz: {thr['messages_per_s']:.0f} Nachrichten/s")
+    for img in results["images"]:
+        print(f"Bild {img['content']} {img['size_bytes'] / 1024 / 1024:.3g} MiB: {img['mb_per_s']:.1f} MB/s, "
+              f"{img['wire_ratio'] * 100:.0f} % der Bytes auf der Leitung")
+    print(f"Ergebnisse gespeichert in {args.out}")
+
+
+## Standard-Einstiegspunkt für das Skript.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+@file blob_store.py
+@brief Inhaltsadressierter Speicher für empfangene Bilder im Peer-to-Peer-Chat "Plauderkiste".
+
+Jede vollständig empfangene Datei wird zusätzlich unter ihrer Transfer-ID (aus den Prüfsummen
+des Manifests, siehe file_transfer.py) im Ordner ".blobs" des Bildordners abgelegt. Die ID hängt
+nur vom Inhalt ab; dieselbe Datei hat also bei jedem Absender und unter jedem Namen dieselbe ID.
+
+Bietet ein Peer später eine Datei an, die schon im Speicher liegt, antwortet der Empfänger auf
+das OFFER sofort mit einem leeren NEED und legt die Datei aus dem Speicher unter dem neuen Namen
+an. Es werden keine Blöcke übertragen.
+
+Speicher und Bildordner teilen sich die Daten über Hardlinks, eine Datei belegt den Platz also
+nur einmal. Unterstützt das Dateisystem keine Hardlinks, wird die Datei ganz normal übertragen.
+Ein Hardlink ist dieselbe Datei: Wer ein empfangenes Bild direkt überschreibt (statt es neu zu
+speichern), ändert auch den Eintrag. has_blob prüft deshalb nur vorab die Größe; vor dem Anlegen
+aus dem Speicher prüft der Netzwerkprozess den Inhalt gegen die Blockprüfsummen des Manifests
+(file_transfer.verify_file, im Hintergrund-Thread). Ein veränderter Eintrag wird verworfen
+(remove_blob) und die Datei normal übertragen.
+
+Die Gesamtgröße ist begrenzt ("blobcache" in MiB in der Konfiguration, 0 schaltet den Speicher
+ab). Wird sie überschritten, fallen die am längsten nicht benutzten Einträge heraus (LRU). Die
+Reihenfolge steht in den Zugriffszeiten der Dateien (die Änderungszeit der Bilder bleibt
+unberührt) und bleibt so über einen Neustart erhalten.
+Gelöscht wird nur der Eintrag im Speicher; Bilder im Bildordner bleiben erhalten.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import collections
+import os
+import string
+import time
+import uuid
+
+## Name des Speicherordners innerhalb des Bildordners (gleiches Dateisystem für Hardlinks).
+STORE_FOLDER = ".blobs"
+## Standardgrenze für die Gesamtgröße des Speichers in MiB.
+DEFAULT_LIMIT_MB = 512
+
+
+## Öffnet den Speicher im Bildordner und liest die vorhandenen Einträge ein.
+def open_store(image_folder, limit_mb=DEFAULT_LIMIT_MB):
+    """
+    @param image_folder: Bildordner
+    @param limit_mb: Höchstgröße in MiB (0 schaltet den Speicher ab)
+    @return: Speicher (dict) mit path, limit, blobs (OrderedDict ID -> Größe, älteste zuerst) und total
+    """
+    store = {
+        "path": os.path.join(image_folder, STORE_FOLDER),
+        "limit": int(limit_mb * 1024 * 1024),
+        "blobs": collections.OrderedDict(),
+        "total": 0,
+    }
+    if store["limit"] <= 0:
+        return store
+    os.makedirs(store["path"], exist_ok=True)
+    entries = []
+    with os.scandir(store["path"]) as it:
+        for entry in it:
+            if entry.is_file() and valid_blob_id(entry.name):
+                st = entry.stat()
+                entries.append((st.st_atime, entry.name, st.st_size))
+    for _, blob_id, size in sorted(entries):
+        store["blobs"][blob_id] = size
+        store["total"] += size
+    evict(store)
+    return store
+
+
+## Prüft, ob eine ID als Dateiname im Speicher taugt.
+def valid_blob_id(blob_id):
+    """
+    @param blob_id: Transfer-ID
+    @return: True für eine Hex-Zeichenkette (keine Pfadbestandteile)
+    """
+    return bool(blob_id) and all(c in string.hexdigits for c in blob_id)
+
+
+## Pfad eines Eintrags im Speicher.
+def blob_path(store, blob_id):
+    """
+    @param store: Speicher aus open_store
+    @param blob_id: Transfer-ID
+    @return: Pfad der Datei
+    """
+    return os.path.join(store["path"], blob_id)
+
+
+## Prüft, ob eine Datei im Speicher liegt.
+def has_blob(store, blob_id, size):
+    """
+    @param store: Speicher aus open_store
+    @param blob_id: Transfer-ID
+    @param size: Erwartete Größe laut Manifest
+    @return: True, wenn der Eintrag vorhanden ist und die Größe (noch) stimmt (den Inhalt
+             prüft erst file_transfer.verify_file)
+    """
+    if blob_id not in store["blobs"]:
+        return False
+    try:
+        return os.path.getsize(blob_path(store, blob_id)) == size
+    except OSError:
+        return False
+
+
+## Nimmt eine vollständig empfangene Datei in den Speicher auf (als Hardlink).
+def add_blob(store, blob_id, path):
+    """
+    Die Datei selbst bleibt unverändert liegen. Schlägt der Hardlink fehl (z.B. FAT-Dateisystem),
+    wird sie nicht gespeichert.
+
+    @param store: Speicher aus open_store
+    @param blob_id: Transfer-ID
+    @param path: Pfad der Datei (im Bildordner)
+    @return: True, wenn die Datei aufgenommen wurde
+    """
+    if store["limit"] <= 0 or not valid_blob_id(blob_id) or blob_id in store["blobs"]:
+        return False
+    size = os.path.getsize(path)
+    if size > store["limit"]:
+        return False
+    try:
+        os.link(path, blob_path(store, blob_id))
+    except FileExistsError:
+        pass
+    except OSError:
+        return False
+    store["blobs"][blob_id] = size
+    store["total"] += size
+    evict(store)
+    return True
+
+
+## Legt eine Datei aus dem Speicher unter einem Zielpfad an und markiert sie als benutzt.
+def link_blob(store, blob_id, dest):
+    """
+    Der Hardlink entsteht zuerst unter einem temporären Namen und ersetzt dann atomar eine
+    eventuell vorhandene Datei gleichen Namens.
+
+    @param store: Speicher aus open_store
+    @param blob_id: Transfer-ID
+    @param dest: Zielpfad im Bildordner
+    @return: None
+    @throws OSError: wenn der Hardlink nicht angelegt werden kann
+    """
+    src = blob_path(store, blob_id)
+    temp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.{uuid.uuid4().hex[:8]}.link")
+    os.link(src, temp)
+    try:
+        os.replace(temp, dest)
+    except OSError:
+        os.remove(temp)
+        raise
+    touch_blob(store, blob_id)
+
+
+## Markiert einen Eintrag als zuletzt benutzt.
+def touch_blob(store, blob_id):
+    """
+    @param store: Speicher aus open_store
+    @param blob_id: Transfer-ID
+    @return: None
+    """
+    store["blobs"].move_to_end(blob_id)
+    path = blob_path(store, blob_id)
+    try:
+        os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+    except OSError:
+        pass
+
+
+## Entfernt einen Eintrag aus dem Speicher (Bilder im Bildordner bleiben erhalten).
+def remove_blob(store, blob_id):
+    """
+    @param store: Speicher aus open_store
+    @param blob_id: Transfer-ID
+    @return: None
+    """
+    size = store["blobs"].pop(blob_id, None)
+    if size is None:
+        return
+    store["total"] -= size
+    try:
+        os.remove(blob_path(store, blob_id))
+    except OSError:
+        pass
+
+
+## Entfernt die am längsten nicht benutzten Einträge, bis die Größengrenze eingehalten ist.
+def evict(store):
+    """
+    @param store: Speicher aus open_store
+    @return: Anzahl entfernter Einträge
+    """
+    removed = 0
+    while store["total"] > store["limit"] and store["blobs"]:
+        remove_blob(store, next(iter(store["blobs"])))
+        removed += 1
+    return removed
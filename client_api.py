@@ -0,0 +1,400 @@
+"""
+@file client_api.py
+@brief Einbettbare Client-Schnittstelle ohne Benutzeroberfläche für den Peer-to-Peer-Chat "Plauderkiste".
+
+Für Bots und Anbindungen (z.B. Alarmmeldungen), die Plauderkiste aus eigenem Python-Code steuern
+wollen, statt Tastatureingaben für das CLI zu simulieren. Der Client startet wie start.py einen
+Discovery- und einen Netzwerkprozess mit eigener Peer-Tabelle, braucht aber weder colorama noch
+ein Terminal. Die Schnittstelle ist für asyncio geschrieben:
+
+    async with client_session("bot.toml") as client:
+        on_message(client, lambda msg: print(msg["sender"], msg["text"]))
+        await send(client, "Hulk", "Server 3 antwortet nicht")
+        results = await send_batch(client, [("Hulk", "A"), ("Thor", "B")])
+        async for msg in messages(client):
+            ...
+
+Jedes Sendekommando trägt eine fortlaufende Referenz (siehe protocol.py); der Netzwerkprozess
+gibt sie im Ergebnisereignis zurück. So wartet send() genau auf die Zustellung seiner eigenen
+Nachricht und nicht auf eine feste Zeit. Nachrichten werden nicht einzeln abgewartet, bevor die
+nächste abgeschickt wird: Viele gleichzeitige send()-Aufrufe landen direkt hintereinander in der
+Pool-Verbindung zum Empfänger. Höchstens SUBMIT_WINDOW Sendekommandos sind gleichzeitig
+unbestätigt, weniger als in die Netzwerk-Queue passen. Weitere Aufrufe warten in der
+asyncio-Schleife, statt den Thread der Schleife an der vollen Queue zu blockieren.
+
+Ein Hintergrund-Thread liest die UI-Queue blockweise und übergibt jeden Block mit einem einzigen
+Aufruf an die asyncio-Schleife. Empfangene Nachrichten gehen an alle Callbacks (on_message) und in
+einen begrenzten Eingang für messages(); ist er voll, fällt die älteste Nachricht heraus.
+Der Client schreibt keinen Chatverlauf.
+
+Wie bei jedem Programm mit der Startmethode "spawn" führen die Kindprozesse das Hauptmodul des
+einbettenden Programms erneut aus; der Start muss daher unter if __name__ == "__main__" stehen.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import asyncio
+import contextlib
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import toml
+from flow_control import UI_QUEUE_LIMIT, COMMAND_QUEUE_LIMIT
+from events import EVENT_SENT, EVENT_MESSAGE, EVENT_IMAGE, EVENT_METRICS
+from peer_table import create_peer_table, close_peer_table, peer_snapshot, peer_states
+from peer_table import PEER_SUSPECT, PEER_DEAD
+from protocol import CMD_MSG, CMD_MSG_MULTI, CMD_IMG_SEND, CMD_WHO, CMD_LEAVE
+from start import run_service, stop_services
+
+## Maximale Wartezeit in Sekunden, bis Discovery und Netzwerk nach dem Start bereit sind.
+READY_TIMEOUT = 10.0
+## Sekunden, die peers(refresh=True) nach WHO auf Antworten wartet.
+WHO_SETTLE = 1.0
+## Höchstzahl empfangener Nachrichten, die auf messages() warten.
+INBOX_LIMIT = 10000
+## Höchstzahl unbestätigter Nachrichten eines send_batch (unter network_comm.POOL_QUEUE_LIMIT).
+BATCH_WINDOW = 500
+## Höchstzahl unbestätigter Sendekommandos eines Clients (unter flow_control.COMMAND_QUEUE_LIMIT).
+SUBMIT_WINDOW = COMMAND_QUEUE_LIMIT // 2
+## Maximale Anzahl an Ereignissen, die der Lese-Thread in einem Block übergibt.
+EVENT_BATCH = 256
+## Zustandsnamen der Peers für peers().
+STATE_NAMES = {PEER_SUSPECT: "suspect", PEER_DEAD: "dead"}
+
+
+## Startet einen Client ohne Benutzeroberfläche.
+async def open_client(config, ready_timeout=READY_TIMEOUT):
+    """
+    Startet die Prozesse mit der Startmethode "spawn" (wie start.py), ohne die globale
+    Startmethode des einbettenden Programms zu verändern, und wartet, bis beide Dienste bereit sind.
+
+    @param config: Konfiguration (dict wie config1.toml) oder Pfad einer TOML-Datei
+    @param ready_timeout: Maximale Wartezeit auf den Start der Dienste in Sekunden
+    @return: Client (dict) für die übrigen Funktionen
+    @throws TimeoutError: wenn die Dienste nicht rechtzeitig bereit sind (der Client wird dann geschlossen)
+    """
+    if isinstance(config, (str, os.PathLike)):
+        config_path = config
+        config = toml.load(config_path)
+        config["config_path"] = config_path
+    mp = multiprocessing.get_context("spawn")
+    loop = asyncio.get_running_loop()
+    client = {
+        "config": config,
+        "handle": config["handle"],
+        "loop": loop,
+        "peers": create_peer_table(),
+        "ui_queue": mp.Queue(UI_QUEUE_LIMIT),
+        "disc_queue": mp.Queue(COMMAND_QUEUE_LIMIT),
+        "net_queue": mp.Queue(COMMAND_QUEUE_LIMIT),
+        "refs": itertools.count(1),
+        "waiting": {},        # Referenz -> Future des Sendekommandos
+        "window": asyncio.Semaphore(SUBMIT_WINDOW),  # Freie Plätze für unbestätigte Sendekommandos
+        "callbacks": [],
+        "inbox": asyncio.Queue(),
+        "dropped": 0,         # Wegen vollem Eingang verworfene Nachrichten
+        "ready": set(),
+        "ready_future": loop.create_future(),
+        "closed": False,
+    }
+    table = client["peers"]["name"]
+    client["processes"] = [
+        (mp.Process(target=run_service, args=("discovery_comm", "discovery_service", None, None,
+                                              client["ui_queue"], client["disc_queue"], config, table),
+                    daemon=True), client["disc_queue"]),
+        (mp.Process(target=run_service, args=("network_comm", "network_service", None, None,
+                                              client["ui_queue"], client["net_queue"], config, table),
+                    daemon=True), client["net_queue"]),
+    ]
+    for proc, _ in client["processes"]:
+        proc.start()
+    client["reader"] = threading.Thread(target=read_events, args=(client,), daemon=True)
+    client["reader"].start()
+    try:
+        await asyncio.wait_for(asyncio.shield(client["ready_future"]), ready_timeout)
+    except asyncio.TimeoutError:
+        await close_client(client, leave=False)
+        raise TimeoutError("Discovery- und Netzwerkprozess sind nicht rechtzeitig gestartet") from None
+    return client
+
+
+## Startet einen Client für die Dauer eines async-with-Blocks.
+@contextlib.asynccontextmanager
+async def client_session(config, ready_timeout=READY_TIMEOUT):
+    """
+    @param config: Konfiguration (dict) oder Pfad einer TOML-Datei
+    @param ready_timeout: Maximale Wartezeit auf den Start der Dienste in Sekunden
+    @return: Asynchroner Kontextmanager, der den Client liefert und am Ende close_client aufruft
+    """
+    client = await open_client(config, ready_timeout)
+    try:
+        yield client
+    finally:
+        await close_client(client)
+
+
+## Beendet den Client: LEAVE senden, Prozesse stoppen, offene Aufrufe abbrechen.
+async def close_client(client, leave=True):
+    """
+    @param client: Client aus open_client
+    @param leave: True, um die anderen Peers vorher mit LEAVE zu benachrichtigen
+    @return: None
+    """
+    if client["closed"]:
+        return
+    client["closed"] = True
+    if leave:
+        client["disc_queue"].put((CMD_LEAVE, client["handle"]))
+    # stop_services wartet blockierend auf die Prozesse und läuft daher in einem Thread
+    await asyncio.to_thread(stop_services, client["processes"])
+    client["ui_queue"].put(None)
+    await asyncio.to_thread(client["reader"].join)
+    for future in client["waiting"].values():
+        if not future.done():
+            future.set_exception(ConnectionError("Client wurde geschlossen"))
+    client["waiting"].clear()
+    client["inbox"].put_nowait(None)
+    close_peer_table(client["peers"], unlink=True)
+
+
+## Liest die UI-Queue im Hintergrund und übergibt die Ereignisse blockweise an die asyncio-Schleife.
+def read_events(client):
+    """
+    Ein None in der Queue beendet den Thread (close_client).
+
+    @param client: Client aus open_client
+    @return: None
+    """
+    ui_queue = client["ui_queue"]
+    stopping = False
+    while not stopping:
+        batch = [ui_queue.get()]
+        while len(batch) < EVENT_BATCH:
+            try:
+                batch.append(ui_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            stopping = True
+            batch = batch[:batch.index(None)]
+        try:
+            client["loop"].call_soon_threadsafe(dispatch_events, client, batch)
+        except RuntimeError:
+            # Die asyncio-Schleife ist bereits beendet
+            return
+
+
+## Verarbeitet einen Block von Ereignissen in der asyncio-Schleife.
+def dispatch_events(client, batch):
+    """
+    @param client: Client aus open_client
+    @param batch: Liste von (kind, text, meta)
+    @return: None
+    """
+    for kind, text, meta in batch:
+        if kind == EVENT_METRICS:
+            continue
+        if "ready" in meta:
+            client["ready"].add(meta["ready"])
+            if client["ready"] >= {"discovery", "network"} and not client["ready_future"].done():
+                client["ready_future"].set_result(True)
+        for ref in meta.get("refs", [meta.get("ref")]):
+            future = client["waiting"].pop(ref, None)
+            if future is not None and not future.done():
+                settle(future, kind, text, meta)
+        message = inbound_message(client, kind, meta)
+        if message is not None:
+            deliver(client, message)
+
+
+## Setzt das Ergebnis eines Sendeaufrufs aus seinem Ergebnisereignis.
+def settle(future, kind, text, meta):
+    """
+    @param future: Future des Sendeaufrufs
+    @param kind: Art des Ereignisses
+    @param text: Anzeigetext
+    @param meta: Zusatzdaten des Ereignisses
+    @return: None
+    """
+    if "label" in meta:
+        # Gruppenversand: Der Zustellbericht ist das Ergebnis, auch bei einzelnen Fehlern
+        future.set_result({"total": meta["total"], "delivered": meta["delivered"], "queued": meta.get("queued", 0),
+                           "failed": meta["failed"]})
+    elif kind in (EVENT_SENT, EVENT_IMAGE):
+        future.set_result(None)
+    else:
+        future.set_exception(ConnectionError(meta.get("error", text)))
+
+
+## Wandelt ein Empfangsereignis in eine Nachricht für Callbacks und messages() um.
+def inbound_message(client, kind, meta):
+    """
+    @param client: Client aus open_client
+    @param kind: Art des Ereignisses
+    @param meta: Zusatzdaten des Ereignisses
+    @return: dict mit kind ("text" oder "image"), sender und text bzw. filename, path, size – oder None
+    """
+    if kind == EVENT_MESSAGE:
+        return {"kind": "text", "sender": meta.get("sender", ""), "text": meta["body"]}
+    if kind == EVENT_IMAGE and "filename" in meta and "sender" in meta:
+        folder = client["config"].get("imagepath", "./images")
+        return {"kind": "image", "sender": meta["sender"], "filename": meta["filename"],
+                "path": os.path.join(folder, meta["filename"]), "size": meta["size"]}
+    return None
+
+
+## Gibt eine empfangene Nachricht an alle Callbacks und in den Eingang.
+def deliver(client, message):
+    """
+    Coroutine-Funktionen werden als Task gestartet. Eine Ausnahme in einem Callback beendet
+    den Client nicht.
+
+    @param client: Client aus open_client
+    @param message: Nachricht aus inbound_message
+    @return: None
+    """
+    for callback in client["callbacks"]:
+        try:
+            result = callback(message)
+            if asyncio.iscoroutine(result):
+                client["loop"].create_task(result)
+        except Exception as e:
+            print(f"[Fehler] Callback für eingehende Nachricht fehlgeschlagen: {e}")
+    inbox = client["inbox"]
+    if inbox.qsize() >= INBOX_LIMIT:
+        inbox.get_nowait()
+        client["dropped"] += 1
+    inbox.put_nowait(message)
+
+
+## Legt ein Sendekommando mit neuer Referenz in die Netzwerk-Queue und wartet auf das Ergebnis.
+async def submit(client, cmd, *args):
+    """
+    Wartet zuerst auf einen freien Platz im Fenster (SUBMIT_WINDOW); das Ergebnis gibt ihn wieder
+    frei. Damit ist in der Netzwerk-Queue immer Platz, und put_nowait blockiert die Schleife nie.
+
+    @param client: Client aus open_client
+    @param cmd: CMD_MSG, CMD_MSG_MULTI oder CMD_IMG_SEND
+    @param args: Argumente des Kommandos (ohne Referenz)
+    @return: Ergebnis des Kommandos (siehe settle)
+    @throws ConnectionError: wenn der Client geschlossen ist oder das Kommando scheitert
+    """
+    if client["closed"]:
+        raise ConnectionError("Client wurde geschlossen")
+    window = client["window"]
+    await window.acquire()
+    if client["closed"]:
+        window.release()
+        raise ConnectionError("Client wurde geschlossen")
+    ref = next(client["refs"])
+    future = client["loop"].create_future()
+    future.add_done_callback(lambda _: window.release())
+    client["waiting"][ref] = future
+    client["net_queue"].put_nowait((cmd, *args, ref))
+    return await future
+
+
+## Sendet eine Textnachricht und wartet auf die Zustellung.
+async def send(client, recipient, text):
+    """
+    Ist der Empfänger nicht erreichbar, kehrt der Aufruf zurück, sobald die Nachricht im Ausgang
+    vorgemerkt ist (siehe outbox.py); zugestellt wird sie, wenn der Peer wieder online ist.
+
+    @param client: Client aus open_client
+    @param recipient: Nutzername des Empfängers
+    @param text: Nachrichtentext
+    @return: None
+    @throws ConnectionError: wenn die Nachricht nicht zugestellt wurde (Grund als Text)
+    """
+    await submit(client, CMD_MSG, recipient, text)
+
+
+## Sendet viele Textnachrichten auf einmal und wartet auf alle Ergebnisse.
+async def send_batch(client, messages):
+    """
+    Es sind höchstens BATCH_WINDOW Nachrichten gleichzeitig unterwegs; jede Bestätigung gibt
+    den Platz für die nächste frei. So läuft auch ein großer Stapel nicht in die Begrenzung der
+    offenen Nachrichten pro Empfänger. Nachrichten an denselben Empfänger gehen in Reihenfolge
+    über dieselbe Verbindung.
+
+    @param client: Client aus open_client
+    @param messages: Iterierbare (Empfänger, Text)-Paare
+    @return: Liste mit None (zugestellt) oder der Ausnahme je Nachricht, in Eingabereihenfolge
+    """
+    window = asyncio.Semaphore(BATCH_WINDOW)
+
+    async def send_one(recipient, text):
+        async with window:
+            await submit(client, CMD_MSG, recipient, text)
+
+    return await asyncio.gather(*(send_one(r, t) for r, t in messages), return_exceptions=True)
+
+
+## Sendet dieselbe Textnachricht an mehrere Empfänger (wie "msg all" bzw. "msg @gruppe").
+async def send_group(client, recipients, text, label="bot"):
+    """
+    @param client: Client aus open_client
+    @param recipients: Liste der Nutzernamen
+    @param text: Nachrichtentext
+    @param label: Bezeichnung für den Zustellbericht
+    @return: Zustellbericht (dict mit total, delivered, queued (im Ausgang vorgemerkt) und failed: Name -> Grund)
+    """
+    return await submit(client, CMD_MSG_MULTI, label, list(recipients), text)
+
+
+## Sendet ein Bild und wartet, bis die Übertragung abgeschlossen ist.
+async def send_image(client, recipient, path, filename=None):
+    """
+    @param client: Client aus open_client
+    @param recipient: Nutzername des Empfängers
+    @param path: Pfad der Datei
+    @param filename: Dateiname beim Empfänger (Standard: Name der Datei)
+    @return: None
+    @throws ConnectionError: wenn die Übertragung fehlgeschlagen ist
+    """
+    await submit(client, CMD_IMG_SEND, recipient, filename or os.path.basename(path), path)
+
+
+## Liefert die bekannten Peers (ohne den eigenen Nutzer).
+async def peers(client, refresh=False):
+    """
+    @param client: Client aus open_client
+    @param refresh: True, um vorher eine WHO-Anfrage zu senden und WHO_SETTLE Sekunden zu warten
+    @return: dict Name -> {"ip", "port", "state"} mit state "alive", "suspect" oder "dead"
+    """
+    if refresh:
+        client["disc_queue"].put((CMD_WHO,))
+        await asyncio.sleep(WHO_SETTLE)
+    states = peer_states(client["peers"])
+    return {
+        name: {"ip": ip, "port": port, "state": STATE_NAMES.get(states.get(name), "alive")}
+        for name, (ip, port) in peer_snapshot(client["peers"]).items() if name != client["handle"]
+    }
+
+
+## Registriert einen Callback für eingehende Nachrichten und Bilder.
+def on_message(client, callback):
+    """
+    @param client: Client aus open_client
+    @param callback: Funktion oder Coroutine-Funktion mit der Nachricht (dict, siehe inbound_message)
+    @return: None
+    """
+    client["callbacks"].append(callback)
+
+
+## Liefert eingehende Nachrichten und Bilder als asynchronen Iterator.
+async def messages(client):
+    """
+    Endet, wenn der Client geschlossen wird.
+
+    @param client: Client aus open_client
+    @return: Asynchroner Generator über Nachrichten (dict, siehe inbound_message)
+    """
+    while True:
+        message = await client["inbox"].get()
+        if message is None:
+            return
+        yield message
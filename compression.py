@@ -0,0 +1,143 @@
+"""
+@file compression.py
+@brief Komprimierung von Nachrichten und Dateiblöcken für den Peer-to-Peer-Chat "Plauderkiste".
+
+Peers, die die Fähigkeit CAP_COMPRESS angekündigt haben (siehe protocol.py), erhalten
+Textnachrichten und Dateiblöcke mit zlib komprimiert. zlib ist schnell genug, um auch auf
+langsamen Rechnern mit der Leitung mitzuhalten; lzma würde kaum kleiner packen, aber ein
+Vielfaches an CPU-Zeit kosten.
+
+ - Nachrichten: Jede Pool-Verbindung hat einen eigenen zlib-Strom. Jede Nachricht wird mit
+   Z_SYNC_FLUSH abgeschlossen und ist damit sofort lesbar, kann aber auf Wörter früherer
+   Nachrichten derselben Verbindung verweisen. Sehr kurze Nachrichten bleiben unkomprimiert.
+ - Dateien: Jeder Block wird einzeln komprimiert, sodass Fortsetzen, NACK und parallele
+   Verbindungen weiter blockweise funktionieren und nie mehr als ein Block im Speicher liegt.
+   Bringt die Komprimierung eines Blocks zu wenig, wird er unverändert gesendet.
+
+Ob sich eine Datei überhaupt lohnt, entscheidet vorab eine Entropie-Stichprobe (probe_file).
+Die Entropie wird aus der Probekomprimierung einiger kleiner Stichproben geschätzt; eine reine
+Bytehäufigkeit würde z.B. Farbverläufe, in denen jeder Bytewert gleich oft vorkommt, für
+unkomprimierbar halten. Bereits komprimierte Formate wie JPEG, PNG oder ZIP haben fast 8 Bit
+Entropie pro Byte und werden ohne Komprimierungsversuch übertragen; unkomprimierte Bilder (BMP,
+TIFF, Screenshots) liegen deutlich darunter.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import os
+import zlib
+
+## Kompressionsstufe für Nachrichten (kurze Texte, Stufe kostet kaum Zeit).
+MESSAGE_LEVEL = 6
+## Kompressionsstufe für Dateiblöcke (schnell, fast die volle Ersparnis bei Bitmaps).
+BLOCK_LEVEL = 1
+## Nachrichten unter dieser Länge (Bytes) werden nicht komprimiert.
+COMPRESS_MIN_BYTES = 64
+## Ein Block wird nur komprimiert gesendet, wenn er höchstens diesen Anteil der Originalgröße hat.
+COMPRESS_MAX_RATIO = 0.9
+## Anzahl der über die Datei verteilten Stichproben der Entropie-Schätzung.
+PROBE_SAMPLES = 4
+## Größe einer Stichprobe in Bytes.
+PROBE_BYTES = 16 * 1024
+## Ab dieser geschätzten Entropie (Bit pro Byte) gilt eine Datei als bereits komprimiert.
+ENTROPY_LIMIT = 8 * COMPRESS_MAX_RATIO
+
+
+## Schätzt die Entropie von Daten in Bit pro Byte durch Probekomprimierung.
+def estimate_entropy(data):
+    """
+    @param data: Stichprobe (bytes)
+    @return: Geschätzte Entropie (0 bis etwas über 8)
+    """
+    if not data:
+        return 0.0
+    return 8 * len(zlib.compress(data, BLOCK_LEVEL)) / len(data)
+
+
+## Prüft mit einer Entropie-Stichprobe, ob sich das Komprimieren einer Datei lohnt.
+def probe_file(path):
+    """
+    Liest PROBE_SAMPLES gleichmäßig verteilte Stichproben statt der ganzen Datei.
+
+    @param path: Pfad der Datei
+    @return: True, wenn die Datei voraussichtlich komprimierbar ist
+    @throws OSError: wenn die Datei nicht gelesen werden kann
+    """
+    size = os.path.getsize(path)
+    step = max(size - PROBE_BYTES, 0) // max(PROBE_SAMPLES - 1, 1)
+    sample = bytearray()
+    with open(path, "rb") as f:
+        for i in range(PROBE_SAMPLES):
+            f.seek(i * step)
+            sample += f.read(PROBE_BYTES)
+    return estimate_entropy(bytes(sample)) < ENTROPY_LIMIT
+
+
+## Liest einen Dateiblock und komprimiert ihn, falls sich das lohnt.
+def compress_block(path, offset, length):
+    """
+    Öffnet die Datei selbst, damit die Funktion in einem Hintergrund-Thread laufen kann
+    (zlib gibt dabei den GIL frei).
+
+    @param path: Pfad der Datei
+    @param offset: Beginn des Blocks
+    @param length: Länge des Blocks
+    @return: (compressed, data) – True und die komprimierten Daten oder False und der Block unverändert
+    @throws OSError: wenn die Datei kürzer als angekündigt ist
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        block = f.read(length)
+    if len(block) != length:
+        raise OSError("Datei ist kürzer als angekündigt")
+    packed = zlib.compress(block, BLOCK_LEVEL)
+    if len(packed) <= length * COMPRESS_MAX_RATIO:
+        return True, packed
+    return False, block
+
+
+## Legt einen zlib-Strom für die Nachrichten einer Verbindung an.
+def new_deflater():
+    """
+    @return: zlib-Kompressionsobjekt
+    """
+    return zlib.compressobj(MESSAGE_LEVEL)
+
+
+## Komprimiert eine Nachricht im Strom der Verbindung.
+def deflate_message(deflater, data):
+    """
+    @param deflater: Objekt aus new_deflater
+    @param data: Nachricht (bytes)
+    @return: Komprimierte Daten, die der Empfänger sofort vollständig entpacken kann
+    """
+    return deflater.compress(data) + deflater.flush(zlib.Z_SYNC_FLUSH)
+
+
+## Legt einen Entpacker für eine Verbindung bzw. einen Block an.
+def new_inflater():
+    """
+    @return: zlib-Dekompressionsobjekt
+    """
+    return zlib.decompressobj()
+
+
+## Entpackt Daten und begrenzt dabei die Ausgabe.
+def inflate(inflater, data, limit):
+    """
+    Schützt vor "Zip-Bomben": Mehr als limit Bytes werden nie erzeugt.
+
+    @param inflater: Objekt aus new_inflater
+    @param data: Komprimierte Daten (bytes oder memoryview)
+    @param limit: Höchstzahl erlaubter Ausgabebytes
+    @return: Entpackte Daten
+    @throws ValueError: wenn die Daten beschädigt sind oder mehr als limit Bytes ergäben
+    """
+    try:
+        out = inflater.decompress(data, limit + 1)
+    except zlib.error as e:
+        raise ValueError(f"beschädigte Daten: {e}") from e
+    if len(out) > limit:
+        raise ValueError("entpackte Daten zu groß")
+    return out
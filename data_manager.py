@@ -5,6 +5,22 @@
 Dieses Modul übernimmt das Speichern und Nachladen von Chatverläufen sowie das Nachladen der
 Konfiguration zur Laufzeit. Alle Funktionen sind als Einzeloperationen ohne Klassen implementiert.
 
+Der Chatverlauf ist ein dauerhaftes, nur anhängendes Protokoll in einem eigenen Ordner
+(Konfiguration: historypath). Es besteht aus Segmenten:
+
+    000001.log   Eine Zeile pro Nachricht: Zeitstempel, Art, Peer und Text (tabulatorgetrennt)
+    000001.idx   Pro Nachricht ein Eintrag (Zeitstempel, Byte-Offset in der .log-Datei)
+
+Jede neue Nachricht wird sofort ans aktuelle Segment angehängt; wird es zu groß, beginnt ein
+neues Segment. Im Speicher bleiben nur die letzten HISTORY_TAIL Nachrichten. Ältere Seiten werden
+über den Index (per mmap und binärer Suche) gefunden und mit einem einzigen Lesezugriff geladen,
+statt den gesamten Verlauf einzulesen.
+
+Für die Suche ("history search") hat jedes Segment zusätzlich einen invertierten Index
+(000001.search, siehe search_index.py). Der Index des aktuellen Segments wird bei jeder neuen
+Nachricht erweitert; die Indizes älterer Segmente werden bei der ersten Suche geladen und
+fehlende Einträge dabei aus dem Log ergänzt.
+
 Das Datenmanagement sorgt dafür, dass Nutzer jederzeit ihren bisherigen Verlauf sichern und
 wiederherstellen können. Außerdem kann die Konfiguration (z.B. Nutzername oder Port) zur Laufzeit neu geladen werden.
 
@@ -12,34 +28,426 @@ wiederherstellen können. Außerdem kann die Konfiguration (z.B. Nutzername oder
 @date 2025
 """
 
+import collections
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
 import toml
+from search_index import new_index, index_record, parse_query, lookup, index_path, load_index, save_index
+
+## Maximale Größe eines Verlaufssegments, danach wird ein neues begonnen.
+SEGMENT_BYTES = 4 * 1024 * 1024
+## Anzahl der zuletzt hinzugefügten Nachrichten, die im Speicher gehalten werden.
+HISTORY_TAIL = 500
+## Indexeintrag: Zeitstempel (double) und Byte-Offset (uint64) einer Nachricht.
+INDEX_ENTRY = struct.Struct("!dQ")
+## Standardanzahl der Treffer einer Suche.
+SEARCH_LIMIT = 50
+
+## Öffnet (oder erstellt) den Chatverlauf in einem Ordner.
+def open_history(directory):
+    """
+    Öffnet das jüngste Segment zum Anhängen. Wurde das Programm beim letzten Mal mitten im
+    Schreiben beendet, werden fehlende Indexeinträge ergänzt und eine halbe letzte Zeile verworfen.
+
+    @param directory: Ordner des Verlaufs (wird bei Bedarf angelegt)
+    @return: history: Verlauf (dict) für add_message, read_history, search_history, save_history und close_history
+    """
+    os.makedirs(directory, exist_ok=True)
+    segments = sorted(int(os.path.basename(p)[:-4]) for p in glob.glob(os.path.join(directory, "*.log")))
+    history = {
+        "dir": directory,
+        "segments": segments or [1],
+        "tail": collections.deque(maxlen=HISTORY_TAIL),
+        "lock": threading.Lock(),
+        "last_ts": 0.0,
+        "search": {},
+    }
+    open_segment(history, history["segments"][-1])
+    history["tail"].extend(read_from_disk(history, HISTORY_TAIL))
+    return history
+
+
+## Pfad der Log- bzw. Indexdatei eines Segments.
+def segment_path(history, number, ext):
+    """
+    @param history: Verlauf (dict)
+    @param number: Segmentnummer
+    @param ext: "log" oder "idx"
+    @return: Dateipfad
+    """
+    return os.path.join(history["dir"], f"{number:06d}.{ext}")
+
+
+## Öffnet ein Segment zum Anhängen und repariert ggf. dessen Index.
+def open_segment(history, number):
+    """
+    Die Log-Zeile wird immer vor dem Indexeintrag geschrieben. Nach einem Absturz können daher
+    am Ende des Logs Zeilen ohne Indexeintrag stehen; sie werden nachindiziert, eine halb
+    geschriebene letzte Zeile wird abgeschnitten.
+
+    @param history: Verlauf (dict)
+    @param number: Segmentnummer
+    @return: None
+    """
+    log = open(segment_path(history, number, "log"), "a+b")
+    idx = open(segment_path(history, number, "idx"), "a+b")
+    idx_size = idx.seek(0, os.SEEK_END)
+    idx_size -= idx_size % INDEX_ENTRY.size
+    end = 0
+    if idx_size:
+        idx.seek(idx_size - INDEX_ENTRY.size)
+        last_ts, last = INDEX_ENTRY.unpack(idx.read(INDEX_ENTRY.size))
+        log.seek(last)
+        line = log.readline()
+        if line.endswith(b"\n"):
+            end = last + len(line)
+            history["last_ts"] = last_ts
+        else:
+            idx_size -= INDEX_ENTRY.size
+            end = last
+    idx.truncate(idx_size)
+
+    log.seek(end)
+    for line in log.read().splitlines(keepends=True):
+        try:
+            ts = float(line.split(b"\t", 1)[0])
+        except ValueError:
+            break
+        if not line.endswith(b"\n"):
+            break
+        idx.write(INDEX_ENTRY.pack(ts, end))
+        history["last_ts"] = ts
+        end += len(line)
+    log.truncate(end)
+    log.seek(0, os.SEEK_END)
+    idx.seek(0, os.SEEK_END)
+    history["log"], history["idx"], history["number"] = log, idx, number
+
 
-## Speichert den aktuellen Chatverlauf in eine Textdatei.
-def save_history(chat_history, filename="verlauf.txt"):
+## Kodiert eine Nachricht als eine Zeile im Log.
+def encode_record(ts, kind, peer, text):
     """
-    Speichert alle bisher gesendeten und empfangenen Nachrichten in eine Textdatei.
+    Tabulatoren, Zeilenumbrüche und Backslashes im Text werden maskiert, sodass jede
+    Nachricht genau eine Zeile belegt.
 
-    @param chat_history: Liste aller bisherigen Chat-Nachrichten
-    @param filename: Name der Zieldatei (Standard: "verlauf.txt")
+    @return: Zeile als bytes
+    """
+    def escape(value):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    return f"{ts:.3f}\t{kind}\t{escape(peer)}\t{escape(text)}\n".encode()
+
+
+## Dekodiert eine Zeile aus dem Log.
+def decode_record(line):
+    """
+    @param line: Zeile als bytes (mit oder ohne Zeilenumbruch)
+    @return: (ts, kind, peer, text)
+    """
+    def unescape(value):
+        out, chars = [], iter(value)
+        for c in chars:
+            if c == "\\":
+                c = {"t": "\t", "n": "\n"}.get(next(chars, ""), "\\")
+            out.append(c)
+        return "".join(out)
+    ts, kind, peer, text = line.decode(errors="replace").rstrip("\n").split("\t", 3)
+    return float(ts), kind, unescape(peer), unescape(text)
+
+
+## Speichert den aktuellen Chatverlauf dauerhaft auf der Festplatte.
+def save_history(chat_history):
+    """
+    Da jede Nachricht sofort angehängt wird, muss nichts neu geschrieben werden. Die Funktion
+    sorgt nur dafür, dass alle Daten des aktuellen Segments physisch auf der Platte liegen.
+
+    @param chat_history: Verlauf (dict) aus open_history
     @return: None
     """
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            for line in chat_history:
-                f.write(line + "\n")
+        with chat_history["lock"]:
+            for f in (chat_history["log"], chat_history["idx"]):
+                f.flush()
+                os.fsync(f.fileno())
+            for number in list(chat_history["search"]):
+                store_index(chat_history, number)
     except Exception as e:
         print(f"[Fehler] Verlauf konnte nicht gespeichert werden: {e}")
 
 ## Fügt eine neue Nachricht dem Chatverlauf hinzu.
-def add_message(chat_history, msg):
+def add_message(chat_history, msg, peer="", kind="text"):
     """
-    Hängt eine neue Nachricht an die Chat-Historie an.
+    Hängt eine neue Nachricht an das aktuelle Segment, den Index und den Suchindex an.
+    Überschreitet das Segment SEGMENT_BYTES, wird ein neues Segment begonnen.
 
-    @param chat_history: Chatverlauf als Manager Liste
+    @param chat_history: Verlauf (dict) aus open_history
     @param msg: Text der neuen Nachricht
+    @param peer: Gesprächspartner (Empfänger oder Absender), falls bekannt
+    @param kind: Art der Nachricht ("text" oder "image")
+    @return: None
+    """
+    with chat_history["lock"]:
+        # Zeitstempel streng monoton halten (mindestens 1 ms Abstand), damit jeder Eintrag
+        # eindeutig als Seitenanfang für "history --before" dienen kann
+        ts = round(max(time.time(), chat_history["last_ts"] + 0.001), 3)
+        chat_history["last_ts"] = ts
+        record = encode_record(ts, kind, peer, msg)
+        log, idx = chat_history["log"], chat_history["idx"]
+        offset = log.tell()
+        if offset and offset + len(record) > SEGMENT_BYTES:
+            rotate_segment(chat_history)
+            log, idx = chat_history["log"], chat_history["idx"]
+            offset = 0
+        search = segment_index(chat_history, chat_history["number"])
+        log.write(record)
+        log.flush()
+        idx.write(INDEX_ENTRY.pack(ts, offset))
+        idx.flush()
+        chat_history["tail"].append((ts, kind, peer, msg))
+        try:
+            index_record(search, search["covered"], kind, peer, msg)
+        except ValueError:
+            # Sollte nicht vorkommen; der Index wird bei der nächsten Nutzung aus dem Log neu aufgebaut
+            chat_history["search"].pop(chat_history["number"], None)
+
+
+## Schließt das aktuelle Segment ab und beginnt ein neues.
+def rotate_segment(chat_history):
+    """
+    @param chat_history: Verlauf (dict)
+    @return: None
+    """
+    store_index(chat_history, chat_history["number"])
+    chat_history["log"].close()
+    chat_history["idx"].close()
+    number = chat_history["number"] + 1
+    chat_history["segments"].append(number)
+    open_segment(chat_history, number)
+
+
+## Liest eine Seite aus dem Chatverlauf.
+def read_history(chat_history, count, before=None):
+    """
+    Liefert die letzten count Nachrichten (optional nur solche vor einem Zeitpunkt).
+    Liegen alle gesuchten Nachrichten im Speicher, wird die Platte nicht gelesen.
+
+    @param chat_history: Verlauf (dict)
+    @param count: Anzahl der gewünschten Nachrichten
+    @param before: Unix-Zeitstempel; nur ältere Nachrichten werden geliefert (optional)
+    @return: Liste von (ts, kind, peer, text), älteste zuerst
+    """
+    if count <= 0:
+        return []
+    tail = list(chat_history["tail"])
+    candidates = tail if before is None else [r for r in tail if r[0] < before]
+    # Ist der Speicher nicht voll, enthält er den gesamten Verlauf
+    if len(candidates) >= count or len(tail) < HISTORY_TAIL:
+        return candidates[-count:]
+    return read_from_disk(chat_history, count, before)
+
+
+## Liest eine Seite des Chatverlaufs über die Segment-Indizes.
+def read_from_disk(chat_history, count, before=None):
+    """
+    Durchsucht die Segmente vom jüngsten zum ältesten, bis genug Nachrichten gefunden sind.
+
+    @param chat_history: Verlauf (dict)
+    @param count: Anzahl der gewünschten Nachrichten
+    @param before: Unix-Zeitstempel oder None
+    @return: Liste von (ts, kind, peer, text), älteste zuerst
+    """
+    result = []
+    with chat_history["lock"]:
+        for number in reversed(chat_history["segments"]):
+            needed = count - len(result)
+            if needed <= 0:
+                break
+            result[:0] = read_segment(chat_history, number, needed, before)
+    return result
+
+
+## Liest bis zu count Nachrichten vom Ende eines Segments (vor einem Zeitpunkt).
+def read_segment(chat_history, number, count, before):
+    """
+    @param chat_history: Verlauf (dict)
+    @param number: Segmentnummer
+    @param count: Höchstzahl an Nachrichten
+    @param before: Unix-Zeitstempel oder None
+    @return: Liste von (ts, kind, peer, text), älteste zuerst
+    """
+    idx_path = segment_path(chat_history, number, "idx")
+    entries = os.path.getsize(idx_path) // INDEX_ENTRY.size if os.path.exists(idx_path) else 0
+    if not entries:
+        return []
+    with open(idx_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+        def entry(i):
+            return INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size)
+        end = entries if before is None else find_entry(index, entries, before)
+        start = max(0, end - count)
+        if start == end:
+            return []
+        first_offset = entry(start)[1]
+        last_offset = entry(end)[1] if end < entries else None
+    with open(segment_path(chat_history, number, "log"), "rb") as log:
+        log.seek(first_offset)
+        data = log.read() if last_offset is None else log.read(last_offset - first_offset)
+    lines = data.split(b"\n")[:end - start]
+    return [decode_record(line) for line in lines]
+
+
+## Sucht per binärer Suche den ersten Eintrag eines Segments ab einem Zeitpunkt.
+def find_entry(index, entries, ts):
+    """
+    @param index: Inhalt der .idx-Datei (mmap oder bytes)
+    @param entries: Anzahl der Einträge
+    @param ts: Unix-Zeitstempel
+    @return: Position des ersten Eintrags mit Zeitstempel >= ts (entries, wenn es keinen gibt)
+    """
+    lo, hi = 0, entries
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if INDEX_ENTRY.unpack_from(index, mid * INDEX_ENTRY.size)[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+## Anzahl der Einträge eines Segments laut .idx-Datei.
+def segment_entries(chat_history, number):
+    """
+    @param chat_history: Verlauf (dict)
+    @param number: Segmentnummer
+    @return: Anzahl der Nachrichten im Segment
+    """
+    if number == chat_history["number"]:
+        return chat_history["idx"].tell() // INDEX_ENTRY.size
+    try:
+        return os.path.getsize(segment_path(chat_history, number, "idx")) // INDEX_ENTRY.size
+    except OSError:
+        return 0
+
+
+## Liefert den Suchindex eines Segments und lädt ihn bei Bedarf.
+def segment_index(chat_history, number):
+    """
+    Nachrichten, die noch nicht im gespeicherten Index stehen (z.B. nach einem Absturz oder bei
+    einem Verlauf aus einer älteren Version), werden aus dem Log nachgetragen.
+    Muss mit gehaltenem Lock aufgerufen werden.
+
+    @param chat_history: Verlauf (dict)
+    @param number: Segmentnummer
+    @return: Index (dict, siehe search_index.py)
+    """
+    search = chat_history["search"].get(number)
+    if search is not None:
+        return search
+    search = load_index(index_path(segment_path(chat_history, number, "log")))
+    entries = segment_entries(chat_history, number)
+    if search["covered"] > entries:
+        search = new_index()
+    if search["covered"] < entries:
+        for position, (_, kind, peer, text) in enumerate(read_entries(chat_history, number, search["covered"], entries),
+                                                         search["covered"]):
+            index_record(search, position, kind, peer, text)
+    chat_history["search"][number] = search
+    if number != chat_history["number"]:
+        store_index(chat_history, number)
+    return search
+
+
+## Schreibt den Suchindex eines Segments, falls er sich geändert hat.
+def store_index(chat_history, number):
+    """
+    @param chat_history: Verlauf (dict)
+    @param number: Segmentnummer
+    @return: None
+    """
+    search = chat_history["search"].get(number)
+    if search is None:
+        return
+    try:
+        save_index(search, index_path(segment_path(chat_history, number, "log")))
+    except OSError as e:
+        print(f"[Fehler] Suchindex konnte nicht gespeichert werden: {e}")
+
+
+## Liest die Nachrichten eines Segments zwischen zwei Positionen.
+def read_entries(chat_history, number, start, end):
+    """
+    @param chat_history: Verlauf (dict)
+    @param number: Segmentnummer
+    @param start: Erste Position
+    @param end: Position nach der letzten (höchstens Anzahl der Einträge)
+    @return: Liste von (ts, kind, peer, text)
+    """
+    if start >= end:
+        return []
+    with open(segment_path(chat_history, number, "idx"), "rb") as f:
+        f.seek(start * INDEX_ENTRY.size)
+        first_offset = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[1]
+    with open(segment_path(chat_history, number, "log"), "rb") as log:
+        log.seek(first_offset)
+        lines = [log.readline() for _ in range(end - start)]
+    return [decode_record(line) for line in lines]
+
+
+## Durchsucht den gesamten Chatverlauf über die Suchindizes.
+def search_history(chat_history, query, peer=None, kind=None, since=None, until=None, limit=SEARCH_LIMIT):
+    """
+    Alle Suchbegriffe müssen vorkommen (Groß- und Kleinschreibung egal, "wort*" sucht nach dem
+    Wortanfang). Eine leere Anfrage liefert alle Nachrichten, die den Filtern entsprechen.
+    Segmente außerhalb des Zeitraums werden übersprungen, ohne ihren Index zu laden.
+
+    @param chat_history: Verlauf (dict)
+    @param query: Suchbegriffe
+    @param peer: Nur Nachrichten von bzw. an diesen Peer (optional)
+    @param kind: Nur Nachrichten dieser Art, "text" oder "image" (optional)
+    @param since: Nur Nachrichten ab diesem Unix-Zeitstempel (optional)
+    @param until: Nur Nachrichten vor diesem Unix-Zeitstempel (optional)
+    @param limit: Höchstzahl der Treffer (die jüngsten werden geliefert)
+    @return: (Treffer als Liste von (ts, kind, peer, text), älteste zuerst; Gesamtzahl der Treffer)
+    """
+    terms = parse_query(query)
+    found, total = [], 0
+    with chat_history["lock"]:
+        for number in reversed(chat_history["segments"]):
+            entries = segment_entries(chat_history, number)
+            if not entries:
+                continue
+            with open(segment_path(chat_history, number, "idx"), "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                lo = 0 if since is None else find_entry(index, entries, since)
+                hi = entries if until is None else find_entry(index, entries, until)
+                if lo >= hi:
+                    continue
+                positions = [p for p in lookup(segment_index(chat_history, number), terms, peer, kind) if lo <= p < hi]
+                total += len(positions)
+                wanted = positions[-(limit - len(found)):] if len(found) < limit else []
+                offsets = [INDEX_ENTRY.unpack_from(index, p * INDEX_ENTRY.size)[1] for p in wanted]
+            if offsets:
+                with open(segment_path(chat_history, number, "log"), "rb") as log:
+                    records = []
+                    for offset in offsets:
+                        log.seek(offset)
+                        records.append(decode_record(log.readline()))
+                found[:0] = records
+    return found, total
+
+
+## Schließt die Dateien des Chatverlaufs.
+def close_history(chat_history):
+    """
+    @param chat_history: Verlauf (dict)
     @return: None
     """
-    chat_history.append(msg)
+    save_history(chat_history)
+    with chat_history["lock"]:
+        chat_history["log"].close()
+        chat_history["idx"].close()
 
 ## Lädt die Konfiguration aus einer TOML-Datei neu.
 def reload_config(config_path):
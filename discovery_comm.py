@@ -6,143 +6,871 @@ Dieses Modul übernimmt die Discovery-Funktion im Peer-to-Peer-Netzwerk.
 Nutzer werden über UDP-Broadcast gefunden und bekannt gemacht (JOIN, WHO, LEAVE).
 Die Nutzerliste wird regelmäßig synchronisiert, damit immer die aktuellen Teilnehmer angezeigt werden.
 
+Die Schleife wartet mit selectors auf den UDP-Socket und auf Kommandos aus dem CLI und reagiert
+sofort auf jedes Datagramm. Wiederholungen (WHO-Broadcasts) und Wartezeiten (Sammeln der
+SEEN-Antworten) laufen über den Timer-Heap aus event_loop.py statt über time.sleep(), sodass
+der Empfang nie angehalten wird. WHO wird mit wachsendem Abstand und zufälliger Streuung
+wiederholt; treffen mehrere Auslöser gleichzeitig ein, wird nur eine Wiederholungsfolge gestartet.
+
+Die Peer-Liste ist versioniert (siehe peer_sync.py). Ein WHO enthält den Digest der eigenen
+Liste und, falls vorhanden, den Peer und die Generation, mit denen zuletzt abgeglichen wurde:
+
+    WHO <name> <digest> [<peer> <epoche> <generation>]
+
+ - Der genannte Peer antwortet sofort mit den Änderungen seit dieser Generation (Delta).
+ - Peers mit demselben Digest wie der Fragende antworten nicht; sie wissen nichts Neues.
+ - Alle anderen antworten nach einer zufälligen Verzögerung mit der vollständigen Liste.
+   Hört ein Peer vorher ein SEEN, dessen Absender denselben Digest hat wie er selbst,
+   entfällt seine Antwort. Meist antwortet so nur ein Peer statt aller.
+ - Weitere WHOs, während eine Antwort geplant ist oder kurz nach einer Antwort, lösen keine
+   zusätzliche Antwort aus. Der Fragende bricht seine Wiederholungen ab, sobald ein SEEN
+   vollständig eingetroffen ist.
+ - Ein JOIN wird nur per Unicast-JOIN beantwortet, und nur, wenn er die Liste ändert (sonst
+   würden sich zwei Peers gegenseitig endlos antworten); sonst genügt ein Heartbeat per Unicast.
+   Die WHO-Folge sendet allein der Neue.
+
+Große Listen werden auf mehrere nummerierte SEEN-Datagramme verteilt. Ein WHO ohne Digest
+(ältere Version) wird wie dort per Unicast mit der vollständigen Liste im alten Format
+beantwortet; ein SEEN im alten Format wird übernommen, zählt aber nicht als Abgleich.
+Ältere Versionen beantworten ihrerseits nur ein WHO ohne weitere Felder. Bekannte Peers, die noch
+nie Fähigkeiten angekündigt haben, erhalten deshalb zum ersten WHO einer Folge zusätzlich ein "WHO"
+per Unicast (nicht zu den Wiederholungen); die erweiterte Form ignorieren sie.
+
+Alle Datagramme sind Text, denn ältere Peers dekodieren jedes Datagramm als UTF-8 und brechen an
+einem binären ab. Die eigenen Fähigkeiten (protocol.py) stehen im Heartbeat, den ältere Peers
+ignorieren. Auf den eigenen JOIN und jede Antwort auf einen JOIN folgt deshalb sofort ein
+Heartbeat; ein Heartbeat löst nie eine Antwort aus. Ein JOIN setzt die Fähigkeiten des Absenders
+zurück (z.B. Neustart mit einer älteren Version).
+
+Erreichbarkeit: Jeder Peer sendet alle HEARTBEAT_INTERVAL Sekunden "HB <name> <port> <fähigkeiten>". Jedes
+Datagramm eines Peers zählt als Lebenszeichen. Bleiben sie aus, gilt er nach SUSPECT_AFTER
+Sekunden als unsicher, nach DEAD_AFTER als offline und wird nach PURGE_AFTER entfernt. Pro Peer
+ist dafür genau ein Timer geplant, der erst bei Fälligkeit prüft, ob inzwischen ein Lebenszeichen
+kam – ein Heartbeat selbst kostet also nur das Setzen eines Zeitstempels. Der Zustand steht in
+der gemeinsamen Peer-Tabelle; CLI und Netzwerkprozess zeigen bzw. nutzen ihn.
+
+Meldungen an das UI laufen über den Ausgangspuffer aus events.py: Wiederholte Peer- und
+Systemmeldungen (z.B. bei einer Flut von JOINs) werden zusammengefasst und bei voller UI-Queue
+notfalls verworfen; die Schleife blockiert dabei nie.
+
+Laufzeitmetriken (Datagramme je Typ, Bytes, Peers je Zustand, WHO-Konvergenzzeit, Dauer jedes
+Schleifendurchlaufs) werden in ctx["metrics"] erfasst und an das CLI gemeldet (siehe metrics.py).
+
+Das Kommando STOP beendet die Schleife; danach werden Socket und Peer-Tabelle geschlossen und
+discovery_service() kehrt zurück (z.B. damit ein Profiler seine Ergebnisse schreiben kann).
+
 Optimiert für Tests auf localhost (mehrere Instanzen auf einem PC).
 @author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
 @date 2025
 """
+import random
+import selectors
+import signal
 import socket
 import time
+from event_loop import queue_bridge, drain_wakeups, call_later, cancel_timer, run_due_timers
+from peer_table import attach_peer_table, close_peer_table, store_peers, PEER_ALIVE, PEER_SUSPECT, PEER_DEAD
+from peer_sync import (new_peer_list, set_peer, remove_peer, list_digest, delta_available,
+                       encode_seen, encode_seen_legacy, decode_seen, SEEN_FULL, SEEN_LEGACY)
+from protocol import LOCAL_CAPS, CMD_WHO, CMD_JOIN, CMD_LEAVE, CMD_PEERS, CMD_STATS, CMD_STOP
+from events import post, attach_outbox, flush_events, close_outbox, EVENT_SYSTEM, EVENT_SENT, EVENT_PEER
+from flow_control import FLUSH_INTERVAL, COMMAND_QUEUE_LIMIT
+from metrics import new_metrics, inc, set_gauge, observe, publish, METRICS_INTERVAL
+
+## Maximale Größe eines empfangenen Datagramms.
+DATAGRAM_SIZE = 65535
+## Gewünschte Größe des Empfangspuffers, damit bei vielen gleichzeitigen Antworten nichts verloren geht.
+RECV_BUFFER_BYTES = 1024 * 1024
+## Anzahl der WHO-Broadcasts pro Wiederholungsfolge (inklusive des ersten).
+WHO_ATTEMPTS = 3
+## Abstand vor der ersten Wiederholung in Sekunden; verdoppelt sich bei jeder weiteren.
+WHO_BASE_DELAY = 0.2
+## Zufällige Streuung der Wiederholungsabstände (±50 %).
+WHO_JITTER = 0.5
+## Ruhezeit nach der letzten SEEN-Antwort, bevor die Nutzerliste als aktuell gilt (Sekunden).
+SEEN_SETTLE = 0.6
+## Zeitraum, über den die SEEN-Antworten der Peers zufällig verteilt werden (Sekunden).
+SEEN_REPLY_SPREAD = 0.25
+## Nach einer eigenen SEEN-Antwort werden weitere WHOs so lange nicht beantwortet (Sekunden).
+WHO_COALESCE = 0.1
+## Höchstzahl unvollständig empfangener SEEN-Antworten, deren Seiten verfolgt werden.
+MAX_PARTIAL_SEEN = 64
+## Abstand zwischen zwei eigenen Heartbeats in Sekunden.
+HEARTBEAT_INTERVAL = 5.0
+## Zufällige Streuung des Heartbeat-Abstands (±20 %), damit nicht alle Peers gleichzeitig senden.
+HEARTBEAT_JITTER = 0.2
+## Ohne Lebenszeichen gilt ein Peer nach dieser Zeit als unsicher (Sekunden).
+SUSPECT_AFTER = 3 * HEARTBEAT_INTERVAL
+## Ohne Lebenszeichen gilt ein Peer nach dieser Zeit als offline (Sekunden).
+DEAD_AFTER = 6 * HEARTBEAT_INTERVAL
+## Ohne Lebenszeichen wird ein Peer nach dieser Zeit aus der Liste entfernt (Sekunden).
+PURGE_AFTER = 600.0
+## Datagrammtypen, die in den Metriken einzeln gezählt werden (alle anderen als "other").
+DATAGRAM_TYPES = {"JOIN", "WHO", "SEEN", "HB", "LEAVE"}
+## Zieladresse, über deren Route die eigene IP ermittelt wird (TEST-NET-1, es wird nichts gesendet).
+ROUTE_PROBE_ADDRESS = "192.0.2.1"
+## Anzeigezusatz je Zustand für den PEERS-Befehl.
+STATE_LABELS = {PEER_ALIVE: "", PEER_SUSPECT: " (unsicher)", PEER_DEAD: " (offline)"}
+
 
 ## Discovery-Service: Findet andere Nutzer im lokalen Netzwerk und verwaltet die Kontaktliste.
-def discovery_service(ui_queue, disc_queue, config, kontaktbuch):
+def discovery_service(ui_queue, disc_queue, config, table_name):
     """
     Erkennt andere Nutzer im lokalen Netz per UDP-Broadcast und synchronisiert die Kontaktliste.
-    Wartet nach WHO kurz auf alle SEEN-Antworten und merged sie.
+    Wartet nach WHO auf alle SEEN-Antworten und meldet danach, wie lange es bis zur
+    letzten Antwort gedauert hat.
+    Der Discovery-Prozess ist der einzige Schreiber der gemeinsamen Peer-Tabelle.
+
+    Optionale Konfigurationsschlüssel (z.B. für Tests auf einem Rechner):
+    "ip" ersetzt die ermittelte eigene IP (siehe local_ip), "broadcast" die Broadcast-Adresse.
+
+    Läuft, bis das Kommando STOP eintrifft. Strg+C im Terminal wird ignoriert; das CLI beendet
+    den Prozess über STOP.
 
     @param ui_queue: Queue für System-/Statusnachrichten
-    @param disc_queue: Queue für eingehende Discovery-Kommandos aus dem CLI 
+    @param disc_queue: Queue für eingehende Discovery-Kommandos aus dem CLI
     @param config: Dictionary mit Konfiguration (Nickname, Ports, etc.)
-    @param kontaktbuch: Manager Dictionary zur Verwaltung aller bekannten Kontakte
+    @param table_name: Name der gemeinsamen Peer-Tabelle (peer_table.create_peer_table)
     @return: None
     """
-
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     nickname = config["handle"]
     udp_port = config["whoisport"]
     tcp_port = config["port"]
 
-    hostname = socket.gethostname()
-    eigene_ip = socket.gethostbyname(hostname)
-    ui_queue.put(f"[Netzwerk] Eigene IP: {eigene_ip}")
-
-    peers = {nickname: (eigene_ip, tcp_port)}
-    kontaktbuch[nickname] = (eigene_ip, tcp_port)
-    joined = False
+    broadcast_ip = config.get("broadcast", "255.255.255.255")
+    eigene_ip = config.get("ip") or local_ip(broadcast_ip)
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+    except OSError:
+        pass
     sock.bind(("0.0.0.0", udp_port))
     sock.setblocking(False)
+    attach_outbox(ui_queue)
+    post(ui_queue, EVENT_SYSTEM, f"[Netzwerk] Eigene IP: {eigene_ip}", ready="discovery", ip=eigene_ip)
+
+    ctx = {
+        "sel": selectors.DefaultSelector(),
+        "timers": [],
+        "sock": sock,
+        "ui_queue": ui_queue,
+        "nickname": nickname,
+        "tcp_port": tcp_port,
+        "udp_port": udp_port,
+        "broadcast": (broadcast_ip, udp_port),
+        "peer_list": new_peer_list(nickname, (eigene_ip, tcp_port)),
+        "table": attach_peer_table(table_name),
+        "who_timers": [],      # Geplante WHO-Wiederholungen der laufenden Folge
+        "settle_timer": None,  # Timer für das Ende der SEEN-Sammelphase (nach WHO aus dem CLI)
+        "who_started": 0.0,    # Zeitpunkt des WHO-Kommandos
+        "last_seen": None,     # Zeitpunkt der letzten SEEN-Antwort nach dem WHO-Kommando
+        "reply_timer": None,   # Geplante eigene SEEN-Antwort
+        "last_reply": 0.0,     # Zeitpunkt der letzten eigenen SEEN-Antwort
+        "synced": {},          # Peer -> (Epoche, Generation) des letzten vollständigen Abgleichs
+        "sync_last": None,     # Peer, mit dem zuletzt abgeglichen wurde
+        "partial": {},         # SEEN-Kennung -> bereits empfangene Seitennummern
+        "last_heard": {},      # Peer -> Zeitpunkt des letzten Lebenszeichens
+        "states": {},          # Peer -> Zustand, sofern nicht PEER_ALIVE
+        "watch": {},           # Peer -> geplanter Timer der Erreichbarkeitsprüfung
+        "caps": {},            # Peer -> angekündigte Fähigkeiten (protocol.CAP_*)
+        "announced": set(),    # Peers, die schon einmal einen Heartbeat mit Fähigkeiten gesendet haben
+        "metrics": new_metrics("discovery"),
+        "running": True,
+    }
+    # Direkter Verweis für Lesezugriffe; geändert wird nur über peer_sync
+    ctx["peers"] = ctx["peer_list"]["peers"]
+    peers_changed(ctx)
+
+    ctx["sel"].register(sock, selectors.EVENT_READ, (handle_datagrams, sock))
+    wake_sock, pending = queue_bridge(disc_queue, COMMAND_QUEUE_LIMIT)
+    ctx["sel"].register(wake_sock, selectors.EVENT_READ, (handle_commands, (wake_sock, pending)))
+
+    # Beim Start: JOIN und eine WHO-Folge senden
+    send_join(ctx)
+    start_who(ctx)
+    send_heartbeat(ctx)
+
+    call_later(ctx["timers"], METRICS_INTERVAL, report_metrics, ctx)
+
+    while ctx["running"]:
+        timeout = run_due_timers(ctx["timers"])
+        if flush_events(ui_queue):
+            # Die UI-Queue ist voll: wartende Ereignisse bald erneut übergeben
+            timeout = FLUSH_INTERVAL if timeout is None else min(timeout, FLUSH_INTERVAL)
+        ready = ctx["sel"].select(timeout)
+        started = time.perf_counter()
+        for key, mask in ready:
+            handler, state = key.data
+            handler(ctx, state, mask)
+        if ready:
+            observe(ctx["metrics"], "loop_seconds", time.perf_counter() - started)
+    shutdown(ctx)
+
+
+## Ermittelt die eigene IP-Adresse ohne DNS-Anfrage.
+def local_ip(broadcast_ip):
+    """
+    socket.gethostbyname(socket.gethostname()) kann je nach Netz mehrere Sekunden auf DNS warten
+    und liefert unter Linux oft nur 127.0.1.1. Stattdessen wird ein UDP-Socket "verbunden": Das
+    Betriebssystem wählt dabei nur die Route und damit die Absenderadresse, ohne ein Paket zu senden.
+    Eine gerichtete Broadcast-Adresse (z.B. 192.168.1.255) führt zur passenden Netzwerkkarte.
+
+    @param broadcast_ip: Konfigurierte Broadcast-Adresse
+    @return: Eigene IPv4-Adresse (127.0.0.1, wenn es keine Route gibt)
+    """
+    target = ROUTE_PROBE_ADDRESS if broadcast_ip == "255.255.255.255" else broadcast_ip
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        try:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            probe.connect((target, 9))
+            return probe.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
+
+
+## Schließt alle Sockets und die Peer-Tabelle, nachdem die Schleife beendet wurde.
+def shutdown(ctx):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    for key in list(ctx["sel"].get_map().values()):
+        key.fileobj.close()
+    ctx["sel"].close()
+    ctx["timers"].clear()
+    close_peer_table(ctx["table"])
+    close_outbox(ctx["ui_queue"])
+
+
+## Aktualisiert die Messwerte des Discovery-Prozesses und meldet die Metriken an das CLI.
+def report_metrics(ctx, force=False, reschedule=True):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param force: True, um auch unveränderte Metriken zu melden (Kommando STATS)
+    @param reschedule: True, wenn der Aufruf vom periodischen Timer kommt
+    @return: None
+    """
+    metrics, states = ctx["metrics"], list(ctx["states"].values())
+    dead = states.count(PEER_DEAD)
+    suspect = states.count(PEER_SUSPECT)
+    set_gauge(metrics, "peers", len(ctx["peers"]) - suspect - dead, state="alive")
+    set_gauge(metrics, "peers", suspect, state="suspect")
+    set_gauge(metrics, "peers", dead, state="dead")
+    set_gauge(metrics, "timers", len(ctx["timers"]))
+    publish(metrics, ctx["ui_queue"], force)
+    if reschedule:
+        call_later(ctx["timers"], METRICS_INTERVAL, report_metrics, ctx)
+
+
+## Sendet ein Datagramm und zählt es in den Metriken.
+def send_datagram(ctx, data, address, kind):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param data: Inhalt (bytes)
+    @param address: Zieladresse (IP, Port)
+    @param kind: Datagrammart für die Metriken (z.B. "WHO")
+    @return: None
+    @throws OSError: wenn das Senden scheitert
+    """
+    ctx["sock"].sendto(data, address)
+    inc(ctx["metrics"], "datagrams_sent_total", type=kind)
+    inc(ctx["metrics"], "bytes_sent_total", len(data))
+
+
+## Kodiert ein Discovery-Datagramm (außer SEEN).
+def encode_message(kind, fields):
+    """
+    @param kind: Datagrammart ("JOIN", "HB", "LEAVE", "WHO")
+    @param fields: Felder wie von parse_datagram geliefert
+    @return: Datagramm (bytes)
+    """
+    if kind == "WHO":
+        msg = f"WHO {fields['user']} {fields['digest']}"
+        if fields["sync"] is not None:
+            msg += " {} {} {}".format(*fields["sync"])
+        return msg.encode()
+    if kind == "LEAVE":
+        return f"LEAVE {fields['user']}".encode()
+    if kind == "HB":
+        return f"HB {fields['user']} {fields['port']} {LOCAL_CAPS}".encode()
+    return f"{kind} {fields['user']} {fields['port']}".encode()
 
-    # Beim Start: JOIN und mehrere WHO senden
-    join_msg = f"JOIN {nickname} {tcp_port}".encode()
-    sock.sendto(join_msg, ("255.255.255.255", udp_port))
-    for _ in range(3):
-        sock.sendto(b"WHO", ("255.255.255.255", udp_port))
-        time.sleep(0.2)
 
-    # Merger-Speicher für SEEN-Einträge und Timestamp Messung
-    seen_cache = {}
-    seen_timer = 0
-    awaiting_seen = False
+## Sendet ein Discovery-Datagramm als Broadcast oder an einen Peer.
+def send_discovery(ctx, kind, fields, address=None):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param kind: Datagrammart ("JOIN", "HB", "LEAVE", "WHO")
+    @param fields: Felder wie von parse_datagram geliefert
+    @param address: Zieladresse (IP, Port) oder None für einen Broadcast
+    @return: None
+    @throws OSError: wenn das Senden scheitert
+    """
+    send_datagram(ctx, encode_message(kind, fields), address or ctx["broadcast"], kind)
+
+
+## Sendet den eigenen JOIN, gefolgt von einem Heartbeat mit den eigenen Fähigkeiten.
+def send_join(ctx, address=None):
+    """
+    Der JOIN setzt die Fähigkeiten beim Empfänger zurück; erst der Heartbeat danach kündigt sie
+    an. Ältere Peers lesen den JOIN und ignorieren den Heartbeat.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param address: Zieladresse einer JOIN-Antwort oder None für einen Broadcast
+    @return: None
+    @throws OSError: wenn das Senden scheitert
+    """
+    fields = {"user": ctx["nickname"], "port": ctx["tcp_port"]}
+    send_discovery(ctx, "JOIN", fields, address)
+    send_discovery(ctx, "HB", fields, address)
+
+
+## Startet eine WHO-Folge, sofern nicht bereits eine läuft.
+def start_who(ctx):
+    """
+    Sendet sofort ein WHO und plant WHO_ATTEMPTS - 1 Wiederholungen mit verdoppeltem Abstand
+    und zufälliger Streuung ein. Läuft bereits eine Folge, wird keine zweite gestartet.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    if ctx["who_timers"]:
+        return
+    ctx["who_timers"].append(None)
+    send_who(ctx, None)
+    delay = 0.0
+    for attempt in range(1, WHO_ATTEMPTS):
+        step = WHO_BASE_DELAY * 2 ** (attempt - 1)
+        delay += step * random.uniform(1 - WHO_JITTER, 1 + WHO_JITTER)
+        ctx["who_timers"].append(call_later(ctx["timers"], delay, send_who, ctx, attempt))
+
+
+## Sendet einen WHO-Broadcast (sofort oder als geplante Wiederholung).
+def send_who(ctx, attempt):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param attempt: Nummer der Wiederholung oder None beim ersten Senden
+    @return: None
+    """
+    if attempt == WHO_ATTEMPTS - 1:
+        # Letzte Wiederholung: Die Folge ist beendet
+        ctx["who_timers"].clear()
+    fields = {"user": ctx["nickname"], "digest": list_digest(ctx["peer_list"]), "sync": None}
+    if ctx["sync_last"] is not None:
+        epoch, gen = ctx["synced"][ctx["sync_last"]]
+        fields["sync"] = (ctx["sync_last"], epoch, gen)
+    try:
+        send_discovery(ctx, "WHO", fields)
+        if attempt is None:
+            # Ältere Versionen beantworten nur ein WHO ohne weitere Felder; einmal pro Folge genügt
+            for address in legacy_addresses(ctx):
+                send_datagram(ctx, b"WHO", address, "WHO")
+    except OSError:
+        pass
+
+
+## Discovery-Adressen der bekannten Peers, die noch nie Fähigkeiten angekündigt haben (ältere Versionen).
+def legacy_addresses(ctx):
+    """
+    Maßgeblich ist ctx["announced"], nicht ctx["caps"]: Ein JOIN setzt die Fähigkeiten bis zum
+    nächsten Heartbeat zurück, macht den Peer aber nicht zu einer älteren Version. Peers, die nur
+    aus einem SEEN bekannt sind, zählen dazu, bis ihr erster Heartbeat eintrifft.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: Liste von (IP, UDP-Port)
+    """
+    return [(ip, ctx["udp_port"]) for name, (ip, _) in ctx["peers"].items()
+            if name != ctx["nickname"] and name not in ctx["announced"]]
+
+
+## Bricht die noch geplanten WHO-Wiederholungen ab.
+def stop_who(ctx):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    for entry in ctx["who_timers"]:
+        if entry is not None:
+            cancel_timer(entry)
+    ctx["who_timers"].clear()
+
+
+## Überträgt die Peer-Liste in die gemeinsame Tabelle.
+def peers_changed(ctx):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    store_peers(ctx["table"], ctx["peers"], ctx["states"], ctx["caps"])
+
+
+## Sendet einen Heartbeat und plant den nächsten ein.
+def send_heartbeat(ctx):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    try:
+        send_discovery(ctx, "HB", {"user": ctx["nickname"], "port": ctx["tcp_port"]})
+    except OSError:
+        pass
+    delay = HEARTBEAT_INTERVAL * random.uniform(1 - HEARTBEAT_JITTER, 1 + HEARTBEAT_JITTER)
+    call_later(ctx["timers"], delay, send_heartbeat, ctx)
+
+
+## Vermerkt ein Lebenszeichen eines bekannten Peers.
+def heard(ctx, name):
+    """
+    Ein unsicherer oder als offline geltender Peer wird sofort wieder als erreichbar geführt.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param name: Nutzername des Peers
+    @return: None
+    """
+    if name == ctx["nickname"] or name not in ctx["peers"]:
+        return
+    ctx["last_heard"][name] = time.monotonic()
+    state = ctx["states"].pop(name, PEER_ALIVE)
+    if state != PEER_ALIVE:
+        peers_changed(ctx)
+        if state == PEER_DEAD:
+            post(ctx["ui_queue"], EVENT_PEER, f"[Peer] {name} ist wieder erreichbar.", user=name)
+    watch_peer(ctx, name)
 
+
+## Plant die Erreichbarkeitsprüfung für einen Peer ein, falls noch keine geplant ist.
+def watch_peer(ctx, name):
+    """
+    Peers, die nur aus dem SEEN eines anderen bekannt sind, bekommen den aktuellen Zeitpunkt als
+    erstes Lebenszeichen.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param name: Nutzername des Peers
+    @return: None
+    """
+    if name == ctx["nickname"] or name in ctx["watch"]:
+        return
+    last = ctx["last_heard"].setdefault(name, time.monotonic())
+    delay = max(0.0, last + SUSPECT_AFTER - time.monotonic())
+    ctx["watch"][name] = call_later(ctx["timers"], delay, check_peer, ctx, name)
+
+
+## Prüft bei Fälligkeit, ob ein Peer noch Lebenszeichen sendet, und passt seinen Zustand an.
+def check_peer(ctx, name):
+    """
+    Kam seit der Planung ein Lebenszeichen, wird die Prüfung nur neu geplant. Andernfalls wird der
+    Peer unsicher, offline oder schließlich entfernt.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param name: Nutzername des Peers
+    @return: None
+    """
+    del ctx["watch"][name]
+    if name not in ctx["peers"]:
+        forget_peer(ctx, name)
+        return
+    idle = time.monotonic() - ctx["last_heard"][name]
+    if idle >= PURGE_AFTER:
+        remove_peer(ctx["peer_list"], name)
+        forget_peer(ctx, name)
+        peers_changed(ctx)
+        return
+    state = PEER_DEAD if idle >= DEAD_AFTER else PEER_SUSPECT if idle >= SUSPECT_AFTER else PEER_ALIVE
+    if state != ctx["states"].get(name, PEER_ALIVE):
+        if state == PEER_ALIVE:
+            del ctx["states"][name]
+        else:
+            ctx["states"][name] = state
+        peers_changed(ctx)
+        if state == PEER_DEAD:
+            post(ctx["ui_queue"], EVENT_PEER, f"[Peer] {name} antwortet nicht mehr und gilt als offline.", user=name)
+    # Nächste Schwelle, die der Peer ohne Lebenszeichen erreichen würde
+    delay = next(limit for limit in (SUSPECT_AFTER, DEAD_AFTER, PURGE_AFTER) if idle < limit) - idle
+    ctx["watch"][name] = call_later(ctx["timers"], delay, check_peer, ctx, name)
+
+
+## Verwirft alle Erreichbarkeitsdaten eines entfernten Peers.
+def forget_peer(ctx, name):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param name: Nutzername des Peers
+    @return: None
+    """
+    entry = ctx["watch"].pop(name, None)
+    if entry is not None:
+        cancel_timer(entry)
+    ctx["last_heard"].pop(name, None)
+    ctx["states"].pop(name, None)
+    ctx["caps"].pop(name, None)
+    ctx["announced"].discard(name)
+    ctx["synced"].pop(name, None)
+    if ctx["sync_last"] == name:
+        ctx["sync_last"] = None
+
+
+## Plant die eigene Antwort (vollständige Liste) auf ein WHO ein (sofern nötig).
+def schedule_reply(ctx):
+    """
+    Ist bereits eine Antwort geplant oder wurde gerade erst geantwortet, wird das WHO mit
+    dieser Antwort zusammengefasst.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    if ctx["reply_timer"] is not None or time.monotonic() - ctx["last_reply"] < WHO_COALESCE:
+        return
+    delay = random.uniform(0, SEEN_REPLY_SPREAD)
+    ctx["reply_timer"] = call_later(ctx["timers"], delay, send_reply, ctx)
+
+
+## Sendet die geplante SEEN-Antwort als Broadcast.
+def send_reply(ctx):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    ctx["reply_timer"] = None
+    ctx["last_reply"] = time.monotonic()
+    send_seen(ctx, None)
+
+
+## Sendet alle Datagramme eines SEEN als Broadcast.
+def send_seen(ctx, since):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param since: Generation für ein Delta oder None für die vollständige Liste
+    @return: None
+    """
+    send_pages(ctx, encode_seen(ctx["peer_list"], ctx["nickname"], since), ctx["broadcast"])
+
+
+## Sendet die Datagramme eines SEEN an eine Adresse.
+def send_pages(ctx, pages, address):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param pages: Datagramme (bytes)
+    @param address: Zieladresse (IP, Port)
+    @return: None
+    """
+    for page in pages:
+        try:
+            send_datagram(ctx, page, address, "SEEN")
+        except OSError:
+            return
+
+
+## Liest alle anstehenden Datagramme und verarbeitet sie.
+def handle_datagrams(ctx, sock, mask):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param sock: UDP-Socket
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
     while True:
-        # --- 1. Eingehende Nachrichten verarbeiten ---
         try:
-            data, addr = sock.recvfrom(512)
-            msg = data.decode().strip()
-            if msg.startswith("JOIN"):
-                _, user, port = msg.split()
-                if user == nickname:
-                    continue
-                peers[user] = (addr[0], int(port))
-                kontaktbuch[user] = (addr[0], int(port))
-                # Antwortet auf JOIN auch selbst (Bidirektional)
-                join_reply = f"JOIN {nickname} {tcp_port}".encode()
-                sock.sendto(join_reply, (addr[0], udp_port))
-                ui_queue.put(f"[Peer] {user} ist dem Chat beigetreten.")
-
-                # UPDATE: Nach jedem JOIN mehrfach WHO senden (robust gegen Race Conditions)
-                for _ in range(3):
-                    sock.sendto(b"WHO", ("255.255.255.255", udp_port))
-                    time.sleep(0.2)
-
-            elif msg == "WHO":
-                antwort = ", ".join(f"{n} {ip} {p}" for n, (ip, p) in peers.items())
-                response = f"SEEN {antwort}"
-                sock.sendto(response.encode(), addr)
-
-            elif msg.startswith("LEAVE"):
-                _, user = msg.split()
-                peers.pop(user, None)
-                kontaktbuch.pop(user, None)
-                ui_queue.put(f"[Peer] {user} hat den Chat verlassen.")
-
-            elif msg.startswith("SEEN"):
-                eintraege = msg.replace("SEEN", "").strip().split(",")
-                for eintrag in eintraege:
-                    if eintrag.strip():
-                        try:
-                            name, ip, p = eintrag.strip().split()
-                            peers[name] = (ip, int(p))
-                            kontaktbuch[name] = (ip, int(p))
-                            seen_cache[name] = (ip, int(p))
-                        except Exception:
-                            continue
-                if awaiting_seen:
-                    seen_timer = time.time()  # Reset: neues SEEN eingetroffen
-
-        except BlockingIOError:
-            pass
-
-        # --- 2. CLI-Kommandos abarbeiten ---
-        while not disc_queue.empty():
-            befehl = disc_queue.get()
-            if befehl == "WHO":
-                # Raceproof: WHO mehrfach, dann kurz auf SEEN warten
-                for _ in range(3):
-                    sock.sendto(b"WHO", ("255.255.255.255", udp_port))
-                    time.sleep(0.2)
-                awaiting_seen = True
-                seen_cache = {}
-                seen_timer = time.time()
-                ui_queue.put("[System] WHO-Broadcast gesendet.")
-            elif befehl.startswith("JOIN"):
-                sock.sendto(befehl.encode(), ("255.255.255.255", udp_port))
-                # UPDATE: Auch nach eigenem JOIN mehrfach WHO senden
-                for _ in range(3):
-                    sock.sendto(b"WHO", ("255.255.255.255", udp_port))
-                    time.sleep(0.2)
-                ui_queue.put("[System] JOIN gesendet.")
-                joined = True
-            elif befehl.startswith("LEAVE"):
-                sock.sendto(befehl.encode(), ("255.255.255.255", udp_port))
-                ui_queue.put("[System] LEAVE gesendet.")
-            elif befehl == "PEERS":
-                if kontaktbuch:
-                    ui_queue.put("[Peers] Aktuelle Nutzer:")
-                    for n, (ip, port) in kontaktbuch.items():
-                        ui_queue.put(f" - {n} @ {ip}:{port}")
-                else:
-                    ui_queue.put("[Peers] Keine anderen Nutzer gefunden.")
-
-        # --- 3. WHO-Nachbearbeitung (Warte auf alle SEEN, dann einmal Kontaktbuch-Update) ---
-        if awaiting_seen and (time.time() - seen_timer) > 0.6:
-            for n, (ip, p) in seen_cache.items():
-                kontaktbuch[n] = (ip, int(p))
-                peers[n] = (ip, int(p))
-            ui_queue.put("[System] Nutzerliste aktualisiert.")
-            awaiting_seen = False
-            seen_cache = {}
-
-        time.sleep(0.1)
+            data, addr = sock.recvfrom(DATAGRAM_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            # z.B. ICMP-Fehler einer vorherigen Antwort (Windows); nächstes Datagramm lesen
+            continue
+        inc(ctx["metrics"], "bytes_received_total", len(data))
+        try:
+            kind, fields = parse_datagram(ctx, data)
+            inc(ctx["metrics"], "datagrams_received_total", type=kind if kind in DATAGRAM_TYPES else "other")
+            handle_datagram(ctx, kind, fields, addr)
+        except ValueError:
+            # Fehlerhaftes Datagramm ignorieren
+            inc(ctx["metrics"], "datagrams_invalid_total")
+            continue
+        except OSError:
+            # Antwort konnte nicht gesendet werden (z.B. Netz nicht erreichbar)
+            continue
+
+
+## Zerlegt ein Datagramm und merkt sich die Fähigkeiten des Absenders.
+def parse_datagram(ctx, data):
+    """
+    Felder je Art:
+     - JOIN, HB: user, port (die Fähigkeiten eines HB werden nur vermerkt)
+     - LEAVE: user
+     - WHO: user und digest (bei sehr alten Versionen None), sync als (Peer, Epoche, Generation) oder None
+     - SEEN: seen als (header, additions, removals) wie bei peer_sync.decode_seen
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param data: Empfangenes Datagramm (bytes)
+    @return: (Art, Felder); unbekannte Datagramme haben die Art ihres ersten Worts und keine Felder
+    @throws ValueError: bei fehlerhaftem Aufbau (auch bei ungültigem UTF-8)
+    """
+    msg = data.decode().strip()
+    kind = msg.split(" ", 1)[0]
+    parts = msg.split()
+    if kind in ("JOIN", "HB"):
+        _, user, port, *caps = parts
+        fields = {"user": user, "port": int(port)}
+        if kind == "JOIN":
+            # Absender ist (wieder) ein Peer unbekannter Version, bis sein Heartbeat eintrifft
+            learn_caps(ctx, user, 0)
+        elif caps:
+            learn_caps(ctx, user, int(caps[0]))
+            if user != ctx["nickname"]:
+                ctx["announced"].add(user)
+    elif kind == "LEAVE":
+        _, user = parts
+        fields = {"user": user}
+    elif kind == "WHO":
+        fields = {
+            "user": parts[1] if len(parts) > 1 else None,
+            "digest": parts[2] if len(parts) > 2 else None,
+            "sync": (parts[3], parts[4], int(parts[5])) if len(parts) >= 6 else None,
+        }
+    elif kind == "SEEN":
+        fields = {"seen": decode_seen(msg)}
+    else:
+        fields = None
+    return kind, fields
+
+
+## Vermerkt die angekündigten Fähigkeiten eines Peers.
+def learn_caps(ctx, name, caps):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param name: Nutzername des Absenders
+    @param caps: Fähigkeiten (Bitmaske)
+    @return: True, wenn sich die bekannten Fähigkeiten geändert haben
+    """
+    if name == ctx["nickname"] or ctx["caps"].get(name, 0) == caps:
+        return False
+    ctx["caps"][name] = caps
+    if name in ctx["peers"]:
+        peers_changed(ctx)
+    return True
+
+
+## Verarbeitet ein einzelnes Discovery-Datagramm (JOIN, HB, WHO, LEAVE, SEEN).
+def handle_datagram(ctx, kind, fields, addr):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param kind: Datagrammart aus parse_datagram
+    @param fields: Felder aus parse_datagram
+    @param addr: Absenderadresse (IP, Port)
+    @return: None
+    @throws ValueError: bei fehlerhaftem Aufbau
+    @throws OSError: wenn eine Antwort nicht gesendet werden kann
+    """
+    nickname = ctx["nickname"]
+    if kind == "JOIN":
+        user = fields["user"]
+        if user == nickname:
+            return
+        address = (addr[0], ctx["udp_port"])
+        changed = set_peer(ctx["peer_list"], user, (addr[0], fields["port"]))
+        heard(ctx, user)
+        if not changed:
+            # Bereits bekannt (z.B. Neustart oder unsere eigene JOIN-Antwort kommt zurück): kein JOIN,
+            # sonst antworten sich zwei Peers endlos. Der Heartbeat nennt Adresse und Fähigkeiten.
+            send_discovery(ctx, "HB", {"user": nickname, "port": ctx["tcp_port"]}, address)
+            return
+        peers_changed(ctx)
+        # Antwortet auf JOIN per Unicast (Bidirektional); die WHO-Folge sendet der Neue selbst.
+        send_join(ctx, address)
+        post(ctx["ui_queue"], EVENT_PEER, f"[Peer] {user} ist dem Chat beigetreten.", user=user)
+
+    elif kind == "HB":
+        user = fields["user"]
+        if user == nickname:
+            return
+        if set_peer(ctx["peer_list"], user, (addr[0], fields["port"])):
+            peers_changed(ctx)
+        heard(ctx, user)
+
+    elif kind == "WHO":
+        handle_who(ctx, fields, addr)
+
+    elif kind == "LEAVE":
+        user = fields["user"]
+        if user != nickname and remove_peer(ctx["peer_list"], user):
+            forget_peer(ctx, user)
+            peers_changed(ctx)
+        post(ctx["ui_queue"], EVENT_PEER, f"[Peer] {user} hat den Chat verlassen.", user=user)
+
+    elif kind == "SEEN":
+        handle_seen(ctx, *fields["seen"])
+
+
+## Beantwortet ein WHO mit einem Delta, der vollständigen Liste oder gar nicht.
+def handle_who(ctx, fields, addr):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param fields: Felder des WHO aus parse_datagram
+    @param addr: Absenderadresse (IP, Port)
+    @return: None
+    @throws ValueError: bei fehlerhaftem Aufbau
+    """
+    if fields["user"] == ctx["nickname"]:
+        # Eigenes WHO
+        return
+    if fields["user"] is None:
+        # Ältere Version: Sie versteht nur die Liste ohne Kopf und erwartet sie per Unicast
+        send_pages(ctx, encode_seen_legacy(ctx["peer_list"]), addr)
+        return
+    heard(ctx, fields["user"])
+    peer_list = ctx["peer_list"]
+    if fields["sync"] is not None and fields["sync"][0] == ctx["nickname"]:
+        _, epoch, since = fields["sync"]
+        if delta_available(peer_list, epoch, since):
+            # Wir sind der zuletzt genutzte Abgleichspartner: nur die Änderungen senden
+            send_seen(ctx, since)
+            return
+    if fields["digest"] == list_digest(peer_list):
+        # Der Fragende kennt bereits dieselbe Liste
+        return
+    schedule_reply(ctx)
+
+
+## Übernimmt eine Seite eines SEEN und wertet vollständige SEEN-Antworten aus.
+def handle_seen(ctx, header, additions, removals):
+    """
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param header: Kopf des SEEN (dict wie bei peer_sync.decode_seen)
+    @param additions: dict Name -> (IP, Port)
+    @param removals: Liste abgemeldeter Namen
+    @return: None
+    """
+    if header["sender"] == ctx["nickname"]:
+        return
+    legacy = header["mode"] == SEEN_LEGACY
+    if not legacy:
+        heard(ctx, header["sender"])
+    peer_list = ctx["peer_list"]
+    changed = False
+    for name, address in additions.items():
+        if legacy and name == ctx["nickname"]:
+            # Altes Format: enthält auch uns, mit der Adresse aus Sicht des Absenders
+            continue
+        changed = set_peer(peer_list, name, address) or changed
+        watch_peer(ctx, name)
+    for name in removals:
+        if name != ctx["nickname"] and remove_peer(peer_list, name):
+            forget_peer(ctx, name)
+            changed = True
+    if changed:
+        peers_changed(ctx)
+    if ctx["settle_timer"] is not None:
+        # Sammelphase verlängern: neues SEEN eingetroffen
+        ctx["last_seen"] = time.monotonic()
+        cancel_timer(ctx["settle_timer"])
+        ctx["settle_timer"] = call_later(ctx["timers"], SEEN_SETTLE, finish_who, ctx)
+    if legacy:
+        # Ohne Absender, Generation und Seiten: kein Abgleich, der für WHOs gemerkt werden kann
+        return
+
+    # Erst wenn alle Seiten angekommen sind, gilt das SEEN als vollständig
+    key = (header["sender"], header["epoch"], header["gen"], header["mode"], header["since"])
+    pages = ctx["partial"].setdefault(key, set())
+    pages.add(header["page"])
+    if len(pages) < header["pages"]:
+        if len(ctx["partial"]) > MAX_PARTIAL_SEEN:
+            del ctx["partial"][next(iter(ctx["partial"]))]
+        return
+    del ctx["partial"][key]
+    seen_complete(ctx, header)
+
+
+## Wertet ein vollständig empfangenes SEEN aus.
+def seen_complete(ctx, header):
+    """
+    Merkt sich Generation und Epoche des Absenders für das nächste WHO, beendet laufende
+    WHO-Wiederholungen und verwirft die eigene geplante Antwort, wenn der Absender
+    bereits dieselbe Liste verteilt hat.
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param header: Kopf des SEEN (dict aus peer_sync.decode_seen)
+    @return: None
+    """
+    sender, epoch = header["sender"], header["epoch"]
+    known = ctx["synced"].get(sender)
+    if header["mode"] == SEEN_FULL or (known is not None and known[0] == epoch and known[1] >= header["since"]):
+        ctx["synced"][sender] = (epoch, header["gen"])
+        ctx["sync_last"] = sender
+    stop_who(ctx)
+    if ctx["reply_timer"] is not None and header["digest"] == list_digest(ctx["peer_list"]):
+        cancel_timer(ctx["reply_timer"])
+        ctx["reply_timer"] = None
+
+
+## Beendet die SEEN-Sammelphase nach einem WHO aus dem CLI.
+def finish_who(ctx):
+    """
+    Meldet die Anzahl der bekannten Peers und die Zeit vom WHO bis zur letzten SEEN-Antwort
+    (Konvergenzzeit der Discovery).
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @return: None
+    """
+    ctx["settle_timer"] = None
+    count = len(ctx["peers"])
+    if ctx["last_seen"] is None:
+        post(ctx["ui_queue"], EVENT_SYSTEM, f"[System] Nutzerliste aktualisiert ({count} Nutzer, keine Antwort).",
+             peers=count, converge_ms=None)
+        return
+    converge_ms = (ctx["last_seen"] - ctx["who_started"]) * 1000
+    observe(ctx["metrics"], "who_converge_seconds", converge_ms / 1000)
+    post(ctx["ui_queue"], EVENT_SYSTEM,
+         f"[System] Nutzerliste aktualisiert ({count} Nutzer, letzte Antwort nach {converge_ms:.0f} ms).",
+         peers=count, converge_ms=converge_ms)
+
+
+## Arbeitet alle wartenden Kommandos aus dem CLI ab.
+def handle_commands(ctx, state, mask):
+    """
+    Kommandos sind Tupel (siehe protocol.py): (CMD_WHO,), (CMD_JOIN,), (CMD_LEAVE, name),
+    (CMD_PEERS,), (CMD_STATS,), (CMD_STOP,).
+
+    @param ctx: Laufzeitkontext des Discovery-Prozesses (dict)
+    @param state: (wake_sock, pending) aus queue_bridge
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
+    wake_sock, pending = state
+    drain_wakeups(wake_sock)
+    ui_queue, peers = ctx["ui_queue"], ctx["peers"]
+    while pending:
+        befehl = pending.popleft()
+        cmd = befehl[0]
+        if cmd == CMD_WHO:
+            # WHO-Folge senden, danach auf alle SEEN-Antworten warten
+            start_who(ctx)
+            ctx["who_started"], ctx["last_seen"] = time.monotonic(), None
+            if ctx["settle_timer"] is not None:
+                cancel_timer(ctx["settle_timer"])
+            ctx["settle_timer"] = call_later(ctx["timers"], SEEN_SETTLE, finish_who, ctx)
+            post(ui_queue, EVENT_SENT, "[System] WHO-Broadcast gesendet.")
+        elif cmd == CMD_JOIN:
+            send_join(ctx)
+            # Auch nach eigenem JOIN WHO wiederholen
+            start_who(ctx)
+            post(ui_queue, EVENT_SENT, "[System] JOIN gesendet.")
+        elif cmd == CMD_LEAVE:
+            send_discovery(ctx, "LEAVE", {"user": befehl[1]})
+            post(ui_queue, EVENT_SENT, "[System] LEAVE gesendet.")
+        elif cmd == CMD_STATS:
+            # Metriken sofort melden (Befehl "stats" im CLI)
+            report_metrics(ctx, force=True, reschedule=False)
+        elif cmd == CMD_STOP:
+            # Schleife nach diesem Durchlauf beenden (Programmende)
+            ctx["running"] = False
+            return
+        elif cmd == CMD_PEERS:
+            if peers:
+                post(ui_queue, EVENT_SYSTEM, "[Peers] Aktuelle Nutzer:")
+                for n, (ip, port) in peers.items():
+                    state = STATE_LABELS[ctx["states"].get(n, PEER_ALIVE)]
+                    post(ui_queue, EVENT_SYSTEM, f" - {n} @ {ip}:{port}{state}")
+            else:
+                post(ui_queue, EVENT_SYSTEM, "[Peers] Keine anderen Nutzer gefunden.")
@@ -0,0 +1,182 @@
+"""
+@file event_loop.py
+@brief Hilfsfunktionen für die ereignisgesteuerten Schleifen im Peer-to-Peer-Chat "Plauderkiste".
+
+Die Discovery- und Netzwerkprozesse warten mit selectors auf ihre Sockets. Eine
+multiprocessing.Queue lässt sich jedoch nicht direkt selektieren. Dieses Modul leitet
+deshalb die Queue-Einträge über einen Hintergrund-Thread und ein Socket-Paar weiter,
+sodass ein Kommando aus dem CLI die Schleife sofort aufweckt.
+
+Rechenintensive Arbeit (z.B. Prüfsummen großer Dateien) läuft in Hintergrund-Threads. Deren
+Ergebnisse werden über einen eigenen Weck-Socket (thread_channel) an die Schleife zurückgegeben
+und dort als Callback ausgeführt, sodass der Zustand nur von einem Thread verändert wird.
+
+Zeitgesteuerte Aufgaben (z.B. das Schließen untätiger Verbindungen) werden in einem Heap
+verwaltet. run_due_timers() liefert die Wartezeit bis zum nächsten Timer, die direkt als
+Timeout an selector.select() übergeben wird.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import collections
+import heapq
+import itertools
+import socket
+import threading
+import time
+
+## Laufende Nummer, damit gleichzeitig fällige Timer stabil sortiert werden.
+_timer_sequence = itertools.count()
+## Wartezeit in Sekunden, bevor queue_bridge bei voller deque erneut prüft.
+BRIDGE_POLL_INTERVAL = 0.01
+
+
+## Macht eine multiprocessing.Queue für selectors sichtbar.
+def queue_bridge(mp_queue, limit=None):
+    """
+    Startet einen Daemon-Thread, der blockierend auf die Queue wartet. Jeder Eintrag wird in
+    eine lokale deque gelegt und über ein Socket-Paar als Weck-Byte signalisiert.
+
+    Mit limit holt der Thread keine weiteren Einträge, solange so viele unverarbeitet in der
+    deque liegen. Eine begrenzte Queue füllt sich dann, und ihre Erzeuger warten (Gegendruck).
+
+    @param mp_queue: Queue, deren Einträge weitergeleitet werden (multiprocessing.Queue)
+    @param limit: Höchstzahl unverarbeiteter Einträge in der deque (None = unbegrenzt)
+    @return: (wake_sock, pending) – lesbarer Weck-Socket und deque mit den empfangenen Einträgen
+    """
+    reader, writer = socket.socketpair()
+    reader.setblocking(False)
+    writer.setblocking(False)
+    pending = collections.deque()
+
+    def forward():
+        while True:
+            while limit is not None and len(pending) >= limit:
+                time.sleep(BRIDGE_POLL_INTERVAL)
+            pending.append(mp_queue.get())
+            try:
+                writer.send(b"\0")
+            except BlockingIOError:
+                # Puffer voll: Es liegt ohnehin schon ein Weck-Byte an
+                pass
+            except OSError:
+                # Schleife wurde beendet und hat den Weck-Socket geschlossen
+                return
+
+    threading.Thread(target=forward, daemon=True).start()
+    return reader, pending
+
+
+## Leert den Weck-Socket, nachdem die Schleife aufgeweckt wurde.
+def drain_wakeups(wake_sock):
+    """
+    Liest alle anstehenden Weck-Bytes, damit der Socket erst beim nächsten Queue-Eintrag
+    wieder lesbar wird.
+
+    @param wake_sock: Von queue_bridge geliefertes Socket
+    @return: None
+    """
+    try:
+        while wake_sock.recv(4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+## Legt einen Rückkanal für Ergebnisse aus Hintergrund-Threads an.
+def thread_channel():
+    """
+    @return: (wake_sock, writer, results) – lesbarer Weck-Socket, Schreibseite und deque der Ergebnisse
+    """
+    reader, writer = socket.socketpair()
+    reader.setblocking(False)
+    writer.setblocking(False)
+    return reader, writer, collections.deque()
+
+
+## Führt eine Funktion in einem Hintergrund-Thread aus.
+def run_in_thread(channel, callback, func, *args):
+    """
+    Nach Abschluss wird callback(result, error) in der Ereignisschleife aufgerufen,
+    sobald run_thread_results für den Kanal ausgeführt wird.
+
+    @param channel: Von thread_channel gelieferter Rückkanal
+    @param callback: Funktion, die Ergebnis und ggf. Ausnahme erhält
+    @param func: Im Thread auszuführende Funktion
+    @param args: Argumente für func
+    @return: None
+    """
+    _, writer, results = channel
+
+    def work():
+        try:
+            results.append((callback, func(*args), None))
+        except Exception as e:
+            results.append((callback, None, e))
+        try:
+            writer.send(b"\0")
+        except BlockingIOError:
+            pass
+        except OSError:
+            # Schleife wurde inzwischen beendet
+            pass
+
+    threading.Thread(target=work, daemon=True).start()
+
+
+## Führt die Callbacks aller fertigen Hintergrund-Aufgaben aus.
+def run_thread_results(channel):
+    """
+    @param channel: Von thread_channel gelieferter Rückkanal
+    @return: None
+    """
+    wake_sock, _, results = channel
+    drain_wakeups(wake_sock)
+    while results:
+        callback, result, error = results.popleft()
+        callback(result, error)
+
+
+## Plant einen Funktionsaufruf nach einer Verzögerung ein.
+def call_later(timers, delay, callback, *args):
+    """
+    Legt einen Timer im Heap ab. Der Rückgabewert kann an cancel_timer übergeben werden.
+
+    @param timers: Heap (list) mit allen Timern der Schleife
+    @param delay: Verzögerung in Sekunden
+    @param callback: Aufzurufende Funktion
+    @param args: Argumente für callback
+    @return: Timer-Eintrag (list)
+    """
+    entry = [time.monotonic() + delay, next(_timer_sequence), callback, args]
+    heapq.heappush(timers, entry)
+    return entry
+
+
+## Entfernt einen geplanten Timer (ohne den Heap umzubauen).
+def cancel_timer(entry):
+    """
+    @param entry: Von call_later gelieferter Timer-Eintrag
+    @return: None
+    """
+    entry[2] = None
+
+
+## Führt alle fälligen Timer aus.
+def run_due_timers(timers):
+    """
+    Ruft alle Timer auf, deren Zeitpunkt erreicht ist.
+
+    @param timers: Heap (list) mit allen Timern der Schleife
+    @return: Sekunden bis zum nächsten Timer oder None, wenn keiner geplant ist
+    """
+    while timers:
+        when, _, callback, args = timers[0]
+        now = time.monotonic()
+        if when > now:
+            return when - now
+        heapq.heappop(timers)
+        if callback is not None:
+            callback(*args)
+    return None
@@ -0,0 +1,143 @@
+"""
+@file events.py
+@brief Ereignisse für die Benutzeroberfläche im Peer-to-Peer-Chat "Plauderkiste".
+
+Discovery- und Netzwerkprozess melden alles, was angezeigt werden soll, über die ui_queue.
+Jeder Eintrag ist ein Tupel (kind, text, meta):
+
+ - kind: Art des Ereignisses (EVENT_*), bestimmt Farbe und Verarbeitung im UI
+ - text: Fertig formulierte Anzeigezeile
+ - meta: Dictionary mit strukturierten Zusatzdaten (z.B. sender, filename)
+
+Das UI muss den Text dadurch nicht mehr auswerten, um Nachrichten zu erkennen oder einzufärben.
+
+Die ui_queue ist begrenzt (flow_control.UI_QUEUE_LIMIT). Ein Dienstprozess meldet sich mit
+attach_outbox an; post() legt Ereignisse dann über einen Ausgangspuffer ab, der bei voller Queue
+je Art eine Überlaufstrategie anwendet (EVENT_POLICIES) und nie blockiert. Die Schleife des
+Dienstes ruft flush_events regelmäßig auf. Sendeergebnisse und Startmeldungen
+(UNDROPPABLE_META) werden nie verworfen oder zusammengefasst.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+from flow_control import POLICY_BLOCK, POLICY_COALESCE, POLICY_DROP_OLDEST
+from flow_control import new_outbox, offer, flush_outbox, outbox_congested, release_repeats
+
+## Allgemeine Systemmeldung (meta beim Start eines Dienstes: ready mit "discovery" bzw. "network").
+EVENT_SYSTEM = "system"
+## Bestätigung, dass etwas gesendet wurde (meta: recipient bzw. label, ref des Sendekommandos).
+EVENT_SENT = "sent"
+## Eingegangene Textnachricht (meta: sender, body).
+EVENT_MESSAGE = "message"
+## Bildübertragung (meta beim Empfang: sender, filename, size).
+EVENT_IMAGE = "image"
+## Ein Peer ist beigetreten, hat den Chat verlassen oder ist (wieder) erreichbar bzw. offline (meta: user).
+EVENT_PEER = "peer"
+## Warnung, z.B. unbekannter Empfänger.
+EVENT_WARNING = "warning"
+## Fehlermeldung.
+EVENT_ERROR = "error"
+## Metriken eines Prozesses, werden nicht angezeigt (meta: process, metrics – siehe metrics.py).
+EVENT_METRICS = "metrics"
+
+## Überlaufstrategie je Ereignisart; Nachrichten und Sendeergebnisse gehen nie verloren.
+EVENT_POLICIES = {
+    EVENT_SYSTEM: POLICY_COALESCE,
+    EVENT_PEER: POLICY_COALESCE,
+    EVENT_WARNING: POLICY_COALESCE,
+    EVENT_ERROR: POLICY_COALESCE,
+    EVENT_METRICS: POLICY_DROP_OLDEST,
+    EVENT_SENT: POLICY_BLOCK,
+    EVENT_MESSAGE: POLICY_BLOCK,
+    EVENT_IMAGE: POLICY_BLOCK,
+}
+
+## Ereignisse mit einem dieser meta-Schlüssel (Sendeergebnisse, Startmeldungen) gehen nie verloren.
+UNDROPPABLE_META = {"ref", "refs", "ready"}
+## Ausgangspuffer der Queues, für die sich dieser Prozess angemeldet hat (id(queue) -> Puffer).
+_outboxes = {}
+
+
+## Legt ein Ereignis in die Queue der Benutzeroberfläche.
+def post(ui_queue, kind, text, **meta):
+    """
+    @param ui_queue: Queue der Benutzeroberfläche (multiprocessing.Queue)
+    @param kind: Art des Ereignisses (EVENT_*)
+    @param text: Anzeigetext
+    @param meta: Zusätzliche Daten als Schlüsselwortargumente
+    @return: None
+    """
+    outbox = _outboxes.get(id(ui_queue))
+    if outbox is None:
+        ui_queue.put((kind, text, meta))
+        return
+    policy = POLICY_BLOCK if meta.keys() & UNDROPPABLE_META else None
+    offer(outbox, (kind, text, meta), policy)
+
+
+## Meldet den Prozess als Erzeuger einer begrenzten UI-Queue an.
+def attach_outbox(ui_queue):
+    """
+    @param ui_queue: Queue der Benutzeroberfläche (multiprocessing.Queue mit maxsize)
+    @return: Ausgangspuffer (dict, siehe flow_control.new_outbox)
+    """
+    outbox = _outboxes[id(ui_queue)] = new_outbox(ui_queue, EVENT_POLICIES)
+    return outbox
+
+
+## Reicht wartende Ereignisse an die UI-Queue weiter.
+def flush_events(ui_queue):
+    """
+    Wurden seit der letzten Warnung Ereignisse verworfen, folgt eine Warnung, sobald der Puffer
+    wieder leer ist.
+
+    @param ui_queue: Queue der Benutzeroberfläche
+    @return: Anzahl noch wartender Ereignisse (ausstehende Zusammenfassungen zählen mit)
+    """
+    outbox = _outboxes.get(id(ui_queue))
+    if outbox is None:
+        return 0
+    waiting = flush_outbox(outbox)
+    dropped = sum(outbox["dropped"].values())
+    if not waiting and dropped > outbox["reported"]:
+        count, outbox["reported"] = dropped - outbox["reported"], dropped
+        post(ui_queue, EVENT_WARNING, f"[Warnung] {count} Meldungen verworfen, die Anzeige kam nicht hinterher.",
+             dropped=count)
+        waiting = len(outbox["backlog"])
+    return waiting + (1 if outbox["repeats"] else 0)
+
+
+## Prüft, ob die UI-Queue so weit im Rückstand ist, dass Erzeuger gebremst werden sollen.
+def events_congested(ui_queue):
+    """
+    @param ui_queue: Queue der Benutzeroberfläche
+    @return: True, wenn der Ausgangspuffer voll ist
+    """
+    outbox = _outboxes.get(id(ui_queue))
+    return outbox is not None and outbox_congested(outbox)
+
+
+## Zählerstände des Ausgangspuffers für die Metriken.
+def outbox_stats(ui_queue):
+    """
+    @param ui_queue: Queue der Benutzeroberfläche
+    @return: (verworfen je Art als dict, zusammengefasste Wiederholungen, wartende Ereignisse)
+    """
+    outbox = _outboxes.get(id(ui_queue))
+    if outbox is None:
+        return {}, 0, 0
+    return dict(outbox["dropped"]), outbox["coalesced"], len(outbox["backlog"])
+
+
+## Übergibt beim Beenden alle wartenden Ereignisse und meldet den Prozess ab.
+def close_outbox(ui_queue, timeout=1.0):
+    """
+    @param ui_queue: Queue der Benutzeroberfläche
+    @param timeout: Sekunden, die pro Ereignis auf Platz in der Queue gewartet wird
+    @return: None
+    """
+    outbox = _outboxes.pop(id(ui_queue), None)
+    if outbox is not None:
+        release_repeats(outbox)
+        flush_outbox(outbox, timeout)
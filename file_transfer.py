@@ -0,0 +1,165 @@
+"""
+@file file_transfer.py
+@brief Hilfsfunktionen für die blockweise, fortsetzbare Dateiübertragung im Peer-to-Peer-Chat "Plauderkiste".
+
+Eine Datei wird in Blöcke fester Größe (Chunks) zerlegt. Für jeden Block wird eine Prüfsumme
+berechnet; alle Prüfsummen bilden zusammen das Manifest. Aus dem Manifest ergibt sich die
+Transfer-ID, sodass eine erneut gesendete, unveränderte Datei wiedererkannt wird.
+
+Der Empfänger schreibt die Blöcke in eine Teildatei (".<id>.part") und vermerkt jeden geprüften
+Block in einer Statusdatei (".<id>.state"). Bricht die Verbindung ab, werden beim nächsten
+Versuch nur noch die fehlenden Blöcke angefordert.
+
+Das eigentliche Protokoll (OFFER, NEED, CHUNK, ACK) ist in network_comm.py umgesetzt.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import hashlib
+import os
+import struct
+
+## Größe eines Übertragungsblocks in Bytes.
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+## Format eines Eintrags in der Statusdatei (Index eines geprüften Blocks).
+STATE_ENTRY = struct.Struct("!I")
+
+
+## Erzeugt ein neues Prüfsummenobjekt für einen Block.
+def chunk_hasher():
+    """
+    SHA-256 ist auf aktuellen CPUs hardwarebeschleunigt und damit schneller als BLAKE2b.
+
+    @return: hashlib-Objekt (SHA-256)
+    """
+    return hashlib.sha256()
+
+
+## Berechnet das Manifest (Größe, Blockgröße, Prüfsummen) einer Datei.
+def build_manifest(path, chunk_size=TRANSFER_CHUNK_SIZE):
+    """
+    Liest die Datei blockweise und berechnet für jeden Block die Prüfsumme.
+    hashlib gibt dabei den GIL frei, die Funktion kann also in einem Hintergrund-Thread laufen.
+
+    @param path: Pfad der zu sendenden Datei
+    @param chunk_size: Blockgröße in Bytes
+    @return: Manifest (dict) mit id, size, chunk_size und hashes (Liste von Hex-Strings)
+    """
+    hashes = []
+    size = 0
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h = chunk_hasher()
+            h.update(view[:n])
+            hashes.append(h.hexdigest())
+            size += n
+    manifest = {"size": size, "chunk_size": chunk_size, "hashes": hashes}
+    manifest["id"] = transfer_id(manifest)
+    return manifest
+
+
+## Leitet die Transfer-ID aus einem Manifest ab.
+def transfer_id(manifest):
+    """
+    @param manifest: Manifest (dict) mit size, chunk_size und hashes
+    @return: ID als Hex-String
+    """
+    h = hashlib.sha256()
+    h.update(f"{manifest['size']}:{manifest['chunk_size']}:".encode())
+    h.update("".join(manifest["hashes"]).encode())
+    return h.hexdigest()[:32]
+
+
+## Prüft, ob eine Datei genau den Inhalt eines Manifests hat.
+def verify_file(path, manifest):
+    """
+    Liest die Datei blockweise wie build_manifest und bricht beim ersten abweichenden Block ab.
+    Kann wie build_manifest in einem Hintergrund-Thread laufen.
+
+    @param path: Pfad der Datei
+    @param manifest: Geprüftes Manifest (dict)
+    @return: True, wenn Größe und alle Blockprüfsummen übereinstimmen
+    @throws OSError: wenn die Datei nicht gelesen werden kann
+    """
+    buf = bytearray(min(manifest["chunk_size"], manifest["size"]))
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        for index, expected in enumerate(manifest["hashes"]):
+            length = chunk_length(manifest, index)
+            if f.readinto(view[:length]) != length:
+                return False
+            h = chunk_hasher()
+            h.update(view[:length])
+            if h.hexdigest() != expected:
+                return False
+        return not f.read(1)
+
+
+## Prüft, ob ein empfangenes Manifest in sich stimmig ist.
+def manifest_valid(manifest):
+    """
+    @param manifest: Manifest (dict) aus einem OFFER-Frame
+    @return: True, wenn Größe, Blockanzahl und ID zueinander passen
+    """
+    try:
+        size, chunk_size, hashes = manifest["size"], manifest["chunk_size"], manifest["hashes"]
+        if size < 0 or chunk_size <= 0 or len(hashes) != -(-size // chunk_size):
+            return False
+        return manifest["id"] == transfer_id(manifest)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+## Länge eines bestimmten Blocks (der letzte Block ist meist kürzer).
+def chunk_length(manifest, index):
+    """
+    @param manifest: Manifest (dict)
+    @param index: Blocknummer
+    @return: Länge des Blocks in Bytes
+    """
+    return min(manifest["chunk_size"], manifest["size"] - index * manifest["chunk_size"])
+
+
+## Pfade der Teil- und Statusdatei eines Transfers im Bildordner.
+def resume_paths(image_folder, manifest):
+    """
+    @param image_folder: Zielordner für empfangene Bilder
+    @param manifest: Manifest (dict)
+    @return: (part_path, state_path)
+    """
+    base = os.path.join(image_folder, f".{manifest['id']}")
+    return base + ".part", base + ".state"
+
+
+## Liest die bereits geprüften Blöcke aus der Statusdatei.
+def load_verified(state_path, block_count):
+    """
+    Ein unvollständiger letzter Eintrag (z.B. nach einem Absturz beim Schreiben) wird ignoriert.
+
+    @param state_path: Pfad der Statusdatei
+    @param block_count: Anzahl Blöcke laut Manifest
+    @return: set mit den Indizes der geprüften Blöcke
+    """
+    try:
+        with open(state_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return set()
+    usable = len(data) - len(data) % STATE_ENTRY.size
+    return {index for (index,) in STATE_ENTRY.iter_unpack(data[:usable]) if index < block_count}
+
+
+## Vermerkt einen geprüften Block in der Statusdatei.
+def record_verified(state_file, index):
+    """
+    @param state_file: Im Anhängemodus geöffnete Statusdatei (ungepuffert)
+    @param index: Index des geprüften Blocks
+    @return: None
+    """
+    state_file.write(STATE_ENTRY.pack(index))
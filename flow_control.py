@@ -0,0 +1,251 @@
+"""
+@file flow_control.py
+@brief Flusskontrolle gegen Nachrichtenfluten im Peer-to-Peer-Chat "Plauderkiste".
+
+Alle Queues zwischen den Prozessen sind begrenzt. Was passiert, wenn eine Queue voll ist,
+legt eine Überlaufstrategie fest:
+
+ - POLICY_BLOCK: Nichts geht verloren. Kommandos an Discovery und Netzwerk warten beim Einreihen
+   (der Aufrufer blockiert); Chatnachrichten und Sendeergebnisse für das UI bleiben im
+   Ausgangspuffer, und der Netzwerkprozess liest so lange nichts mehr von den Peers
+   (TCP-Gegendruck bis zum Absender), bis das UI aufgeholt hat.
+ - POLICY_DROP_OLDEST: Ist der Ausgangspuffer voll, fällt der älteste verwerfbare Eintrag heraus
+   (z.B. veraltete Metriken).
+ - POLICY_COALESCE: Wiederholt sich dieselbe Meldung innerhalb von COALESCE_WINDOW Sekunden,
+   wird sie nur einmal angezeigt und danach mit der Anzahl der Wiederholungen zusammengefasst.
+   Solche Meldungen dürfen bei vollem Puffer ebenfalls verworfen werden.
+
+Der Ausgangspuffer (new_outbox) liegt im erzeugenden Prozess vor der multiprocessing.Queue:
+Ereignisse werden mit put_nowait weitergereicht, was nicht passt, wartet im Puffer. So blockiert
+die Ereignisschleife eines Dienstes nie auf ein langsames Terminal. Verworfene und
+zusammengefasste Einträge werden gezählt und als Metriken angezeigt.
+
+Für eingehende Verbindungen gibt es Token-Buckets (new_limiter): pro Absender-IP für neue
+Verbindungen und pro Peer für Nachrichten. Ein leerer Bucket lehnt Verbindungen ab bzw. hält das
+Lesen der Verbindung an, bis wieder ein Token verfügbar ist.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import collections
+import queue
+import time
+
+## Überlaufstrategie: nie verwerfen, Erzeuger wartet bzw. wird gebremst.
+POLICY_BLOCK = "block"
+## Überlaufstrategie: bei vollem Puffer den ältesten Eintrag verwerfen.
+POLICY_DROP_OLDEST = "drop_oldest"
+## Überlaufstrategie: wiederholte Meldungen zusammenfassen (und bei vollem Puffer verwerfen).
+POLICY_COALESCE = "coalesce"
+## Höchstzahl an Einträgen in der UI-Queue (multiprocessing.Queue).
+UI_QUEUE_LIMIT = 5000
+## Höchstzahl an Kommandos in net_queue bzw. disc_queue; weitere Aufrufer warten.
+COMMAND_QUEUE_LIMIT = 2000
+## Höchstzahl an Einträgen im Ausgangspuffer eines Prozesses vor der UI-Queue.
+OUTBOX_LIMIT = 5000
+## Höchste Wartezeit der Dienstschleifen in Sekunden, solange Ereignisse im Ausgangspuffer warten.
+FLUSH_INTERVAL = 0.02
+## Zeitfenster in Sekunden, in dem gleiche Meldungen zusammengefasst werden.
+COALESCE_WINDOW = 2.0
+## Höchstzahl an Buckets eines Limiters (älteste werden verworfen, Schutz bei vielen Absendern).
+LIMITER_KEYS = 4096
+
+
+## Legt einen Token-Bucket an.
+def new_bucket(rate, burst):
+    """
+    @param rate: Neue Tokens pro Sekunde
+    @param burst: Höchstzahl an Tokens (erlaubte Spitze)
+    @return: Bucket (dict), anfangs voll
+    """
+    return {"rate": rate, "burst": burst, "tokens": float(burst), "stamp": time.monotonic()}
+
+
+## Entnimmt Tokens, falls genug vorhanden sind.
+def take_token(bucket, now=None, cost=1):
+    """
+    @param bucket: Bucket aus new_bucket
+    @param now: Aktuelle Zeit (time.monotonic), optional
+    @param cost: Benötigte Tokens (höchstens burst, damit auch große Einheiten durchkommen)
+    @return: True, wenn die Tokens entnommen wurden
+    """
+    now = time.monotonic() if now is None else now
+    bucket["tokens"] = min(bucket["burst"], bucket["tokens"] + (now - bucket["stamp"]) * bucket["rate"])
+    bucket["stamp"] = now
+    cost = min(cost, bucket["burst"])
+    if bucket["tokens"] >= cost:
+        bucket["tokens"] -= cost
+        return True
+    return False
+
+
+## Zeit, bis wieder genug Tokens verfügbar sind.
+def token_wait(bucket, cost=1):
+    """
+    @param bucket: Bucket aus new_bucket (nach einem erfolglosen take_token)
+    @param cost: Benötigte Tokens
+    @return: Wartezeit in Sekunden
+    """
+    return max(0.0, (min(cost, bucket["burst"]) - bucket["tokens"]) / bucket["rate"])
+
+
+## Legt einen Limiter mit je einem Token-Bucket pro Schlüssel an.
+def new_limiter(rate, burst, max_keys=LIMITER_KEYS):
+    """
+    @param rate: Tokens pro Sekunde und Schlüssel (0 schaltet die Begrenzung ab)
+    @param burst: Höchstzahl an Tokens pro Schlüssel
+    @param max_keys: Höchstzahl gleichzeitig verwalteter Schlüssel
+    @return: Limiter (dict)
+    """
+    return {"rate": rate, "burst": burst, "max_keys": max_keys, "buckets": collections.OrderedDict()}
+
+
+## Liefert den Bucket eines Schlüssels (legt ihn bei Bedarf an).
+def limiter_bucket(limiter, key):
+    """
+    @param limiter: Limiter aus new_limiter
+    @param key: Schlüssel, z.B. IP-Adresse oder (IP, Nutzername)
+    @return: Bucket (dict)
+    """
+    buckets = limiter["buckets"]
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = buckets[key] = new_bucket(limiter["rate"], limiter["burst"])
+        if len(buckets) > limiter["max_keys"]:
+            buckets.popitem(last=False)
+    else:
+        buckets.move_to_end(key)
+    return bucket
+
+
+## Prüft, ob ein Schlüssel gerade ein Token bekommt.
+def allow(limiter, key, now=None):
+    """
+    @param limiter: Limiter aus new_limiter
+    @param key: Schlüssel
+    @param now: Aktuelle Zeit (time.monotonic), optional
+    @return: True, wenn erlaubt (immer True, wenn die Begrenzung abgeschaltet ist)
+    """
+    if limiter["rate"] <= 0:
+        return True
+    return take_token(limiter_bucket(limiter, key), now)
+
+
+## Legt einen Ausgangspuffer vor einer begrenzten multiprocessing.Queue an.
+def new_outbox(target, policies, limit=OUTBOX_LIMIT):
+    """
+    Einträge mit POLICY_BLOCK zählen nicht gegen limit; sie bremsen stattdessen den Erzeuger
+    (outbox_congested).
+
+    @param target: Begrenzte Queue (multiprocessing.Queue mit maxsize)
+    @param policies: dict Art -> Überlaufstrategie; fehlende Arten gelten als POLICY_BLOCK
+    @param limit: Höchstzahl verwerfbarer Einträge im Puffer
+    @return: Ausgangspuffer (dict)
+    """
+    return {
+        "target": target, "policies": policies, "limit": limit,
+        "backlog": collections.deque(),   # (Strategie, Eintrag)
+        "droppable": 0,                    # Einträge im Puffer, die nicht POLICY_BLOCK haben
+        "dropped": collections.Counter(),  # Art -> verworfene Einträge
+        "reported": 0,                     # Verworfene Einträge, die schon gemeldet wurden
+        "coalesced": 0,                    # Zusammengefasste Wiederholungen
+        "last": None,                      # (Art, Text) der letzten zusammenfassbaren Meldung
+        "last_time": 0.0,
+        "repeats": 0,                      # Noch nicht gemeldete Wiederholungen von last
+    }
+
+
+## Reiht ein Ereignis (kind, text, meta) nach seiner Überlaufstrategie ein.
+def offer(outbox, event, policy=None):
+    """
+    @param outbox: Ausgangspuffer aus new_outbox
+    @param event: Tupel (kind, text, meta)
+    @param policy: Strategie für diesen Eintrag (Standard: nach Art aus outbox["policies"])
+    @return: None
+    """
+    kind, text, meta = event
+    if policy is None:
+        policy = outbox["policies"].get(kind, POLICY_BLOCK)
+    if policy == POLICY_COALESCE:
+        now = time.monotonic()
+        if outbox["last"] == (kind, text) and now - outbox["last_time"] < COALESCE_WINDOW:
+            outbox["repeats"] += 1
+            outbox["coalesced"] += 1
+            return
+        release_repeats(outbox)
+        outbox["last"], outbox["last_time"] = (kind, text), now
+    outbox["backlog"].append((policy, event))
+    if policy != POLICY_BLOCK:
+        outbox["droppable"] += 1
+    flush_outbox(outbox)
+    if outbox["droppable"] > outbox["limit"]:
+        drop_oldest(outbox)
+
+
+## Meldet die zusammengefassten Wiederholungen der letzten Meldung als eigenen Eintrag.
+def release_repeats(outbox):
+    """
+    @param outbox: Ausgangspuffer aus new_outbox
+    @return: None
+    """
+    if outbox["repeats"]:
+        kind, text = outbox["last"]
+        outbox["backlog"].append((POLICY_COALESCE, (kind, f"{text} ({outbox['repeats']}× wiederholt)",
+                                                    {"repeats": outbox["repeats"]})))
+        outbox["droppable"] += 1
+        outbox["repeats"] = 0
+    outbox["last"] = None
+
+
+## Verwirft den ältesten verwerfbaren Eintrag des Puffers.
+def drop_oldest(outbox):
+    """
+    Einträge mit POLICY_BLOCK werden nie verworfen.
+
+    @param outbox: Ausgangspuffer aus new_outbox
+    @return: True, wenn ein Eintrag verworfen wurde
+    """
+    if not outbox["droppable"]:
+        # Nur wartende POLICY_BLOCK-Einträge: nichts zu durchsuchen
+        return False
+    backlog = outbox["backlog"]
+    for i, (policy, event) in enumerate(backlog):
+        if policy != POLICY_BLOCK:
+            del backlog[i]
+            outbox["droppable"] -= 1
+            outbox["dropped"][event[0]] += 1
+            return True
+    return False
+
+
+## Reicht wartende Einträge an die Queue weiter, solange sie Platz hat.
+def flush_outbox(outbox, timeout=None):
+    """
+    @param outbox: Ausgangspuffer aus new_outbox
+    @param timeout: None: nicht warten; sonst Sekunden, die pro Eintrag auf Platz gewartet wird
+    @return: Anzahl der Einträge, die noch im Puffer warten
+    """
+    if outbox["repeats"] and time.monotonic() - outbox["last_time"] >= COALESCE_WINDOW:
+        release_repeats(outbox)
+    backlog, target = outbox["backlog"], outbox["target"]
+    while backlog:
+        try:
+            if timeout is None:
+                target.put_nowait(backlog[0][1])
+            else:
+                target.put(backlog[0][1], timeout=timeout)
+        except queue.Full:
+            break
+        if backlog.popleft()[0] != POLICY_BLOCK:
+            outbox["droppable"] -= 1
+    return len(backlog)
+
+
+## Prüft, ob der Puffer so voll ist, dass Erzeuger gebremst werden sollen.
+def outbox_congested(outbox):
+    """
+    @param outbox: Ausgangspuffer aus new_outbox
+    @return: True, wenn mindestens limit Einträge warten (verwerfbare und POLICY_BLOCK)
+    """
+    return len(outbox["backlog"]) >= outbox["limit"]
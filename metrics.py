@@ -0,0 +1,282 @@
+"""
+@file metrics.py
+@brief Laufzeitmetriken (Zähler, Messwerte, Latenz-Histogramme) für den Peer-to-Peer-Chat "Plauderkiste".
+
+Jeder Prozess (Discovery, Netzwerk, CLI) führt seine Metriken in einem eigenen Dictionary, das
+nur er selbst verändert. Das Erfassen kostet damit nur einen Dictionary-Zugriff:
+
+ - Zähler (inc): stetig wachsende Summen, z.B. gesendete Bytes
+ - Messwerte (set_gauge): aktueller Stand, z.B. offene Verbindungen
+ - Histogramme (observe): Verteilung von Zeiten in festen Klassen (HISTOGRAM_BUCKETS)
+
+Jede Metrik hat einen Namen und optionale Labels (z.B. peer="Hulk"). Discovery- und
+Netzwerkprozess schicken regelmäßig (und auf Anfrage mit dem Kommando STATS) eine Kopie ihrer
+Metriken als Ereignis EVENT_METRICS an die Benutzeroberfläche, aber nur, wenn sich seit der
+letzten Meldung etwas geändert hat. Das CLI fasst die Kopien aller Prozesse zusammen, zeigt sie
+mit dem Befehl "stats" an und exportiert sie im Prometheus-Textformat in eine Datei
+("metricsfile" in der Konfiguration) bzw. über einen HTTP-Endpunkt auf dem Loopback-Interface
+("metricsport", abrufbar unter http://127.0.0.1:<port>/metrics).
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import bisect
+import os
+import socket
+import threading
+from events import post, outbox_stats, EVENT_METRICS
+
+## Obergrenzen der Histogramm-Klassen in Sekunden (dazu kommt eine Klasse für alles darüber).
+HISTOGRAM_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+## Präfix aller Metriknamen im Prometheus-Export.
+PROMETHEUS_PREFIX = "plauderkiste_"
+## Abstand in Sekunden, in dem Discovery und Netzwerk ihre Metriken melden.
+METRICS_INTERVAL = 5
+
+
+## Legt die Metriken eines Prozesses an.
+def new_metrics(process):
+    """
+    @param process: Name des Prozesses (z.B. "network"), erscheint im Export als Label
+    @return: Metriken (dict)
+    """
+    return {"process": process, "counters": {}, "gauges": {}, "histograms": {}, "published": None}
+
+
+## Erhöht einen Zähler.
+def inc(metrics, name, value=1, **labels):
+    """
+    @param metrics: Metriken aus new_metrics
+    @param name: Name des Zählers (Konvention: Endung _total)
+    @param value: Betrag
+    @param labels: Labels als Schlüsselwortargumente
+    @return: None
+    """
+    key = (name, tuple(sorted(labels.items())))
+    counters = metrics["counters"]
+    counters[key] = counters.get(key, 0) + value
+
+
+## Setzt einen Messwert.
+def set_gauge(metrics, name, value, **labels):
+    """
+    @param metrics: Metriken aus new_metrics
+    @param name: Name des Messwerts
+    @param value: Aktueller Wert
+    @param labels: Labels als Schlüsselwortargumente
+    @return: None
+    """
+    metrics["gauges"][(name, tuple(sorted(labels.items())))] = value
+
+
+## Trägt eine Dauer in ein Histogramm ein.
+def observe(metrics, name, seconds, **labels):
+    """
+    Ein Histogramm ist eine Liste: Anzahl je Klasse (HISTOGRAM_BUCKETS und darüber), danach
+    Summe und Anzahl aller Werte.
+
+    @param metrics: Metriken aus new_metrics
+    @param name: Name des Histogramms (Konvention: Endung _seconds)
+    @param seconds: Gemessene Dauer
+    @param labels: Labels als Schlüsselwortargumente
+    @return: None
+    """
+    key = (name, tuple(sorted(labels.items())))
+    hist = metrics["histograms"].get(key)
+    if hist is None:
+        hist = metrics["histograms"][key] = [0] * (len(HISTOGRAM_BUCKETS) + 1) + [0.0, 0]
+    hist[bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+    hist[-2] += seconds
+    hist[-1] += 1
+
+
+## Erstellt eine unveränderliche Kopie der Metriken (z.B. zum Versand an das CLI).
+def snapshot(metrics):
+    """
+    @param metrics: Metriken aus new_metrics
+    @return: dict mit counters, gauges und histograms
+    """
+    return {
+        "counters": dict(metrics["counters"]),
+        "gauges": dict(metrics["gauges"]),
+        "histograms": {key: list(hist) for key, hist in dict(metrics["histograms"]).items()},
+    }
+
+
+## Meldet die Metriken an die Benutzeroberfläche, falls sie sich geändert haben.
+def publish(metrics, ui_queue, force=False):
+    """
+    @param metrics: Metriken aus new_metrics
+    @param ui_queue: Queue der Benutzeroberfläche
+    @param force: True, um auch unveränderte Metriken zu melden (Kommando STATS)
+    @return: None
+    """
+    record_outbox(metrics, ui_queue)
+    current = snapshot(metrics)
+    if force or current != metrics["published"]:
+        metrics["published"] = current
+        post(ui_queue, EVENT_METRICS, "", process=metrics["process"], metrics=current)
+
+
+## Übernimmt die Zähler des Ausgangspuffers vor der UI-Queue (siehe events.attach_outbox).
+def record_outbox(metrics, ui_queue):
+    """
+    @param metrics: Metriken aus new_metrics
+    @param ui_queue: Queue der Benutzeroberfläche
+    @return: None
+    """
+    dropped, coalesced, waiting = outbox_stats(ui_queue)
+    for kind, count in dropped.items():
+        metrics["counters"][("events_dropped_total", (("kind", kind),))] = count
+    if coalesced:
+        metrics["counters"][("events_coalesced_total", ())] = coalesced
+    set_gauge(metrics, "event_backlog", waiting)
+
+
+## Schätzt ein Quantil eines Histogramms (Obergrenze der Klasse, in die es fällt).
+def histogram_quantile(hist, q):
+    """
+    @param hist: Histogramm (Liste wie in observe)
+    @param q: Quantil zwischen 0 und 1
+    @return: Obergrenze in Sekunden oder None, wenn das Quantil über der letzten Klasse liegt
+    """
+    target = q * hist[-1]
+    seen = 0
+    for bound, count in zip(HISTOGRAM_BUCKETS, hist):
+        seen += count
+        if seen >= target:
+            return bound
+    return None
+
+
+## Formatiert Labels für den Prometheus-Export.
+def format_labels(process, labels, extra=()):
+    """
+    @param process: Name des Prozesses
+    @param labels: Labels der Metrik als Tupel von (Name, Wert)
+    @param extra: Zusätzliche Labels (z.B. le bei Histogrammen)
+    @return: Text wie {process="network",peer="Hulk"}
+    """
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    pairs = (("process", process),) + tuple(labels) + tuple(extra)
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+## Erzeugt den Prometheus-Textexport aus den Metriken mehrerer Prozesse.
+def render_prometheus(snapshots):
+    """
+    @param snapshots: dict Prozessname -> Kopie aus snapshot()
+    @return: Text im Prometheus-Format (text/plain; version=0.0.4)
+    """
+    families = {}
+
+    def family(name, kind):
+        return families.setdefault(name, (kind, []))[1]
+
+    for process, snap in sorted(snapshots.items()):
+        for (name, labels), value in sorted(snap["counters"].items()):
+            family(name, "counter").append(f"{PROMETHEUS_PREFIX}{name}{format_labels(process, labels)} {value}")
+        for (name, labels), value in sorted(snap["gauges"].items()):
+            family(name, "gauge").append(f"{PROMETHEUS_PREFIX}{name}{format_labels(process, labels)} {value}")
+        for (name, labels), hist in sorted(snap["histograms"].items()):
+            lines = family(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BUCKETS + ("+Inf",), hist):
+                cumulative += count
+                le = format_labels(process, labels, (("le", bound),))
+                lines.append(f"{PROMETHEUS_PREFIX}{name}_bucket{le} {cumulative}")
+            lines.append(f"{PROMETHEUS_PREFIX}{name}_sum{format_labels(process, labels)} {hist[-2]}")
+            lines.append(f"{PROMETHEUS_PREFIX}{name}_count{format_labels(process, labels)} {hist[-1]}")
+    out = []
+    for name in sorted(families):
+        kind, lines = families[name]
+        out.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+## Formatiert die Metriken mehrerer Prozesse als lesbare Zeilen (Befehl "stats").
+def format_stats(snapshots):
+    """
+    @param snapshots: dict Prozessname -> Kopie aus snapshot()
+    @return: Liste von Textzeilen
+    """
+    def label_text(labels):
+        return "{" + ", ".join(f"{k}={v}" for k, v in labels) + "}" if labels else ""
+
+    def ms(seconds):
+        return "> 5 s" if seconds is None else f"{seconds * 1000:g} ms"
+
+    lines = []
+    for process, snap in sorted(snapshots.items()):
+        lines.append(f"[{process}]")
+        for (name, labels), value in sorted({**snap["counters"], **snap["gauges"]}.items()):
+            lines.append(f"  {name}{label_text(labels)} = {value:g}")
+        for (name, labels), hist in sorted(snap["histograms"].items()):
+            if hist[-1]:
+                lines.append(
+                    f"  {name}{label_text(labels)}: n={hist[-1]}, Ø {hist[-2] / hist[-1] * 1000:.2f} ms, "
+                    f"p50 ≤ {ms(histogram_quantile(hist, 0.5))}, p99 ≤ {ms(histogram_quantile(hist, 0.99))}")
+    return lines
+
+
+## Schreibt den Prometheus-Export atomar in eine Datei.
+def write_prometheus_file(path, text):
+    """
+    Die Datei wird erst vollständig geschrieben und dann umbenannt, sodass ein Leser
+    (z.B. der Textfile-Collector des node_exporter) nie eine halbe Datei sieht.
+
+    @param path: Zielpfad
+    @param text: Inhalt aus render_prometheus
+    @return: None
+    """
+    temp = path + ".tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp, path)
+
+
+## Startet einen minimalen HTTP-Endpunkt für den Prometheus-Export auf dem Loopback-Interface.
+def serve_metrics(port, render):
+    """
+    Der Endpunkt läuft in einem Daemon-Thread und beantwortet jede Anfrage mit dem aktuellen
+    Export; er ist nur vom eigenen Rechner aus erreichbar.
+
+    @param port: TCP-Port
+    @param render: Funktion ohne Argumente, die den Export-Text liefert
+    @return: Server-Socket
+    @throws OSError: wenn der Port belegt ist
+    """
+    server = socket.create_server(("127.0.0.1", port))
+    threading.Thread(target=metrics_server_loop, args=(server, render), daemon=True).start()
+    return server
+
+
+## Beantwortet Anfragen an den HTTP-Endpunkt (läuft im Thread aus serve_metrics).
+def metrics_server_loop(server, render):
+    """
+    @param server: Lauschender Server-Socket
+    @param render: Funktion ohne Argumente, die den Export-Text liefert
+    @return: None
+    """
+    while True:
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        with conn:
+            try:
+                conn.settimeout(2)
+                request = conn.recv(4096)
+                if request.startswith((b"GET /metrics ", b"GET / ")):
+                    status, body = "200 OK", render().encode()
+                else:
+                    status, body = "404 Not Found", b"nicht gefunden\n"
+                conn.sendall(
+                    f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            except OSError:
+                pass
@@ -6,16 +6,249 @@ Dieses Modul kümmert sich um das Senden und Empfangen von Textnachrichten und B
 Die Kommunikation läuft über TCP – jedes Plauderkiste-Programm ist zugleich Client und Server.
 Nachrichten und Bilder werden von diesem Modul empfangen, verarbeitet und an das User-Interface weitergegeben.
 
-Es werden keine Klassen verwendet. Die Anbindung an das CLI und die Discovery-Komponente erfolgt über Queues.
+Alle Sockets sind nicht-blockierend und werden von einer einzigen selectors-Schleife bedient.
+Dadurch können viele eingehende Verbindungen gleichzeitig laufen, und Sendewünsche aus dem CLI
+werden sofort bearbeitet, statt auf das nächste accept() zu warten.
+
+Textnachrichten laufen über eine dauerhafte Verbindung pro Peer (Connection-Pool). Auf dieser
+Verbindung werden Frames mit Längenpräfix übertragen, sodass viele Nachrichten hintereinander
+gesendet werden können und keine Längenbegrenzung pro Nachricht mehr besteht:
+
+    Verbindungsbeginn: FRAME_MAGIC, danach Frames
+    Frame:             Typ (1 Byte) | Länge (4 Byte, Big Endian) | Nutzdaten
+
+Das erste Frame (HELLO) enthält den Nutzernamen des Absenders. Untätige Verbindungen werden nach
+POOL_IDLE_TIMEOUT Sekunden geschlossen und bei Bedarf neu aufgebaut.
+
+Jeder Empfänger hat damit seine eigene Warteschlange (höchstens POOL_QUEUE_LIMIT Nachrichten) und
+seinen eigenen Verbindungszustand; ein langsamer oder unerreichbarer Peer hält andere Sendungen
+und den Empfang nicht auf. Kommt eine Verbindung nicht innerhalb von CONNECT_TIMEOUT Sekunden
+zustande oder nimmt der Empfänger SEND_TIMEOUT Sekunden lang keine Daten an, wird sie abgebrochen
+und mit wachsender Wartezeit neu aufgebaut. Erfolg und Fehlschlag jeder Sendung werden mit dem
+Empfänger (meta: recipient) an das UI gemeldet.
+
+Peers mit CAP_OUTBOX erhalten Nachrichten als FRAME_MSG_ID mit einer zufälligen Nachrichten-ID und
+bestätigen jede mit FRAME_BATCH_ACK, sobald die ID auf der Platte steht. Erst die Bestätigung
+zählt als zugestellt; bis dahin bleibt die Nachricht in der Warteschlange der Verbindung. Reißt
+die Verbindung ab (z.B. weil der Laptop das WLAN verliert), werden unbestätigte Nachrichten erneut
+gesendet bzw. mit derselben ID im Ausgang vorgemerkt, und der Empfänger zeigt Wiederholungen nicht
+noch einmal an. Ältere Peers bestätigen nicht; dort gilt eine Nachricht als gesendet, sobald sie
+vollständig an den Socket übergeben ist.
+
+Nachrichten an mehrere Empfänger (MSG_MULTI, z.B. "msg all" oder eine Gruppe) werden parallel
+über die Pool-Verbindungen verteilt. Höchstens FANOUT_WORKERS Empfänger sind gleichzeitig in
+Arbeit; sobald einer fertig ist, kommt der nächste an die Reihe. Statt einer Meldung pro
+Empfänger gibt es am Ende einen gemeinsamen Zustellbericht. Eingehende Verbindungen ohne
+FRAME_MAGIC werden wie bisher als einzelne Textnachricht bzw. als Bild ("IMG filename size") behandelt.
+
+In diesem Format wird auch an Peers gesendet, die keine Fähigkeiten angekündigt haben (ältere
+Versionen, die weder FRAME_MAGIC noch Frames kennen): jede Nachricht als "absender: text" über eine
+eigene Verbindung, die nach dem Senden geschlossen wird, ohne Komprimierung und Bestätigung; Bilder
+mit dem Header "IMG filename size" und nach dem OK des Empfängers die ganze Datei per sendfile().
+Pool-Verbindung mit Frames, blockweise Übertragung, Komprimierung und BATCH gibt es nur für Peers
+mit Fähigkeiten.
+
+Bilder werden gestreamt und nie vollständig in den Speicher geladen: Der Sender überträgt die Datei
+mit os.sendfile() direkt aus dem Dateisystem (Fallback: blockweises Lesen), der Empfänger liest mit
+recv_into() in einen einzigen, wiederverwendeten Puffer und schreibt in eine temporäre Datei im
+Bildordner. Erst wenn alle Bytes angekommen sind, wird sie atomar umbenannt.
+
+Bildübertragungen nutzen ebenfalls gerahmte Verbindungen und laufen blockweise (siehe file_transfer.py):
+
+    Sender → Empfänger:  OFFER (Dateiname und Manifest mit Prüfsummen aller Blöcke)
+    Empfänger → Sender:  NEED  (Liste der noch fehlenden Blöcke)
+    Sender → Empfänger:  CHUNK (Blocknummer + Daten), beliebig viele
+    Empfänger → Sender:  ACK bzw. NACK (Blocknummer), nach Prüfung der Prüfsumme
+
+OFFER und NEED werden binär kodiert (FRAME_OFFER_BIN, FRAME_NEED_BIN; siehe protocol.py), wenn der
+Empfänger die Fähigkeit CAP_BINARY angekündigt hat, sonst wie bisher als JSON. Der Empfänger
+antwortet im Format des OFFER.
+
+Hat der Empfänger CAP_COMPRESS angekündigt (und ist "compression" in der Konfiguration nicht
+abgeschaltet), wird komprimiert (siehe compression.py): Nachrichten ab COMPRESS_MIN_BYTES laufen als
+FRAME_MSG_Z durch einen zlib-Strom pro Pool-Verbindung, Dateiblöcke werden in Hintergrund-Threads
+einzeln komprimiert und als FRAME_CHUNK_Z gesendet; Blöcke ohne nennenswerte Ersparnis als normaler
+FRAME_CHUNK. Dateien, deren Entropie-Stichprobe auf ein bereits komprimiertes Format (JPEG, PNG)
+hindeutet, gehen wie bisher unverändert mit sendfile() hinaus. Der Empfänger entpackt beim Lesen und
+prüft die Prüfsumme über die entpackten Daten.
+
+Vollständig empfangene Dateien landen zusätzlich im inhaltsadressierten Speicher (siehe blob_store.py).
+Liegt die angebotene Datei dort schon (gleiche Transfer-ID), dient das OFFER als HAVE-Anfrage: Der
+Empfänger antwortet mit einem leeren NEED und legt die Datei per Hardlink aus dem Speicher an; es
+werden keine Blöcke übertragen. Der Sender merkt sich die Manifeste der zuletzt gesendeten Dateien
+(MANIFEST_CACHE_SIZE), sodass eine an viele Empfänger weitergeleitete Datei nur einmal gehasht wird.
+
+Große Dateien werden über bis zu PARALLEL_STREAMS Verbindungen gleichzeitig übertragen; weitere
+Verbindungen melden sich mit ATTACH (Transfer-ID) beim laufenden Transfer an. Reißen alle
+Verbindungen ab, baut der Sender sie mit wachsender Wartezeit neu auf und schickt erneut ein OFFER.
+Der Empfänger antwortet dann nur noch mit den Blöcken, die ihm fehlen.
+
+Schutz vor Fluten (siehe flow_control.py): Neue Verbindungen werden pro Absender-IP über einen
+Token-Bucket (ACCEPT_RATE) und insgesamt (MAX_INBOUND, MAX_INBOUND_PER_IP) begrenzt; abgelehnte
+Verbindungen werden sofort geschlossen. Eingehende Nachrichten verbrauchen ein Token im Bucket ihres
+Absenders ("ratelimit"). Ist er leer oder kommt das UI mit der Anzeige nicht hinterher, wird die
+Verbindung angehalten: Sie wird beim Selector abgemeldet, die Nachricht bleibt im Puffer, und der
+Absender wird über TCP gebremst, statt dass Nachrichten verloren gehen.
+
+Ausgang (siehe outbox.py): Nachrichten an unbekannte oder offline Peers und solche, deren
+Pool-Verbindung auch nach den Wiederholungen scheitert, werden auf der Festplatte vorgemerkt.
+Alle OUTBOX_POLL_INTERVAL Sekunden wird die Sequenznummer der Peer-Tabelle gelesen; sobald die
+Discovery einen Empfänger wieder meldet, gehen seine Nachrichten über eine eigene Verbindung als
+BATCH-Frame hinaus und werden erst nach FRAME_BATCH_ACK aus dem Ausgang entfernt. Solange noch
+Nachrichten für einen Empfänger warten, stellen sich neue hinten an, damit die Reihenfolge erhalten
+bleibt. Der Empfänger zeigt jede Nachrichten-ID nur einmal an.
+
+Laufzeitmetriken (Bytes, Nachrichten, Verbindungsfehler, Sende- und Verbindungszeiten pro Peer,
+Dauer jedes Schleifendurchlaufs) werden in ctx["metrics"] erfasst und an das CLI gemeldet
+(siehe metrics.py).
+
+Das Kommando STOP beendet die Schleife; danach werden alle Verbindungen und offenen Dateien
+geschlossen und network_service() kehrt zurück. Noch nicht gesendete Nachrichten werden im Ausgang
+vorgemerkt (ohne Ausgang verfallen sie).
+
+Es werden keine Klassen verwendet. Der Zustand jeder Verbindung liegt in einem Dictionary,
+das zusammen mit der zuständigen Handler-Funktion beim Selector registriert wird.
+Die Anbindung an das CLI und die Discovery-Komponente erfolgt über Queues; Empfängeradressen
+werden direkt aus der gemeinsamen Peer-Tabelle (peer_table.py) gelesen.
 
 @author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
 @date 2025
 """
 
 import socket
+import selectors
+import errno
+import collections
+import struct
+import time
+import uuid
+import json
+import functools
 import os
 import subprocess
 import sys
+import random
+import signal
+from event_loop import (queue_bridge, drain_wakeups, call_later, cancel_timer, run_due_timers,
+                        thread_channel, run_in_thread, run_thread_results)
+from blob_store import open_store, has_blob, add_blob, link_blob, remove_blob, blob_path, DEFAULT_LIMIT_MB
+from file_transfer import (build_manifest, verify_file, manifest_valid, chunk_length, chunk_hasher,
+                           resume_paths, load_verified, record_verified)
+from peer_table import (attach_peer_table, close_peer_table, lookup_peer, lookup_state, lookup_caps, peers_sequence,
+                        PEER_DEAD)
+from compression import (compress_block, probe_file, new_deflater, deflate_message, new_inflater, inflate,
+                         COMPRESS_MIN_BYTES)
+from protocol import (encode_offer, decode_offer, encode_need, decode_need, encode_batch, decode_batch, batch_size,
+                      CAP_BINARY, CAP_COMPRESS, CAP_OUTBOX, CMD_MSG, CMD_MSG_MULTI, CMD_IMG_SEND, CMD_STATS, CMD_STOP)
+from events import post, EVENT_SYSTEM, EVENT_SENT, EVENT_MESSAGE, EVENT_IMAGE, EVENT_WARNING, EVENT_ERROR
+from events import attach_outbox, flush_events, close_outbox, events_congested
+from flow_control import new_limiter, limiter_bucket, allow, take_token, token_wait, FLUSH_INTERVAL, COMMAND_QUEUE_LIMIT
+from outbox import (open_outbox_store, close_outbox_store, enqueue_message, queued_count, queued_recipients,
+                    next_batch, confirm_batch, first_delivery, sync_outbox_store, ID_BYTES, BATCH_MESSAGES)
+from metrics import new_metrics, inc, set_gauge, observe, publish, METRICS_INTERVAL
+
+## Blockgröße für das Lesen von Daten, solange noch keine Bildübertragung läuft.
+CHUNK_SIZE = 64 * 1024
+## Größe des wiederverwendeten Empfangspuffers für Bilddaten (recv_into).
+RECV_BUFFER_SIZE = 1024 * 1024
+## Maximale Bytes pro sendfile()-Aufruf, damit andere Verbindungen zwischendurch bedient werden.
+SENDFILE_BLOCK = 4 * 1024 * 1024
+## Obergrenze für eine eingehende Textnachricht ohne Framing (Schutz vor Speicherüberlauf).
+MAX_TEXT_BYTES = 64 * 1024
+## Obergrenze für die Nutzdaten eines einzelnen Frames.
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+## Kennung am Anfang jeder gerahmten Verbindung.
+FRAME_MAGIC = b"PLK2"
+## Frame-Kopf: Typ (1 Byte) und Länge der Nutzdaten (4 Byte, Big Endian).
+FRAME_HEADER = struct.Struct("!BI")
+## Frame-Typ: Nutzername des Absenders, erstes Frame jeder Verbindung.
+FRAME_HELLO = 1
+## Frame-Typ: Textnachricht (UTF-8).
+FRAME_MSG = 2
+## Frame-Typ: Angebot einer Datei (JSON mit Dateiname und Manifest).
+FRAME_OFFER = 3
+## Frame-Typ: Antwort auf OFFER mit den fehlenden Blocknummern (JSON-Liste).
+FRAME_NEED = 4
+## Frame-Typ: Zusätzliche Verbindung für einen laufenden Transfer (Transfer-ID).
+FRAME_ATTACH = 5
+## Frame-Typ: Dateiblock (Blocknummer, danach die Daten).
+FRAME_CHUNK = 6
+## Frame-Typ: Block empfangen und Prüfsumme korrekt (Blocknummer).
+FRAME_ACK = 7
+## Frame-Typ: Prüfsumme eines Blocks falsch, bitte erneut senden (Blocknummer).
+FRAME_NACK = 8
+## Frame-Typ: Angebot einer Datei im binären Format (protocol.encode_offer).
+FRAME_OFFER_BIN = 9
+## Frame-Typ: Antwort auf FRAME_OFFER_BIN mit den fehlenden Blocknummern (protocol.encode_need).
+FRAME_NEED_BIN = 10
+## Frame-Typ: Textnachricht, komprimiert im zlib-Strom der Verbindung.
+FRAME_MSG_Z = 11
+## Frame-Typ: Einzeln mit zlib komprimierter Dateiblock (Blocknummer, danach die komprimierten Daten).
+FRAME_CHUNK_Z = 12
+## Frame-Typ: Stapel vorgemerkter Nachrichten mit IDs (protocol.encode_batch, siehe outbox.py).
+FRAME_BATCH = 13
+## Frame-Typ: Bestätigung eines BATCH (Stapel-ID), erst danach wird er aus dem Ausgang entfernt.
+FRAME_BATCH_ACK = 14
+## Frame-Typ: Textnachricht mit Nachrichten-ID (16 Bytes vor dem Text), bestätigt mit FRAME_BATCH_ACK (ID).
+FRAME_MSG_ID = 15
+## Frame-Typ: wie FRAME_MSG_ID, der Text komprimiert im zlib-Strom der Verbindung.
+FRAME_MSG_ID_Z = 16
+## Blocknummer in CHUNK-, ACK- und NACK-Frames.
+CHUNK_INDEX = struct.Struct("!I")
+## Anzahl gesendeter Dateien, deren Manifest der Sender zur Wiederverwendung aufbewahrt.
+MANIFEST_CACHE_SIZE = 32
+## Höchstzahl paralleler Verbindungen pro Dateiübertragung.
+PARALLEL_STREAMS = 4
+## Ab dieser Dateigröße werden mehrere Verbindungen genutzt.
+PARALLEL_THRESHOLD = 8 * 1024 * 1024
+## Gesendete, noch nicht bestätigte Blöcke pro Verbindung.
+STREAM_WINDOW = 4
+## Neue Versuche, nachdem alle Verbindungen eines Transfers abgerissen sind.
+TRANSFER_RETRIES = 5
+## Abgelehnte Blöcke (NACK), nach denen ein Transfer aufgegeben wird.
+MAX_NACKS = 16
+## Sekunden ohne Verkehr, nach denen eine ausgehende Pool-Verbindung geschlossen wird.
+POOL_IDLE_TIMEOUT = 30
+## Sekunden ohne Verkehr, nach denen eine eingehende Verbindung geschlossen wird.
+INBOUND_IDLE_TIMEOUT = 120
+## Abstand zwischen zwei Prüfungen auf untätige Verbindungen.
+IDLE_SWEEP_INTERVAL = 5
+## Wie oft eine abgebrochene Pool-Verbindung für noch offene Nachrichten neu aufgebaut wird.
+POOL_RECONNECT_ATTEMPTS = 3
+## Wartezeit vor dem ersten Neuaufbau in Sekunden; verdoppelt sich mit jedem weiteren Versuch.
+POOL_RETRY_DELAY = 0.5
+## Höchstzahl offener Nachrichten pro Empfänger; weitere werden abgelehnt.
+POOL_QUEUE_LIMIT = 1000
+## Höchstzahl gleichzeitiger eingehender Verbindungen; weitere werden sofort geschlossen.
+MAX_INBOUND = 256
+## Höchstzahl gleichzeitiger eingehender Verbindungen von einer IP-Adresse.
+MAX_INBOUND_PER_IP = 32
+## Neue eingehende Verbindungen pro Sekunde und IP-Adresse (Token-Bucket).
+ACCEPT_RATE = 20
+## Erlaubte Spitze neuer Verbindungen pro IP-Adresse.
+ACCEPT_BURST = 50
+## Standard für eingehende Nachrichten pro Sekunde und Peer ("ratelimit" in der Konfiguration, 0 = aus).
+MESSAGE_RATE = 500
+## Erlaubte Spitze eingehender Nachrichten pro Peer ("ratelimitburst" in der Konfiguration).
+MESSAGE_BURST = 2000
+## Pause in Sekunden, bevor eine angehaltene Verbindung weitergelesen wird (UI im Rückstand, Mindestpause bei Drosselung).
+BACKPRESSURE_DELAY = 0.05
+## Abstand in Sekunden, in dem geprüft wird, ob Empfänger vorgemerkter Nachrichten wieder erreichbar sind.
+OUTBOX_POLL_INTERVAL = 0.5
+## Wartezeit in Sekunden nach einer gescheiterten Zustellung aus dem Ausgang (verdoppelt sich je Versuch).
+OUTBOX_RETRY_DELAY = 2
+## Längste Wartezeit zwischen zwei Zustellversuchen aus dem Ausgang in Sekunden.
+OUTBOX_RETRY_MAX = 60
+## Sekunden, die ein Verbindungsaufbau dauern darf.
+CONNECT_TIMEOUT = 5
+## Sekunden ohne Sendefortschritt (bzw. ohne Antwort bei Dateiübertragungen), nach denen abgebrochen wird.
+SEND_TIMEOUT = 15
+## Höchstzahl an Empfängern, an die eine Gruppennachricht gleichzeitig gesendet wird.
+FANOUT_WORKERS = 32
+## Höchstzahl fehlgeschlagener Empfänger, die im Zustellbericht namentlich genannt werden.
+FANOUT_REPORT_NAMES = 10
+## Rückgabewerte von connect_ex(), die einen laufenden Verbindungsaufbau anzeigen (POSIX und Windows).
+CONNECT_PENDING = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
 
 
 def open_image(filepath):
@@ -27,21 +260,34 @@ def open_image(filepath):
             os.startfile(filepath)
         elif os.name == 'posix': # Linux uvm.
             subprocess.Popen(['xdg-open', filepath])
-    except Exception as e:
+    except Exception:
         pass # Fehler muss nicht beim Nutzer angezeigt werden
 
+## Erzeugt ein Frame für eine gerahmte Verbindung.
+def encode_frame(frame_type, payload):
+    """
+    @param frame_type: Frame-Typ (FRAME_HELLO, FRAME_MSG)
+    @param payload: Nutzdaten (bytes)
+    @return: Frame als bytes
+    """
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
 ## TCP-Server & Client für Nachrichten- und Bildübertragung.
-def network_service(ui_queue, net_queue, config, peers):
+def network_service(ui_queue, net_queue, config, table_name):
     """
     Startet den TCP-Server und verarbeitet sowohl eingehende als auch ausgehende Nachrichten und Bilder.
 
+    Die Schleife blockiert in selector.select(), bis ein Socket bereit ist, ein neues
+    Kommando in der net_queue liegt oder der nächste Timer fällig ist. Sie läuft, bis das
+    Kommando STOP eintrifft; Strg+C im Terminal wird ignoriert.
+
     @param ui_queue: Queue für Status- und Chatnachrichten an die Benutzeroberfläche (multiprocessing.Queue)
     @param net_queue: Queue für ausgehende Befehle/Sendewünsche aus dem CLI (multiprocessing.Queue)
     @param config: Konfigurationsdaten (dict) mit Nutzername, Port, Bildordner etc.
-    @param peers: Kontaktbuch (Manager.dict), aktuelle Peer-Liste mit IP und Port
+    @param table_name: Name der gemeinsamen Peer-Tabelle (peer_table.create_peer_table)
     @return: None
     """
-    username = config["handle"]
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     tcp_port = config["port"]
     image_folder = config.get("imagepath", "./images")
 
@@ -49,82 +295,2428 @@ def network_service(ui_queue, net_queue, config, peers):
     if not os.path.exists(image_folder):
         os.makedirs(image_folder, exist_ok=True)
 
+    ctx = {
+        "sel": selectors.DefaultSelector(),
+        "timers": [],
+        "ui_queue": ui_queue,
+        "peers": attach_peer_table(table_name),
+        "username": config["handle"],
+        "image_folder": image_folder,
+        "open_images": config.get("openimages", True),   # Empfangene Bilder im Standardprogramm öffnen
+        "compress": config.get("compression", True),     # An Peers mit CAP_COMPRESS komprimiert senden
+        "pool": {},       # Empfänger -> ausgehende Pool-Verbindung
+        "inbound": {},    # Socket -> Zustand eingehender Verbindungen
+        "incoming": {},   # Transfer-ID -> eingehende Dateiübertragung
+        "jobs": [],       # Laufende Sendeaufträge mit geöffneter Datei
+        "store": open_store(image_folder, config.get("blobcache", DEFAULT_LIMIT_MB)),
+        "manifests": collections.OrderedDict(),   # (Pfad, Größe, Änderungszeit) -> (Manifest, komprimierbar)
+        "recv_view": memoryview(bytearray(RECV_BUFFER_SIZE)),
+        "threads": thread_channel(),
+        "metrics": new_metrics("network"),
+        "net_queue": net_queue,
+        "accept_limiter": new_limiter(ACCEPT_RATE, ACCEPT_BURST),   # IP -> Bucket für neue Verbindungen
+        "message_limiter": new_limiter(config.get("ratelimit", MESSAGE_RATE),
+                                       config.get("ratelimitburst", MESSAGE_BURST)),   # (IP, Absender) -> Bucket
+        "inbound_per_ip": collections.Counter(),   # IP -> offene eingehende Verbindungen
+        "outbox": open_outbox_store(config.get("outboxpath", f"./outbox_{config['handle']}")),
+        "defer": config.get("outbox", True),   # Nicht zustellbare Nachrichten im Ausgang vormerken
+        "deliveries": {},     # Empfänger -> laufende Zustellung aus dem Ausgang
+        "outbox_retry": {},   # Empfänger -> (Fehlversuche, frühester nächster Versuch)
+        "outbox_seq": None,   # Sequenznummer der Peer-Tabelle bei der letzten Prüfung
+        "outbox_sync": None,  # Geplantes Schreiben des Ausgangs auf die Platte
+        "running": True,
+    }
+    attach_outbox(ui_queue)
+
     # Startet den TCP-Server für eingehende Nachrichten/Bilder
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if os.name != "nt":
+        # Schneller Neustart trotz TIME_WAIT-Verbindungen (unter Windows hätte die Option andere Bedeutung)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server.bind(("", tcp_port))
     server.listen()
-    server.settimeout(0.5)
-    ui_queue.put(f"[System] Lausche auf TCP-Port {tcp_port}")
+    server.setblocking(False)
+    ctx["sel"].register(server, selectors.EVENT_READ, (accept_connection, server))
+
+    # CLI-Kommandos wecken die Schleife über ein Socket-Paar auf
+    wake_sock, pending = queue_bridge(net_queue, COMMAND_QUEUE_LIMIT)
+    ctx["sel"].register(wake_sock, selectors.EVENT_READ, (handle_commands, (wake_sock, pending)))
+    ctx["sel"].register(ctx["threads"][0], selectors.EVENT_READ, (handle_thread_results, ctx["threads"]))
+    call_later(ctx["timers"], IDLE_SWEEP_INTERVAL, evict_idle, ctx)
+    call_later(ctx["timers"], METRICS_INTERVAL, report_metrics, ctx)
+    call_later(ctx["timers"], OUTBOX_POLL_INTERVAL, watch_outbox, ctx)
+    post(ui_queue, EVENT_SYSTEM, f"[System] Lausche auf TCP-Port {tcp_port}", ready="network", port=tcp_port)
+    report_outbox(ctx)
+
+    while ctx["running"]:
+        timeout = run_due_timers(ctx["timers"])
+        if flush_events(ui_queue):
+            # Die UI-Queue ist voll: wartende Ereignisse bald erneut übergeben
+            timeout = FLUSH_INTERVAL if timeout is None else min(timeout, FLUSH_INTERVAL)
+        ready = ctx["sel"].select(timeout)
+        started = time.perf_counter()
+        for key, mask in ready:
+            handler, state = key.data
+            handler(ctx, state, mask)
+        if ready:
+            observe(ctx["metrics"], "loop_seconds", time.perf_counter() - started)
+    shutdown(ctx)
+
+
+## Schließt alle Verbindungen, Dateien und die Peer-Tabelle, nachdem die Schleife beendet wurde.
+def shutdown(ctx):
+    """
+    Unvollständige Bildempfänge ohne Framing werden verworfen; Teildateien blockweiser
+    Übertragungen bleiben für eine spätere Fortsetzung liegen, die Dateien laufender
+    Sendeaufträge werden geschlossen. Offene Nachrichten der Pool-Verbindungen werden im
+    Ausgang vorgemerkt.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @return: None
+    """
+    for conn in list(ctx["pool"].values()):
+        refs, count = [], 0
+        if ctx["defer"]:
+            for _, body, _, report, _, ref, message_id in conn["pending"]:
+                try:
+                    count = enqueue_message(ctx["outbox"], conn["recipient"], body.decode(), message_id.hex())
+                except OSError:
+                    break
+                if report is None:
+                    refs.append(ref)
+        if refs:
+            # Eine Meldung pro Empfänger statt einer pro Nachricht
+            post(ctx["ui_queue"], EVENT_SENT,
+                 f"[System] {len(refs)} Nachricht(en) an {conn['recipient']} vorgemerkt ({count} im Ausgang).",
+                 recipient=conn["recipient"], count=len(refs), refs=refs, queued=count)
+        drop_pooled(ctx, conn)
+    for state in list(ctx["inbound"].values()):
+        abort_image(ctx, state)
+    for transfer in list(ctx["incoming"].values()):
+        close_incoming_transfer(ctx, transfer)
+    for job in ctx["jobs"]:
+        job["finished"] = True
+        for stream in list(job["streams"]):
+            close_stream(ctx, stream)
+        job["file"].close()
+    ctx["jobs"].clear()
+    for key in list(ctx["sel"].get_map().values()):
+        # Server, Weck-Sockets und Sendeverbindungen laufender Bildübertragungen
+        key.fileobj.close()
+    ctx["sel"].close()
+    ctx["threads"][1].close()
+    ctx["timers"].clear()
+    close_outbox_store(ctx["outbox"])
+    close_peer_table(ctx["peers"])
+    close_outbox(ctx["ui_queue"])
+
+
+## Aktualisiert die Messwerte des Netzwerkprozesses und meldet die Metriken an das CLI.
+def report_metrics(ctx, force=False, reschedule=True):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param force: True, um auch unveränderte Metriken zu melden (Kommando STATS)
+    @param reschedule: True, wenn der Aufruf vom periodischen Timer kommt
+    @return: None
+    """
+    metrics = ctx["metrics"]
+    set_gauge(metrics, "pool_connections", len(ctx["pool"]))
+    set_gauge(metrics, "inbound_connections", len(ctx["inbound"]))
+    set_gauge(metrics, "incoming_transfers", len(ctx["incoming"]))
+    set_gauge(metrics, "blob_store_bytes", ctx["store"]["total"])
+    set_gauge(metrics, "blob_store_entries", len(ctx["store"]["blobs"]))
+    set_gauge(metrics, "pending_messages", sum(len(conn["pending"]) for conn in ctx["pool"].values()))
+    set_gauge(metrics, "outbox_messages", sum(len(q) for q in ctx["outbox"]["queues"].values()))
+    set_gauge(metrics, "outbox_recipients", len(ctx["outbox"]["queues"]))
+    try:
+        set_gauge(metrics, "command_queue_depth", ctx["net_queue"].qsize())
+    except NotImplementedError:
+        # qsize() gibt es unter macOS nicht
+        pass
+    publish(metrics, ctx["ui_queue"], force)
+    if reschedule:
+        call_later(ctx["timers"], METRICS_INTERVAL, report_metrics, ctx)
+
+
+## Nimmt alle wartenden eingehenden Verbindungen an.
+def accept_connection(ctx, server, mask):
+    """
+    Akzeptiert neue TCP-Verbindungen und registriert sie nicht-blockierend beim Selector.
+    Verbindungen über MAX_INBOUND bzw. MAX_INBOUND_PER_IP oder über der erlaubten Rate der
+    Absender-IP (ACCEPT_RATE) werden sofort wieder geschlossen.
 
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param server: Lauschender Server-Socket
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
     while True:
-        # Prüfung auf eingehende Verbindungen (Textnachricht oder Bild)
         try:
             conn, addr = server.accept()
-            header = conn.recv(512).decode().strip()
-            if header.startswith("IMG"):
-                # Empfang einer Bilddatei (Header: IMG filename size)
-                try:
-                    _, filename, size_str = header.split()
-                    size = int(size_str)
-                    conn.sendall(b"OK")
-                    data = b""
-                    while len(data) < size:
-                        chunk = conn.recv(min(4096, size - len(data)))
-                        if not chunk:
-                            break
-                        data += chunk
-                    filepath = os.path.join(image_folder, filename)
-                    with open(filepath, "wb") as f:
-                        f.write(data)
-                    ui_queue.put(f"[Bild] Empfangen: {filename} ({size} Bytes)")
-                    open_image(filepath)
-                except Exception as e:
-                    ui_queue.put(f"[Fehler] Bildempfang fehlgeschlagen: {e}")
+        except (BlockingIOError, InterruptedError):
+            return
+        ip = addr[0]
+        if len(ctx["inbound"]) >= MAX_INBOUND:
+            reject_connection(ctx, conn, ip, "capacity")
+            continue
+        if ctx["inbound_per_ip"][ip] >= MAX_INBOUND_PER_IP:
+            reject_connection(ctx, conn, ip, "per_ip")
+            continue
+        if not allow(ctx["accept_limiter"], ip):
+            reject_connection(ctx, conn, ip, "rate")
+            continue
+        conn.setblocking(False)
+        state = {
+            "sock": conn, "addr": addr, "buf": bytearray(), "outbuf": bytearray(), "file": None,
+            "framed": False, "sender": ip, "last_used": time.monotonic(),
+            "transfer": None, "chunk": None, "closed": False, "inflate": None, "paused": False,
+            "acks": [],   # IDs gelesener FRAME_MSG_ID, die noch zu bestätigen sind
+        }
+        ctx["inbound"][conn] = state
+        ctx["inbound_per_ip"][ip] += 1
+        ctx["sel"].register(conn, selectors.EVENT_READ, (handle_inbound, state))
+
+
+## Schließt eine abgelehnte eingehende Verbindung sofort.
+def reject_connection(ctx, conn, ip, reason):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Gerade angenommener Socket
+    @param ip: Absender-IP
+    @param reason: Grund für Metriken ("capacity", "per_ip" oder "rate")
+    @return: None
+    """
+    conn.close()
+    inc(ctx["metrics"], "connections_rejected_total", reason=reason)
+    post(ctx["ui_queue"], EVENT_WARNING, f"[Warnung] Zu viele Verbindungen von {ip}, werden abgelehnt.")
+
+
+## Prüft vor dem Anzeigen einer Nachricht Rate des Absenders und Rückstand des UI.
+def admit_message(ctx, state, cost=1):
+    """
+    Ist der Bucket des Absenders leer oder die UI-Queue im Rückstand, wird die Verbindung
+    angehalten (pause_inbound) und die Nachricht bleibt im Empfangspuffer. Der Absender wird so
+    über TCP gebremst, statt dass Nachrichten verloren gehen.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param cost: Anzahl der Nachrichten (mehr als 1 bei einem BATCH)
+    @return: True, wenn die Nachricht jetzt verarbeitet werden darf
+    """
+    if events_congested(ctx["ui_queue"]):
+        inc(ctx["metrics"], "inbound_paused_total", reason="backlog")
+        pause_inbound(ctx, state, BACKPRESSURE_DELAY)
+        return False
+    limiter = ctx["message_limiter"]
+    if limiter["rate"] <= 0:
+        return True
+    bucket = limiter_bucket(limiter, (state["addr"][0], state["sender"]))
+    if take_token(bucket, cost=cost):
+        return True
+    inc(ctx["metrics"], "inbound_paused_total", reason="rate")
+    post(ctx["ui_queue"], EVENT_WARNING, f"[Warnung] {state['sender']} sendet zu schnell, Empfang wird gebremst.")
+    # Mindestens BACKPRESSURE_DELAY warten, damit danach mehrere Nachrichten am Stück frei sind
+    pause_inbound(ctx, state, max(token_wait(bucket, cost), BACKPRESSURE_DELAY))
+    return False
+
+
+## Hält das Lesen einer eingehenden Verbindung für eine Weile an.
+def pause_inbound(ctx, state, delay):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param delay: Sekunden bis zum Weiterlesen
+    @return: None
+    """
+    if state["paused"] or state["closed"]:
+        return
+    state["paused"] = True
+    ctx["sel"].unregister(state["sock"])
+    call_later(ctx["timers"], delay, resume_inbound, ctx, state)
+
+
+## Liest eine angehaltene Verbindung weiter (zuerst die schon gepufferten Frames).
+def resume_inbound(ctx, state):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    state["paused"] = False
+    if state["closed"]:
+        return
+    events = selectors.EVENT_READ | (selectors.EVENT_WRITE if state["outbuf"] else 0)
+    ctx["sel"].register(state["sock"], events, (handle_inbound, state))
+    state["last_used"] = time.monotonic()
+    read_frames(ctx, state)
+
+
+## Liest Daten einer eingehenden Verbindung (Frames, Textnachricht oder Bild).
+def handle_inbound(ctx, state, mask):
+    """
+    Verarbeitet eingehende Daten. Beginnt die Verbindung mit FRAME_MAGIC, werden die folgenden
+    Bytes als Frames gelesen. Andernfalls werden die Bytes gesammelt, bis ein Bild-Header erkannt
+    wird oder der Absender die Verbindung schließt (einzelne Textnachricht).
+    Bilddaten (Header: IMG filename size) werden blockweise direkt in die Zieldatei geschrieben.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
+    ui_queue = ctx["ui_queue"]
+    if mask & selectors.EVENT_WRITE:
+        flush_inbound(ctx, state)
+        if not mask & selectors.EVENT_READ or state["closed"]:
+            return
+    state["last_used"] = time.monotonic()
+    if state["file"] is not None:
+        # Empfang einer Bilddatei läuft
+        receive_image_data(ctx, state)
+        return
+    if state["chunk"] is not None:
+        # Empfang eines Dateiblocks läuft
+        receive_chunk_data(ctx, state)
+        return
+    try:
+        data = state["sock"].recv(CHUNK_SIZE)
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError as e:
+        data = b""
+        post(ui_queue, EVENT_ERROR, f"[Fehler] Verbindung von {state['addr'][0]} abgebrochen: {e}")
+    inc(ctx["metrics"], "bytes_received_total", len(data))
+
+    if not data:
+        # Ohne Framing: Textnachricht (Absender:Nachricht), vollständig mit dem Verbindungsende
+        if state["buf"] and not state["framed"]:
+            if allow(ctx["message_limiter"], (state["addr"][0], "")):
+                text = state["buf"].decode(errors="replace").strip()
+                post(ui_queue, EVENT_MESSAGE, f"[Nachricht] {text}", body=text)
+                inc(ctx["metrics"], "messages_received_total")
             else:
-                # Normale Textnachricht (Absender:Nachricht)
-                ui_queue.put(f"[Nachricht] {header}")
-            conn.close()
-        except socket.timeout:
-            # Kein neuer Client, das ist der Normalfall bei kurzen Timeouts
+                # Die Verbindung ist schon beendet, bremsen geht nicht mehr
+                inc(ctx["metrics"], "messages_dropped_total", reason="rate")
+                post(ui_queue, EVENT_WARNING,
+                     f"[Warnung] {state['addr'][0]} sendet zu schnell, Nachrichten werden verworfen.")
+        close_connection(ctx, state)
+        return
+
+    state["buf"] += data
+    if state["framed"]:
+        read_frames(ctx, state)
+    elif state["buf"].startswith(FRAME_MAGIC):
+        state["framed"] = True
+        del state["buf"][:len(FRAME_MAGIC)]
+        read_frames(ctx, state)
+    elif FRAME_MAGIC.startswith(bytes(state["buf"])):
+        # Noch zu wenige Bytes, um die Verbindungsart zu erkennen
+        return
+    elif state["buf"].startswith(b"IMG ") and b"\n" in state["buf"]:
+        start_image(ctx, state)
+    elif len(state["buf"]) > MAX_TEXT_BYTES:
+        post(ui_queue, EVENT_ERROR, f"[Fehler] Nachricht von {state['addr'][0]} zu lang, verworfen.")
+        close_connection(ctx, state)
+
+
+## Zerlegt den Empfangspuffer einer gerahmten Verbindung in vollständige Frames.
+def read_frames(ctx, state):
+    """
+    Verarbeitet alle vollständig empfangenen Frames. Ein angefangenes Frame bleibt im Puffer,
+    bis der Rest eingetroffen ist.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    buf = state["buf"]
+    pos = 0
+    while len(buf) - pos >= FRAME_HEADER.size and not state["closed"]:
+        frame_type, length = FRAME_HEADER.unpack_from(buf, pos)
+        if frame_type in (FRAME_CHUNK, FRAME_CHUNK_Z):
+            # Dateiblöcke werden nicht gepuffert, sondern direkt in die Teildatei geschrieben
+            start = pos + FRAME_HEADER.size
+            if len(buf) - start < CHUNK_INDEX.size:
+                break
+            (index,) = CHUNK_INDEX.unpack_from(buf, start)
+            pos = start + CHUNK_INDEX.size
+            if not begin_chunk(ctx, state, index, length - CHUNK_INDEX.size, frame_type == FRAME_CHUNK_Z):
+                return
+            take = min(len(buf) - pos, state["chunk"]["remaining"]) if state["chunk"] else 0
+            if take:
+                write_chunk_data(ctx, state, bytes(buf[pos:pos + take]))
+                pos += take
+            continue
+        if length > MAX_FRAME_BYTES:
+            post(ctx["ui_queue"], EVENT_ERROR,
+                 f"[Fehler] Frame von {state['sender']} zu groß, Verbindung getrennt.")
+            close_connection(ctx, state)
+            return
+        end = pos + FRAME_HEADER.size + length
+        if len(buf) < end:
+            break
+        if frame_type in (FRAME_MSG, FRAME_MSG_Z, FRAME_MSG_ID, FRAME_MSG_ID_Z) and not admit_message(ctx, state):
+            break
+        if frame_type == FRAME_BATCH and not admit_message(ctx, state, batch_size(buf, pos + FRAME_HEADER.size)):
+            break
+        payload = bytes(buf[pos + FRAME_HEADER.size:end])
+        pos = end
+        if frame_type == FRAME_HELLO:
+            state["sender"] = payload.decode(errors="replace")
+        elif frame_type in (FRAME_MSG, FRAME_MSG_Z, FRAME_MSG_ID, FRAME_MSG_ID_Z):
+            message_id = None
+            if frame_type in (FRAME_MSG_ID, FRAME_MSG_ID_Z):
+                message_id, payload = payload[:ID_BYTES], payload[ID_BYTES:]
+                state["acks"].append(message_id)
+            if frame_type in (FRAME_MSG_Z, FRAME_MSG_ID_Z):
+                if state["inflate"] is None:
+                    state["inflate"] = new_inflater()
+                try:
+                    payload = inflate(state["inflate"], payload, MAX_FRAME_BYTES)
+                except ValueError as e:
+                    post(ctx["ui_queue"], EVENT_ERROR,
+                         f"[Fehler] Nachricht von {state['sender']} nicht lesbar ({e}), Verbindung getrennt.")
+                    close_connection(ctx, state)
+                    return
+            if message_id is not None and not first_delivery(ctx["outbox"], message_id):
+                # Wiederholung nach verlorener Bestätigung: nur erneut bestätigen
+                inc(ctx["metrics"], "outbox_duplicates_total")
+                continue
+            text = payload.decode(errors="replace")
+            post(ctx["ui_queue"], EVENT_MESSAGE, f"[Nachricht] {state['sender']}: {text}",
+                 sender=state["sender"], body=text)
+            inc(ctx["metrics"], "messages_received_total")
+        elif frame_type == FRAME_BATCH:
+            handle_batch(ctx, state, payload)
+        elif frame_type in (FRAME_OFFER, FRAME_OFFER_BIN):
+            handle_offer(ctx, state, payload, frame_type == FRAME_OFFER_BIN)
+        elif frame_type == FRAME_ATTACH:
+            handle_attach(ctx, state, payload.decode(errors="replace"))
+    del buf[:pos]
+    if state["acks"] and not state["closed"]:
+        acknowledge_messages(ctx, state)
+
+
+## Bestätigt die gelesenen FRAME_MSG_ID einer Verbindung mit einem fsync für alle.
+def acknowledge_messages(ctx, state):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    acks = state["acks"]
+    state["acks"] = []
+    try:
+        sync_outbox_store(ctx["outbox"])
+    except OSError as e:
+        # Ohne Bestätigung sendet der Absender erneut bzw. merkt die Nachrichten vor
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Empfangene IDs konnten nicht gespeichert werden: {e}")
+        close_connection(ctx, state)
+        return
+    queue_frame(ctx, state, b"".join(encode_frame(FRAME_BATCH_ACK, message_id) for message_id in acks))
+
+
+## Zeigt die Nachrichten eines BATCH an und bestätigt ihn.
+def handle_batch(ctx, state, payload):
+    """
+    Bereits angezeigte Nachrichten (gleiche ID, z.B. weil eine frühere Bestätigung verloren ging)
+    werden übersprungen. Bestätigt wird erst, wenn die IDs auf der Platte stehen.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param payload: Nutzdaten des BATCH-Frames (bytes)
+    @return: None
+    """
+    try:
+        batch_id, entries = decode_batch(payload)
+    except ValueError as e:
+        post(ctx["ui_queue"], EVENT_ERROR,
+             f"[Fehler] Nachrichten von {state['sender']} nicht lesbar ({e}), Verbindung getrennt.")
+        close_connection(ctx, state)
+        return
+    sender = state["sender"]
+    for message_id, stamp, text in entries:
+        if not first_delivery(ctx["outbox"], message_id):
+            inc(ctx["metrics"], "outbox_duplicates_total")
+            continue
+        sent_at = time.strftime("%d.%m. %H:%M", time.localtime(stamp))
+        post(ctx["ui_queue"], EVENT_MESSAGE, f"[Nachricht] {sender} (vorgemerkt {sent_at}): {text}",
+             sender=sender, body=text, sent_at=stamp)
+        inc(ctx["metrics"], "messages_received_total")
+    try:
+        sync_outbox_store(ctx["outbox"])
+    except OSError as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Empfangene IDs konnten nicht gespeichert werden: {e}")
+        close_connection(ctx, state)
+        return
+    queue_frame(ctx, state, encode_frame(FRAME_BATCH_ACK, batch_id))
+
+
+## Hängt ein Frame an den Sendepuffer einer eingehenden Verbindung an.
+def queue_frame(ctx, state, frame):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param frame: Fertiges Frame (bytes)
+    @return: None
+    """
+    if state["closed"]:
+        return
+    state["outbuf"] += frame
+    if state["paused"]:
+        # resume_inbound meldet die Verbindung wieder zum Schreiben an
+        return
+    ctx["sel"].modify(state["sock"], selectors.EVENT_READ | selectors.EVENT_WRITE, (handle_inbound, state))
+
+
+## Sendet den Pufferinhalt einer eingehenden Verbindung (z.B. NEED und ACK).
+def flush_inbound(ctx, state):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    try:
+        sent = state["sock"].send(state["outbuf"])
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError:
+        close_connection(ctx, state)
+        return
+    inc(ctx["metrics"], "bytes_sent_total", sent)
+    del state["outbuf"][:sent]
+    if not state["outbuf"]:
+        ctx["sel"].modify(state["sock"], selectors.EVENT_READ, (handle_inbound, state))
+
+
+## Beantwortet ein OFFER mit der Liste der noch fehlenden Blöcke.
+def handle_offer(ctx, state, payload, binary):
+    """
+    Liegt die Datei bereits im Speicher, wird ihr Inhalt im Hintergrund-Thread gegen die
+    Prüfsummen des Manifests geprüft (stored_checked); stimmt er, wird sie von dort angelegt und
+    keine Blöcke angefordert. Sonst geht es mit accept_offer weiter.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param payload: Binär kodiertes Angebot oder JSON mit name und manifest (bytes)
+    @param binary: True, wenn das Angebot binär kodiert ist (Antwort dann ebenfalls binär)
+    @return: None
+    """
+    try:
+        if binary:
+            name, manifest = decode_offer(payload)
+        else:
+            offer = json.loads(payload)
+            name, manifest = offer["name"], offer["manifest"]
+        filename = os.path.basename(str(name))
+        if not filename or not manifest_valid(manifest):
+            raise ValueError("ungültiges Manifest")
+    except (ValueError, KeyError, TypeError) as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildempfang von {state['sender']} abgelehnt: {e}")
+        close_connection(ctx, state)
+        return
+
+    if manifest["id"] not in ctx["incoming"] and has_blob(ctx["store"], manifest["id"], manifest["size"]):
+        run_in_thread(ctx["threads"], functools.partial(stored_checked, ctx, state, filename, manifest, binary),
+                      verify_file, blob_path(ctx["store"], manifest["id"]), manifest)
+        return
+    accept_offer(ctx, state, filename, manifest, binary)
+
+
+## Setzt ein OFFER fort, nachdem der passende Eintrag im Speicher geprüft wurde.
+def stored_checked(ctx, state, filename, manifest, binary, intact, error):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param filename: Dateiname laut OFFER
+    @param manifest: Geprüftes Manifest (dict)
+    @param binary: True, wenn das Angebot binär kodiert ist
+    @param intact: Ergebnis von verify_file
+    @param error: Ausnahme aus verify_file oder None
+    @return: None
+    """
+    if state["closed"]:
+        return
+    if intact and deliver_stored(ctx, state["sender"], filename, manifest):
+        send_need(ctx, state, [], binary)
+        return
+    if not intact:
+        # Eintrag wurde verändert (z.B. Bild im Bildordner überschrieben): verwerfen und übertragen
+        remove_blob(ctx["store"], manifest["id"])
+    accept_offer(ctx, state, filename, manifest, binary)
+
+
+## Fordert die noch fehlenden Blöcke eines angebotenen Bildes an.
+def accept_offer(ctx, state, filename, manifest, binary):
+    """
+    Legt für eine neue Transfer-ID Teil- und Statusdatei an bzw. öffnet die vorhandenen Dateien
+    eines früheren, abgebrochenen Versuchs. Bereits geprüfte Blöcke werden nicht erneut angefordert.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param filename: Dateiname laut OFFER
+    @param manifest: Geprüftes Manifest (dict)
+    @param binary: True, um binär zu antworten
+    @return: None
+    """
+    transfer = ctx["incoming"].get(manifest["id"])
+    if transfer is None:
+        try:
+            transfer = open_incoming_transfer(ctx, manifest)
+        except OSError as e:
+            post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildempfang fehlgeschlagen: {e}")
+            close_connection(ctx, state)
+            return
+        block_count = len(manifest["hashes"])
+        if block_count and len(transfer["needed"]) < block_count:
+            post(ctx["ui_queue"], EVENT_IMAGE,
+                f"[Bild] Setze Empfang von {filename} fort "
+                f"({block_count - len(transfer['needed'])}/{block_count} Blöcke vorhanden)")
+    transfer["filename"] = filename
+    transfer["sender"] = state["sender"]
+    attach_transfer(state, transfer)
+    send_need(ctx, state, sorted(transfer["needed"]), binary)
+    if not transfer["needed"]:
+        finish_incoming_transfer(ctx, transfer)
+
+
+## Schickt die Antwort auf ein OFFER (Liste der fehlenden Blöcke).
+def send_need(ctx, state, needed, binary):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param needed: Sortierte Blocknummern
+    @param binary: True, um binär zu antworten (FRAME_NEED_BIN), sonst JSON
+    @return: None
+    """
+    if binary:
+        queue_frame(ctx, state, encode_frame(FRAME_NEED_BIN, encode_need(needed)))
+    else:
+        queue_frame(ctx, state, encode_frame(FRAME_NEED, json.dumps(needed).encode()))
+
+
+## Legt eine angebotene Datei aus dem Speicher an, statt sie zu übertragen.
+def deliver_stored(ctx, sender, filename, manifest):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param sender: Nutzername des Absenders
+    @param filename: Dateiname laut OFFER
+    @param manifest: Geprüftes Manifest (dict)
+    @return: True bei Erfolg; False, wenn die Datei doch übertragen werden muss
+    """
+    filepath = os.path.join(ctx["image_folder"], filename)
+    try:
+        link_blob(ctx["store"], manifest["id"], filepath)
+    except OSError:
+        return False
+    post(ctx["ui_queue"], EVENT_IMAGE,
+         f"[Bild] Empfangen: {filename} ({manifest['size']} Bytes, bereits vorhanden)",
+         sender=sender, filename=filename, size=manifest["size"], stored=True)
+    inc(ctx["metrics"], "images_received_total")
+    inc(ctx["metrics"], "images_deduplicated_total")
+    if ctx["open_images"]:
+        open_image(filepath)
+    return True
+
+
+## Öffnet Teil- und Statusdatei für eine eingehende Dateiübertragung.
+def open_incoming_transfer(ctx, manifest):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param manifest: Geprüftes Manifest (dict)
+    @return: Zustand der Übertragung (dict)
+    @throws OSError: wenn die Dateien nicht angelegt werden können
+    """
+    part_path, state_path = resume_paths(ctx["image_folder"], manifest)
+    block_count = len(manifest["hashes"])
+    verified = load_verified(state_path, block_count) if os.path.exists(part_path) else set()
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+    part = os.fdopen(fd, "r+b", buffering=0)
+    state_file = open(state_path, "ab" if verified else "wb", buffering=0)
+    transfer = {
+        "manifest": manifest, "part": part, "part_path": part_path, "state_file": state_file,
+        "state_path": state_path, "needed": set(range(block_count)) - verified,
+        "streams": 0, "last_used": time.monotonic(), "done": False,
+    }
+    ctx["incoming"][manifest["id"]] = transfer
+    return transfer
+
+
+## Ordnet eine zusätzliche Verbindung einem laufenden Transfer zu.
+def handle_attach(ctx, state, transfer_id):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param transfer_id: ID aus dem ATTACH-Frame
+    @return: None
+    """
+    transfer = ctx["incoming"].get(transfer_id)
+    if transfer is None:
+        close_connection(ctx, state)
+        return
+    attach_transfer(state, transfer)
+
+
+## Verknüpft eine Verbindung mit einem Transfer.
+def attach_transfer(state, transfer):
+    """
+    @param state: Zustand der Verbindung (dict)
+    @param transfer: Zustand der Übertragung (dict)
+    @return: None
+    """
+    if state["transfer"] is not None:
+        state["transfer"]["streams"] -= 1
+    state["transfer"] = transfer
+    transfer["streams"] += 1
+
+
+## Beginnt den Empfang eines Dateiblocks nach dem CHUNK-Kopf.
+def begin_chunk(ctx, state, index, length, compressed=False):
+    """
+    Bereits geprüfte Blöcke (z.B. doppelt gesendet nach einem Neuaufbau) werden gelesen und
+    verworfen, aber trotzdem bestätigt. Ein komprimierter Block muss kleiner sein als der Block
+    selbst; größere sendet der Absender unkomprimiert.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param index: Blocknummer
+    @param length: Länge der Blockdaten im Frame
+    @param compressed: True für einen FRAME_CHUNK_Z
+    @return: True, wenn der Block gelesen werden kann; False, wenn die Verbindung getrennt wurde
+    """
+    transfer = state["transfer"]
+    valid = transfer is not None and index < len(transfer["manifest"]["hashes"])
+    if valid:
+        expected = chunk_length(transfer["manifest"], index)
+        valid = length < expected if compressed else length == expected
+    if not valid:
+        post(ctx["ui_queue"], EVENT_ERROR,
+             f"[Fehler] Ungültiger Dateiblock von {state['sender']}, Verbindung getrennt.")
+        close_connection(ctx, state)
+        return False
+    keep = not transfer["done"] and index in transfer["needed"]
+    state["chunk"] = {
+        "index": index,
+        "offset": index * transfer["manifest"]["chunk_size"],
+        "remaining": length,
+        "hasher": chunk_hasher(),
+        "keep": keep,
+        "inflate": new_inflater() if compressed and keep else None,
+        "left": expected,      # Noch fehlende Bytes des (entpackten) Blocks
+        "broken": False,
+    }
+    if length == 0:
+        complete_chunk(ctx, state)
+    return True
+
+
+## Liest Blockdaten direkt in den gemeinsamen Empfangspuffer.
+def receive_chunk_data(ctx, state):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    view = ctx["recv_view"]
+    try:
+        n = state["sock"].recv_into(view[:min(len(view), state["chunk"]["remaining"])])
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError:
+        n = 0
+    inc(ctx["metrics"], "bytes_received_total", n)
+    if not n:
+        # Verbindung abgerissen: Der angefangene Block wird beim nächsten OFFER erneut angefordert
+        close_connection(ctx, state)
+        return
+    write_chunk_data(ctx, state, view[:n])
+
+
+## Schreibt Blockdaten an die richtige Stelle der Teildatei und aktualisiert die Prüfsumme.
+def write_chunk_data(ctx, state, data):
+    """
+    Komprimierte Blöcke werden dabei entpackt. Beschädigte Daten werden nicht geschrieben; der
+    Block wird am Ende mit NACK neu angefordert.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @param data: Empfangene Bytes (bytes oder memoryview)
+    @return: None
+    """
+    chunk = state["chunk"]
+    chunk["remaining"] -= len(data)
+    if chunk["keep"] and not chunk["broken"]:
+        if chunk["inflate"] is not None:
+            try:
+                data = inflate(chunk["inflate"], data, chunk["left"])
+            except ValueError:
+                chunk["broken"] = True
+                data = b""
+        part = state["transfer"]["part"]
+        part.seek(chunk["offset"])
+        part.write(data)
+        chunk["hasher"].update(data)
+        chunk["offset"] += len(data)
+        chunk["left"] -= len(data)
+    if chunk["remaining"] == 0:
+        complete_chunk(ctx, state)
+
+
+## Prüft einen vollständig empfangenen Block und bestätigt ihn.
+def complete_chunk(ctx, state):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    chunk, transfer = state["chunk"], state["transfer"]
+    state["chunk"] = None
+    index = chunk["index"]
+    transfer["last_used"] = time.monotonic()
+    if chunk["keep"]:
+        if chunk["broken"] or chunk["hasher"].hexdigest() != transfer["manifest"]["hashes"][index]:
+            queue_frame(ctx, state, encode_frame(FRAME_NACK, CHUNK_INDEX.pack(index)))
+            return
+        transfer["needed"].discard(index)
+        record_verified(transfer["state_file"], index)
+    queue_frame(ctx, state, encode_frame(FRAME_ACK, CHUNK_INDEX.pack(index)))
+    if not transfer["needed"] and not transfer["done"]:
+        finish_incoming_transfer(ctx, transfer)
+
+
+## Schließt eine eingehende Dateiübertragung ab.
+def finish_incoming_transfer(ctx, transfer):
+    """
+    Benennt die Teildatei atomar in den endgültigen Dateinamen um, entfernt die Statusdatei und
+    nimmt die Datei in den Speicher auf.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param transfer: Zustand der Übertragung (dict)
+    @return: None
+    """
+    transfer["done"] = True
+    close_incoming_transfer(ctx, transfer)
+    filepath = os.path.join(ctx["image_folder"], transfer["filename"])
+    try:
+        os.replace(transfer["part_path"], filepath)
+        os.remove(transfer["state_path"])
+    except OSError as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildempfang fehlgeschlagen: {e}")
+        return
+    add_blob(ctx["store"], transfer["manifest"]["id"], filepath)
+    post(ctx["ui_queue"], EVENT_IMAGE,
+         f"[Bild] Empfangen: {transfer['filename']} ({transfer['manifest']['size']} Bytes)",
+         sender=transfer["sender"], filename=transfer["filename"], size=transfer["manifest"]["size"])
+    inc(ctx["metrics"], "images_received_total")
+    if ctx["open_images"]:
+        open_image(filepath)
+
+
+## Schließt die Dateien einer eingehenden Übertragung.
+def close_incoming_transfer(ctx, transfer):
+    """
+    Teil- und Statusdatei bleiben bei einem unvollständigen Transfer auf der Platte liegen,
+    damit ein späteres OFFER derselben Datei dort fortsetzen kann.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param transfer: Zustand der Übertragung (dict)
+    @return: None
+    """
+    ctx["incoming"].pop(transfer["manifest"]["id"], None)
+    transfer["part"].close()
+    transfer["state_file"].close()
+
+
+## Beginnt den Empfang einer Bilddatei nach dem IMG-Header.
+def start_image(ctx, state):
+    """
+    Wertet den Header "IMG filename size" aus, legt eine temporäre Datei im Bildordner an
+    und bestätigt mit OK. Bereits mitgelesene Bilddaten hinter dem Header werden sofort geschrieben.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    header, rest = bytes(state["buf"]).split(b"\n", 1)
+    try:
+        _, filename, size_str = header.decode().split()
+        state["filename"] = os.path.basename(filename)
+        state["size"] = int(size_str)
+        state["remaining"] = state["size"]
+        state["filepath"] = os.path.join(ctx["image_folder"], state["filename"])
+        state["temppath"] = os.path.join(ctx["image_folder"], f".{state['filename']}.{uuid.uuid4().hex[:8]}.part")
+        fd = os.open(state["temppath"], os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        state["file"] = os.fdopen(fd, "wb", buffering=0)
+        state["sock"].send(b"OK")
+    except Exception as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildempfang fehlgeschlagen: {e}")
+        abort_image(ctx, state)
+        return
+    state["buf"] = bytearray()
+    if rest:
+        state["file"].write(rest[:state["remaining"]])
+        state["remaining"] -= len(rest)
+    if state["remaining"] <= 0:
+        finish_image(ctx, state)
+
+
+## Liest Bilddaten direkt in den gemeinsamen Empfangspuffer und schreibt sie in die Datei.
+def receive_image_data(ctx, state):
+    """
+    Verwendet recv_into() auf dem vorab angelegten Puffer aus dem Laufzeitkontext, sodass pro
+    Aufruf weder neue bytes-Objekte entstehen noch der Speicherbedarf mit der Dateigröße wächst.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    view = ctx["recv_view"]
+    try:
+        n = state["sock"].recv_into(view[:min(len(view), state["remaining"])])
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildempfang fehlgeschlagen: {e}")
+        abort_image(ctx, state)
+        return
+    inc(ctx["metrics"], "bytes_received_total", n)
+    if not n:
+        post(ctx["ui_queue"], EVENT_ERROR,
+             f"[Fehler] Bildempfang fehlgeschlagen: {state['filename']} unvollständig")
+        abort_image(ctx, state)
+        return
+    state["file"].write(view[:n])
+    state["remaining"] -= n
+    if state["remaining"] <= 0:
+        finish_image(ctx, state)
+
+
+## Schließt einen vollständigen Bildempfang ab.
+def finish_image(ctx, state):
+    """
+    Schließt die temporäre Datei, benennt sie atomar in den endgültigen Namen um,
+    meldet den Empfang an das UI und öffnet das Bild.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    state["file"].close()
+    state["file"] = None
+    try:
+        os.replace(state["temppath"], state["filepath"])
+    except OSError as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildempfang fehlgeschlagen: {e}")
+        abort_image(ctx, state)
+        return
+    post(ctx["ui_queue"], EVENT_IMAGE, f"[Bild] Empfangen: {state['filename']} ({state['size']} Bytes)",
+         sender=state["sender"], filename=state["filename"], size=state["size"])
+    inc(ctx["metrics"], "images_received_total")
+    if ctx["open_images"]:
+        open_image(state["filepath"])
+    close_connection(ctx, state)
+
+
+## Bricht einen Bildempfang ab und entfernt die unvollständige Datei.
+def abort_image(ctx, state):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    if state["file"] is not None:
+        state["file"].close()
+        state["file"] = None
+    if state.get("temppath"):
+        try:
+            os.remove(state["temppath"])
+        except OSError:
             pass
+    close_connection(ctx, state)
+
+
+## Meldet einen Socket beim Selector ab und schließt ihn.
+def close_connection(ctx, state):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand der Verbindung (dict)
+    @return: None
+    """
+    try:
+        ctx["sel"].unregister(state["sock"])
+    except (KeyError, ValueError):
+        pass
+    if ctx["inbound"].pop(state["sock"], None) is not None:
+        ip = state["addr"][0]
+        ctx["inbound_per_ip"][ip] -= 1
+        if not ctx["inbound_per_ip"][ip]:
+            del ctx["inbound_per_ip"][ip]
+    state["sock"].close()
+    state["closed"] = True
+    if state.get("transfer") is not None:
+        state["transfer"]["streams"] -= 1
+        state["transfer"] = None
+
+
+## Schließt untätige Pool- und Empfangsverbindungen.
+def evict_idle(ctx):
+    """
+    Läuft alle IDLE_SWEEP_INTERVAL Sekunden und plant sich danach selbst neu ein.
 
-        # Behandlung von ausgehenden Nachrichten/Bildern
-        while not net_queue.empty():
-            cmd = net_queue.get()
-            if cmd.startswith("MSG"):
-                # Sende eine Textnachricht an einen Peer
-                _, recipient, text = cmd.split(" ", 2)
-                if recipient in peers:
-                    try:
-                        ip, port = peers[recipient]
-                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s.connect((ip, port))
-                        s.sendall(f"{username}: {text}".encode())
-                        s.close()
-                        ui_queue.put(f"[System] Nachricht an {recipient} gesendet.")
-                    except Exception as e:
-                        ui_queue.put(f"[Fehler] Nachricht nicht gesendet: {e}")
-                else:
-                    ui_queue.put(f"[Warnung] Empfänger {recipient} nicht gefunden. (Tipp: who ausführen)")
-            elif cmd.startswith("IMG_SEND"):
-                # Sende ein Bild an einen Peer
-                parts = cmd.split(" ", 1)[1].split("::")
-                header, path = parts
-                recipient, filename, size = header.split()[:3]
-                size = int(size)
-                if recipient in peers:
-                    try:
-                        ip, port = peers[recipient]
-                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s.connect((ip, port))
-                        s.sendall(f"IMG {filename} {size}\n".encode())
-                        ack = s.recv(16)
-                        if ack == b"OK":
-                            with open(path, "rb") as f:
-                                s.sendall(f.read())
-                            ui_queue.put(f"[System] Bild an {recipient} gesendet: {filename}")
-                        s.close()
-                    except Exception as e:
-                        ui_queue.put(f"[Fehler] Bildversand fehlgeschlagen: {e}")
-                else:
-                    ui_queue.put(f"[Warnung] Empfänger {recipient} nicht gefunden. (Tipp: who ausführen)")
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @return: None
+    """
+    now = time.monotonic()
+    for conn in list(ctx["pool"].values()):
+        if not conn["pending"] and now - conn["last_used"] > POOL_IDLE_TIMEOUT:
+            drop_pooled(ctx, conn)
+    for state in list(ctx["inbound"].values()):
+        if now - state["last_used"] > INBOUND_IDLE_TIMEOUT:
+            if state["file"] is not None:
+                post(ctx["ui_queue"], EVENT_ERROR,
+                     f"[Fehler] Bildempfang fehlgeschlagen: {state['filename']} unvollständig")
+            abort_image(ctx, state)
+    for transfer in list(ctx["incoming"].values()):
+        if transfer["streams"] <= 0 and now - transfer["last_used"] > INBOUND_IDLE_TIMEOUT:
+            close_incoming_transfer(ctx, transfer)
+    call_later(ctx["timers"], IDLE_SWEEP_INTERVAL, evict_idle, ctx)
+
+
+## Arbeitet alle neuen Kommandos aus der net_queue ab.
+def handle_commands(ctx, bridge, mask):
+    """
+    Wird aufgerufen, sobald das CLI etwas in die net_queue gelegt hat. Kommandos sind Tupel
+    (siehe protocol.py): (CMD_MSG, empfänger, text), (CMD_MSG_MULTI, bezeichnung, empfänger, text),
+    (CMD_IMG_SEND, empfänger, dateiname, pfad), (CMD_STATS,), (CMD_STOP,). Die Sendekommandos
+    können als letztes Element eine Referenz tragen, die das Ergebnisereignis als meta["ref"]
+    zurückgibt (siehe client_api.py).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param bridge: (wake_sock, pending) aus queue_bridge
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
+    wake_sock, pending = bridge
+    drain_wakeups(wake_sock)
+    while pending:
+        cmd, *args = pending.popleft()
+        if cmd == CMD_MSG_MULTI:
+            # Sende eine Textnachricht an mehrere Peers (Gruppe oder alle)
+            label, recipients, text, ref = (*args, None)[:4]
+            send_multi(ctx, label, recipients, text, ref)
+        elif cmd == CMD_MSG:
+            # Sende eine Textnachricht an einen Peer
+            recipient, text, ref = (*args, None)[:3]
+            send_message(ctx, recipient, text, ref=ref)
+        elif cmd == CMD_STATS:
+            # Metriken sofort melden (Befehl "stats" im CLI)
+            report_metrics(ctx, force=True, reschedule=False)
+        elif cmd == CMD_STOP:
+            # Schleife nach diesem Durchlauf beenden (Programmende)
+            ctx["running"] = False
+            return
+        elif cmd == CMD_IMG_SEND:
+            # Sende ein Bild an einen Peer
+            recipient, filename, path, ref = (*args, None)[:4]
+            send_file(ctx, recipient, path, filename, ref)
+
+
+## Führt die Ergebnisse fertiger Hintergrund-Threads in der Schleife aus.
+def handle_thread_results(ctx, channel, mask):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param channel: Rückkanal aus thread_channel
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
+    run_thread_results(channel)
+
+
+## Beginnt einen nicht-blockierenden Verbindungsaufbau.
+def connect_nonblocking(address):
+    """
+    @param address: (ip, port) des Peers
+    @return: Socket im Verbindungsaufbau
+    @throws OSError: wenn der Verbindungsaufbau sofort scheitert
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setblocking(False)
+    err = s.connect_ex(address)
+    if err not in CONNECT_PENDING:
+        s.close()
+        raise OSError(err, os.strerror(err))
+    return s
+
+
+## Reiht eine Textnachricht in die Pool-Verbindung zum Empfänger ein.
+def send_message(ctx, recipient, text, report=None, ref=None):
+    """
+    Verwendet eine bestehende Verbindung zum Empfänger weiter oder baut eine neue auf.
+    Die Nachricht wird als Frame an den Sendepuffer angehängt; mehrere Nachrichten werden
+    so ohne erneuten Verbindungsaufbau hintereinander übertragen. Ist der Empfänger unbekannt
+    oder offline, wird die Nachricht im Ausgang vorgemerkt (abschaltbar mit "outbox" = false).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param text: Nachrichtentext
+    @param report: Gruppenversand (dict aus send_multi), dem das Ergebnis statt einer eigenen
+                   Meldung zugerechnet wird, oder None
+    @param ref: Referenz des Auftraggebers für die Ergebnismeldung (meta["ref"]) oder None
+    @return: None
+    """
+    address = lookup_peer(ctx["peers"], recipient)
+    conn = ctx["pool"].get(recipient)
+    offline = address is not None and lookup_state(ctx["peers"], recipient) == PEER_DEAD
+    if ctx["defer"] and (address is None or offline or queued_count(ctx["outbox"], recipient)):
+        # Nicht erreichbar oder es warten schon ältere Nachrichten: hinten im Ausgang anstellen
+        defer_message(ctx, recipient, text, report, ref)
+        return
+    if address is None:
+        reject_message(ctx, recipient, report, EVENT_WARNING, "unbekannt (Tipp: who ausführen)", ref)
+        return
+    if offline:
+        reject_message(ctx, recipient, report, EVENT_ERROR, "offline", ref)
+        return
+    if conn is not None and len(conn["pending"]) >= POOL_QUEUE_LIMIT:
+        if ctx["defer"]:
+            # Verbindung kommt nicht hinterher: im Ausgang anstellen statt verwerfen
+            defer_message(ctx, recipient, text, report, ref)
+        else:
+            reject_message(ctx, recipient, report, EVENT_WARNING, "zu viele offene Nachrichten", ref)
+        return
+    if conn is not None and conn["address"] != address:
+        # Peer hat eine neue Adresse: alte Verbindung verwerfen, offene Nachrichten mitnehmen
+        backlog = conn["pending"]
+        conn["pending"] = collections.deque()
+        drop_pooled(ctx, conn)
+        conn = None
+    else:
+        backlog = collections.deque()
+
+    # Eintrag: [Frame, Nachricht, Erfolgsmeldung, Gruppenversand, Zeitpunkt, Referenz, Nachrichten-ID];
+    # das Frame entsteht erst mit der Verbindung, weil es vom Komprimierungsstrom der Verbindung abhängt
+    entry = [None, text.encode(), f"[System] Nachricht an {recipient} gesendet.", report, time.monotonic(), ref,
+             uuid.uuid4().bytes]
+    if conn is None:
+        backlog.append(entry)
+        conn = {
+            "recipient": recipient, "address": address, "pending": backlog,
+            "attempts": 0, "last_used": time.monotonic(), "retry": None, "watchdog": None,
+        }
+        ctx["pool"][recipient] = conn
+        open_pooled(ctx, conn)
+    else:
+        if not conn["pending"]:
+            # Zeitlimit zählt erst ab der ersten offenen Nachricht
+            conn["progress"] = time.monotonic()
+        conn["pending"].append(entry)
+        if conn["legacy"]:
+            # Eine Nachricht pro Verbindung: sie folgt, sobald die vorherige gesendet ist
+            return
+        entry[0] = message_frame(ctx, conn, entry[1], entry[6])
+        conn["outbuf"] += entry[0]
+        conn["last_used"] = time.monotonic()
+        if conn["connected"]:
+            ctx["sel"].modify(conn["sock"], selectors.EVENT_READ | selectors.EVENT_WRITE, (handle_pooled, conn))
+
+
+## Meldet, dass eine Nachricht gar nicht erst eingereiht wurde.
+def reject_message(ctx, recipient, report, kind, reason, ref=None):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param report: Gruppenversand oder None
+    @param kind: Ereignisart für die Einzelmeldung (EVENT_WARNING, EVENT_ERROR)
+    @param reason: Grund
+    @param ref: Referenz des Auftraggebers oder None
+    @return: None
+    """
+    inc(ctx["metrics"], "messages_rejected_total", reason=reason.split(" (")[0])
+    if report is not None:
+        multi_result(ctx, report, recipient, reason)
+    else:
+        prefix = "[Fehler]" if kind == EVENT_ERROR else "[Warnung]"
+        post(ctx["ui_queue"], kind, f"{prefix} Nachricht an {recipient} nicht gesendet: {reason}.",
+             recipient=recipient, ref=ref, error=reason)
+
+
+## Merkt eine Nachricht im dauerhaften Ausgang vor und meldet das.
+def defer_message(ctx, recipient, text, report=None, ref=None):
+    """
+    Ist der Empfänger erreichbar (es warteten nur ältere Nachrichten), beginnt die Zustellung,
+    sobald die Nachricht auf der Platte steht (sync_outbox).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param text: Nachrichtentext
+    @param report: Gruppenversand oder None
+    @param ref: Referenz des Auftraggebers oder None
+    @return: None
+    """
+    try:
+        count = enqueue_message(ctx["outbox"], recipient, text)
+    except OSError as e:
+        reject_message(ctx, recipient, report, EVENT_ERROR, f"Ausgang nicht beschreibbar ({e})", ref)
+        return
+    inc(ctx["metrics"], "outbox_queued_total")
+    schedule_outbox_sync(ctx)
+    if report is not None:
+        multi_result(ctx, report, recipient, None, queued=True)
+    else:
+        post(ctx["ui_queue"], EVENT_SENT,
+             f"[System] {recipient} ist nicht erreichbar, Nachricht vorgemerkt ({count} im Ausgang).",
+             recipient=recipient, ref=ref, queued=count)
+
+
+## Plant das Schreiben des Ausgangs auf die Platte nach dem aktuellen Schleifendurchlauf ein.
+def schedule_outbox_sync(ctx):
+    """
+    So kostet ein Stapel neuer Kommandos nur ein fsync statt eines je Nachricht.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @return: None
+    """
+    if ctx["outbox_sync"] is None:
+        ctx["outbox_sync"] = call_later(ctx["timers"], 0, sync_outbox, ctx)
+
+
+## Schreibt neu vorgemerkte Nachrichten auf die Platte und startet mögliche Zustellungen.
+def sync_outbox(ctx):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @return: None
+    """
+    ctx["outbox_sync"] = None
+    try:
+        sync_outbox_store(ctx["outbox"])
+    except OSError as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Ausgang konnte nicht gespeichert werden: {e}")
+    start_deliveries(ctx)
+
+
+## Meldet beim Start, was noch im Ausgang liegt bzw. wegen Alters verworfen wurde.
+def report_outbox(ctx):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @return: None
+    """
+    queues = ctx["outbox"]["queues"]
+    if queues:
+        total = sum(len(q) for q in queues.values())
+        post(ctx["ui_queue"], EVENT_SYSTEM,
+             f"[System] {total} vorgemerkte Nachricht(en) an {', '.join(sorted(queues))} im Ausgang.")
+    if ctx["outbox"]["expired"]:
+        inc(ctx["metrics"], "outbox_expired_total", ctx["outbox"]["expired"])
+        post(ctx["ui_queue"], EVENT_WARNING,
+             f"[Warnung] {ctx['outbox']['expired']} vorgemerkte Nachricht(en) waren zu alt und wurden verworfen.")
+
+
+## Prüft, ob ein Empfänger bekannt ist und nicht als offline gilt.
+def reachable(ctx, recipient):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @return: True, wenn ein Zustellversuch sinnvoll ist
+    """
+    return lookup_peer(ctx["peers"], recipient) is not None and lookup_state(ctx["peers"], recipient) != PEER_DEAD
+
+
+## Startet Zustellungen aus dem Ausgang für wieder erreichbare Empfänger.
+def watch_outbox(ctx):
+    """
+    Läuft alle OUTBOX_POLL_INTERVAL Sekunden. Hat die Discovery die Peer-Tabelle seit der letzten
+    Prüfung geändert (JOIN, SEEN, Zustandswechsel), gelten die Wartezeiten nach Fehlversuchen nicht
+    mehr und jeder erreichbare Empfänger kommt sofort an die Reihe.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @return: None
+    """
+    sequence = peers_sequence(ctx["peers"])
+    if sequence != ctx["outbox_seq"]:
+        ctx["outbox_seq"] = sequence
+        ctx["outbox_retry"].clear()
+    start_deliveries(ctx)
+    call_later(ctx["timers"], OUTBOX_POLL_INTERVAL, watch_outbox, ctx)
+
+
+## Startet für jeden erreichbaren Empfänger mit vorgemerkten Nachrichten eine Zustellung.
+def start_deliveries(ctx):
+    """
+    Übersprungen werden Empfänger mit laufender Zustellung, solche, deren Wartezeit nach
+    einem Fehlversuch noch nicht abgelaufen ist, und solche, deren Pool-Verbindung noch ältere
+    Nachrichten offen hat (sonst überholte der Ausgang sie).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @return: None
+    """
+    now = time.monotonic()
+    for recipient in queued_recipients(ctx["outbox"]):
+        retry = ctx["outbox_retry"].get(recipient)
+        if recipient in ctx["deliveries"] or (retry and retry[1] > now) or not reachable(ctx, recipient):
+            continue
+        if recipient in ctx["pool"] and ctx["pool"][recipient]["pending"]:
+            continue
+        deliver_queued(ctx, recipient)
+
+
+## Sendet den nächsten Stapel vorgemerkter Nachrichten über eine eigene Verbindung.
+def deliver_queued(ctx, recipient, delivered=0):
+    """
+    Peers mit CAP_OUTBOX erhalten einen BATCH-Frame und bestätigen ihn mit FRAME_BATCH_ACK.
+    Andere Peers mit Fähigkeiten erhalten die Nachrichten als einzelne FRAME_MSG, ältere Versionen
+    (ohne Fähigkeiten) nur eine Nachricht im alten Format pro Verbindung; dort gilt der Stapel als
+    zugestellt, sobald alles gesendet ist.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param delivered: In diesem Durchgang bereits zugestellte Nachrichten (für die gemeinsame Meldung)
+    @return: None
+    """
+    caps = lookup_caps(ctx["peers"], recipient)
+    entries = next_batch(ctx["outbox"], recipient, limit=BATCH_MESSAGES if caps else 1)
+    if not entries:
+        return
+    batch_id = None
+    preamble = FRAME_MAGIC + encode_frame(FRAME_HELLO, ctx["username"].encode())
+    if not caps:
+        outbuf = legacy_message(ctx, entries[0]["text"].encode())
+    elif caps & CAP_OUTBOX:
+        batch_id = uuid.uuid4().bytes
+        payload = encode_batch(batch_id, [(bytes.fromhex(e["id"]), e["time"], e["text"]) for e in entries])
+        outbuf = preamble + encode_frame(FRAME_BATCH, payload)
+    else:
+        outbuf = preamble + b"".join(encode_frame(FRAME_MSG, e["text"].encode()) for e in entries)
+    now = time.monotonic()
+    delivery = {
+        "recipient": recipient, "count": len(entries), "batch_id": batch_id, "delivered": delivered,
+        "outbuf": bytearray(outbuf),
+        "inbuf": bytearray(), "connected": False, "progress": now, "connect_started": now, "watchdog": None,
+    }
+    ctx["deliveries"][recipient] = delivery
+    try:
+        delivery["sock"] = connect_nonblocking(lookup_peer(ctx["peers"], recipient))
+    except OSError as e:
+        finish_delivery(ctx, delivery, e)
+        return
+    ctx["sel"].register(delivery["sock"], selectors.EVENT_WRITE, (handle_delivery, delivery))
+    watch_progress(ctx, delivery, check_delivery)
+
+
+## Bedient die Verbindung einer Zustellung aus dem Ausgang.
+def handle_delivery(ctx, delivery, mask):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param delivery: Zustand der Zustellung (dict)
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
+    s = delivery["sock"]
+    try:
+        if not delivery["connected"]:
+            err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise OSError(err, os.strerror(err))
+            delivery["connected"] = True
+            observe(ctx["metrics"], "connect_seconds", time.monotonic() - delivery["connect_started"],
+                    peer=delivery["recipient"])
+        delivery["progress"] = time.monotonic()
+        if mask & selectors.EVENT_READ:
+            data = s.recv(4096)
+            if not data:
+                raise ConnectionResetError("Verbindung vom Empfänger geschlossen")
+            delivery["inbuf"] += data
+            if batch_acknowledged(delivery):
+                finish_delivery(ctx, delivery, None)
+                return
+        if delivery["outbuf"]:
+            sent = s.send(delivery["outbuf"])
+            inc(ctx["metrics"], "bytes_sent_total", sent)
+            del delivery["outbuf"][:sent]
+        if delivery["outbuf"]:
+            ctx["sel"].modify(s, selectors.EVENT_READ | selectors.EVENT_WRITE, (handle_delivery, delivery))
+        elif delivery["batch_id"] is None:
+            # Ältere Peers bestätigen nicht: vollständig gesendet gilt als zugestellt
+            finish_delivery(ctx, delivery, None)
+        else:
+            ctx["sel"].modify(s, selectors.EVENT_READ, (handle_delivery, delivery))
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError as e:
+        finish_delivery(ctx, delivery, e)
+
+
+## Sucht im Empfangspuffer einer Zustellung die Bestätigung ihres Stapels.
+def batch_acknowledged(delivery):
+    """
+    @param delivery: Zustand der Zustellung (dict)
+    @return: True, wenn FRAME_BATCH_ACK mit der eigenen Stapel-ID angekommen ist
+    @throws OSError: wenn der Empfänger ein zu großes Frame schickt
+    """
+    buf = delivery["inbuf"]
+    pos = 0
+    while len(buf) - pos >= FRAME_HEADER.size:
+        frame_type, length = FRAME_HEADER.unpack_from(buf, pos)
+        if length > MAX_FRAME_BYTES:
+            raise OSError("Antwort des Empfängers zu groß")
+        end = pos + FRAME_HEADER.size + length
+        if len(buf) < end:
+            break
+        if frame_type == FRAME_BATCH_ACK and buf[pos + FRAME_HEADER.size:end] == delivery["batch_id"]:
+            return True
+        pos = end
+    del buf[:pos]
+    return False
+
+
+## Bricht eine Zustellung ab, die zu lange keinen Fortschritt macht.
+def check_delivery(ctx, delivery):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param delivery: Zustand der Zustellung (dict)
+    @return: None
+    """
+    delivery["watchdog"] = None
+    if "sock" not in delivery:
+        return
+    if time.monotonic() - delivery["progress"] >= progress_limit(delivery):
+        phase = "Senden" if delivery["connected"] else "Verbindungsaufbau"
+        finish_delivery(ctx, delivery, TimeoutError(f"Zeitüberschreitung beim {phase}"))
+        return
+    watch_progress(ctx, delivery, check_delivery)
+
+
+## Schließt eine Zustellung ab und entfernt bei Erfolg den Stapel aus dem Ausgang.
+def finish_delivery(ctx, delivery, error):
+    """
+    Bei Erfolg folgt sofort der nächste Stapel. Nach einem Fehler bleibt der Stapel im Ausgang;
+    der nächste Versuch folgt mit wachsender Wartezeit bzw. sobald sich die Peer-Tabelle ändert.
+    Gemeldet wird einmal pro Durchgang, wenn er endet.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param delivery: Zustand der Zustellung (dict)
+    @param error: None bei Erfolg, sonst der Fehler
+    @return: None
+    """
+    recipient = delivery["recipient"]
+    ctx["deliveries"].pop(recipient, None)
+    if delivery["watchdog"] is not None:
+        cancel_timer(delivery["watchdog"])
+        delivery["watchdog"] = None
+    s = delivery.pop("sock", None)
+    if s is not None:
+        try:
+            ctx["sel"].unregister(s)
+        except (KeyError, ValueError):
+            pass
+        s.close()
+    delivered = delivery["delivered"]
+    if error is not None:
+        attempts = ctx["outbox_retry"].get(recipient, (0, 0))[0] + 1
+        delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+        ctx["outbox_retry"][recipient] = (attempts, time.monotonic() + delay)
+        inc(ctx["metrics"], "connection_failures_total", peer=recipient)
+        if delivered:
+            report_delivered(ctx, recipient, delivered, queued_count(ctx["outbox"], recipient))
+        return
+    ctx["outbox_retry"].pop(recipient, None)
+    try:
+        remaining = confirm_batch(ctx["outbox"], recipient, delivery["count"])
+    except OSError as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Ausgang konnte nicht gespeichert werden: {e}")
+        return
+    inc(ctx["metrics"], "outbox_delivered_total", delivery["count"])
+    inc(ctx["metrics"], "messages_sent_total", delivery["count"])
+    delivered += delivery["count"]
+    if remaining and ctx["running"]:
+        deliver_queued(ctx, recipient, delivered)
+    else:
+        report_delivered(ctx, recipient, delivered, remaining)
+
+
+## Meldet die in einem Durchgang aus dem Ausgang zugestellten Nachrichten.
+def report_delivered(ctx, recipient, count, remaining):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param count: Anzahl zugestellter Nachrichten
+    @param remaining: Anzahl weiterhin vorgemerkter Nachrichten
+    @return: None
+    """
+    post(ctx["ui_queue"], EVENT_SENT, f"[System] {count} vorgemerkte Nachricht(en) an {recipient} zugestellt.",
+         recipient=recipient, count=count, remaining=remaining)
+
+
+## Sendet eine Textnachricht an mehrere Empfänger gleichzeitig.
+def send_multi(ctx, label, recipients, text, ref=None):
+    """
+    Die Nachricht wird an höchstens FANOUT_WORKERS Empfänger zugleich in die jeweilige
+    Pool-Verbindung eingereiht; jedes Ergebnis gibt den Platz für den nächsten Empfänger frei.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param label: Bezeichnung für den Zustellbericht (z.B. "all" oder "@team")
+    @param recipients: Liste der Nutzernamen
+    @param text: Nachrichtentext
+    @param ref: Referenz des Auftraggebers für den Zustellbericht oder None
+    @return: None
+    """
+    report = {
+        "label": label, "text": text, "ref": ref, "waiting": collections.deque(dict.fromkeys(r for r in recipients if r)),
+        "active": 0, "delivered": 0, "queued": 0, "failed": {}, "started": time.monotonic(), "filling": False,
+    }
+    report["total"] = len(report["waiting"])
+    fill_multi(ctx, report)
+
+
+## Startet wartende Empfänger eines Gruppenversands, bis FANOUT_WORKERS erreicht ist.
+def fill_multi(ctx, report):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param report: Gruppenversand (dict)
+    @return: None
+    """
+    report["filling"] = True
+    while report["waiting"] and report["active"] < FANOUT_WORKERS:
+        recipient = report["waiting"].popleft()
+        report["active"] += 1
+        send_message(ctx, recipient, report["text"], report)
+    report["filling"] = False
+    if not report["waiting"] and not report["active"]:
+        finish_multi(ctx, report)
+
+
+## Verbucht das Ergebnis eines Empfängers eines Gruppenversands.
+def multi_result(ctx, report, recipient, error, queued=False):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param report: Gruppenversand (dict)
+    @param recipient: Nutzername des Empfängers
+    @param error: None bei Erfolg, sonst der Grund
+    @param queued: True, wenn die Nachricht im Ausgang vorgemerkt wurde
+    @return: None
+    """
+    report["active"] -= 1
+    if queued:
+        report["queued"] += 1
+    elif error is None:
+        report["delivered"] += 1
+    else:
+        report["failed"][recipient] = str(error)
+    if not report["filling"]:
+        fill_multi(ctx, report)
+
+
+## Meldet den gemeinsamen Zustellbericht eines Gruppenversands.
+def finish_multi(ctx, report):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param report: Gruppenversand (dict)
+    @return: None
+    """
+    elapsed = time.monotonic() - report["started"]
+    failed = report["failed"]
+    text = (f"[System] Nachricht an {report['label']}: {report['delivered']} von {report['total']} "
+            f"zugestellt" + (f", {report['queued']} vorgemerkt" if report["queued"] else "") + f" ({elapsed:.2f} s).")
+    if failed:
+        names = [f"{name} ({reason})" for name, reason in list(failed.items())[:FANOUT_REPORT_NAMES]]
+        more = len(failed) - len(names)
+        text += " Fehlgeschlagen: " + ", ".join(names) + (f" und {more} weitere" if more > 0 else "")
+    post(ctx["ui_queue"], EVENT_WARNING if failed else EVENT_SENT, text, label=report["label"],
+         total=report["total"], delivered=report["delivered"], queued=report["queued"], failed=dict(failed),
+         seconds=elapsed,
+         ref=report["ref"])
+
+
+## Erzeugt das Frame einer Textnachricht für eine Pool-Verbindung.
+def message_frame(ctx, conn, body, message_id):
+    """
+    Komprimiert wird nur, wenn die Verbindung einen zlib-Strom hat und die Nachricht mindestens
+    COMPRESS_MIN_BYTES lang ist. Die Frames müssen in Sendereihenfolge erzeugt werden.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @param body: Nachricht (UTF-8)
+    @param message_id: Nachrichten-ID (16 Bytes); nur gesendet, wenn der Empfänger bestätigt
+    @return: Frame als bytes
+    """
+    prefix = message_id if conn["acked"] else b""
+    if conn["deflate"] is None or len(body) < COMPRESS_MIN_BYTES:
+        return encode_frame(FRAME_MSG_ID if prefix else FRAME_MSG, prefix + body)
+    packed = deflate_message(conn["deflate"], body)
+    inc(ctx["metrics"], "compression_input_bytes_total", len(body), kind="message")
+    inc(ctx["metrics"], "compression_output_bytes_total", len(packed), kind="message")
+    return encode_frame(FRAME_MSG_ID_Z if prefix else FRAME_MSG_Z, prefix + packed)
+
+
+## Erzeugt eine Textnachricht im Format älterer Versionen (ohne Framing).
+def legacy_message(ctx, body):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param body: Nachricht (UTF-8)
+    @return: "absender: text" als bytes
+    """
+    return ctx["username"].encode() + b": " + body
+
+
+## Baut die Pool-Verbindung (neu) auf und füllt den Sendepuffer.
+def open_pooled(ctx, conn):
+    """
+    Der Sendepuffer beginnt mit FRAME_MAGIC und dem HELLO-Frame, danach folgen alle noch
+    nicht bestätigten Nachrichten-Frames (auch bereits gesendete, deren Bestätigung fehlt).
+    Jede Verbindung beginnt einen neuen Komprimierungsstrom, die Frames werden deshalb neu erzeugt.
+
+    Hat der Empfänger keine Fähigkeiten angekündigt (ältere Version), trägt die Verbindung nur die
+    älteste offene Nachricht im alten Format ("absender: text", ohne FRAME_MAGIC); ältere Versionen
+    lesen eine Nachricht pro Verbindung. Die nächste folgt über eine neue Verbindung (next_legacy).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @return: None
+    """
+    caps = lookup_caps(ctx["peers"], conn["recipient"])
+    conn["legacy"] = not caps
+    conn["deflate"] = new_deflater() if ctx["compress"] and caps & CAP_COMPRESS else None
+    conn["acked"] = bool(caps & CAP_OUTBOX)   # Empfänger bestätigt jede Nachricht (FRAME_MSG_ID)
+    if conn["legacy"]:
+        entry = conn["pending"][0]
+        entry[0] = legacy_message(ctx, entry[1])
+        preamble = b""
+        conn["outbuf"] = bytearray(entry[0])
+    else:
+        preamble = FRAME_MAGIC + encode_frame(FRAME_HELLO, ctx["username"].encode())
+        conn["outbuf"] = bytearray(preamble)
+        for entry in conn["pending"]:
+            entry[0] = message_frame(ctx, conn, entry[1], entry[6])
+            conn["outbuf"] += entry[0]
+    conn["inbuf"] = bytearray()
+    conn["skip"] = len(preamble)   # Bytes am Pufferanfang, die zu keiner Nachricht gehören
+    conn["written"] = 0            # Vollständig gesendete, noch unbestätigte Einträge am Anfang von pending
+    conn["head_sent"] = 0          # Bereits gesendete Bytes des ersten ungesendeten Frames
+    conn["connected"] = False
+    conn["progress"] = conn["connect_started"] = time.monotonic()
+    try:
+        conn["sock"] = connect_nonblocking(conn["address"])
+    except OSError as e:
+        fail_pooled(ctx, conn, e)
+        return
+    ctx["sel"].register(conn["sock"], selectors.EVENT_WRITE, (handle_pooled, conn))
+    watch_progress(ctx, conn, check_pooled)
+
+
+## Plant die nächste Fortschrittsprüfung einer Verbindung ein.
+def watch_progress(ctx, state, check):
+    """
+    Die Prüfung wird zu dem Zeitpunkt fällig, an dem das Zeitlimit ohne weiteren Fortschritt
+    abliefe (CONNECT_TIMEOUT im Verbindungsaufbau, danach SEND_TIMEOUT). Fortschritt selbst
+    setzt nur den Zeitstempel state["progress"].
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param state: Zustand einer Pool- oder Sendeverbindung (dict)
+    @param check: Prüffunktion check(ctx, state)
+    @return: None
+    """
+    delay = max(0.0, state["progress"] + progress_limit(state) - time.monotonic())
+    state["watchdog"] = call_later(ctx["timers"], delay, check, ctx, state)
+
+
+## Liefert das Zeitlimit, das für eine Verbindung gerade gilt.
+def progress_limit(state):
+    """
+    @param state: Zustand einer Pool- oder Sendeverbindung (dict)
+    @return: Zeitlimit in Sekunden
+    """
+    return SEND_TIMEOUT if state["connected"] else CONNECT_TIMEOUT
+
+
+## Bricht eine Pool-Verbindung ab, die mit offenen Nachrichten zu lange keinen Fortschritt macht.
+def check_pooled(ctx, conn):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @return: None
+    """
+    conn["watchdog"] = None
+    if "sock" not in conn:
+        return
+    if conn["pending"] and time.monotonic() - conn["progress"] >= progress_limit(conn):
+        phase = "Senden" if conn["connected"] else "Verbindungsaufbau"
+        fail_pooled(ctx, conn, TimeoutError(f"Zeitüberschreitung beim {phase}"))
+        return
+    watch_progress(ctx, conn, check_pooled)
+
+
+## Bedient eine Pool-Verbindung (Verbindungsaufbau, Senden, Verbindungsende).
+def handle_pooled(ctx, conn, mask):
+    """
+    Schreibt den Sendepuffer, sobald der Socket beschreibbar ist, und liest die Bestätigungen
+    des Empfängers. Schließt der Empfänger die Verbindung, wird sie aus dem Pool entfernt bzw. für
+    offene Nachrichten neu aufgebaut.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
+    s = conn["sock"]
+    try:
+        if not conn["connected"]:
+            err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise OSError(err, os.strerror(err))
+            conn["connected"] = True
+            observe(ctx["metrics"], "connect_seconds", time.monotonic() - conn["connect_started"],
+                    peer=conn["recipient"])
+        conn["progress"] = time.monotonic()
+
+        if mask & selectors.EVENT_READ:
+            data = s.recv(4096)
+            if not data:
+                raise ConnectionResetError("Verbindung vom Empfänger geschlossen")
+            conn["inbuf"] += data
+            read_pooled_acks(ctx, conn)
+
+        if conn["outbuf"]:
+            sent = s.send(conn["outbuf"])
+            inc(ctx["metrics"], "bytes_sent_total", sent)
+            del conn["outbuf"][:sent]
+            confirm_sent(ctx, conn, sent)
+        if not conn["outbuf"] and conn["legacy"]:
+            conn["attempts"] = 0
+            next_legacy(ctx, conn)
+        elif not conn["outbuf"]:
+            if not conn["acked"]:
+                # Ohne Bestätigungen ist vollständig gesendet der einzige Erfolg
+                conn["attempts"] = 0
+            ctx["sel"].modify(s, selectors.EVENT_READ, (handle_pooled, conn))
+        else:
+            ctx["sel"].modify(s, selectors.EVENT_READ | selectors.EVENT_WRITE, (handle_pooled, conn))
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError as e:
+        fail_pooled(ctx, conn, e)
+
+
+## Ordnet gesendete Bytes den Frames zu und meldet fertige Nachrichten.
+def confirm_sent(ctx, conn, sent):
+    """
+    Bestätigt der Empfänger (conn["acked"]), bleibt eine vollständig gesendete Nachricht bis zu
+    ihrer Bestätigung in pending (read_pooled_acks); sonst gilt sie sofort als gesendet.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @param sent: Anzahl soeben gesendeter Bytes
+    @return: None
+    """
+    skipped = min(sent, conn["skip"])
+    conn["skip"] -= skipped
+    sent -= skipped
+    pending = conn["pending"]
+    while sent and len(pending) > conn["written"]:
+        frame = pending[conn["written"]][0]
+        take = min(sent, len(frame) - conn["head_sent"])
+        conn["head_sent"] += take
+        sent -= take
+        if conn["head_sent"] == len(frame):
+            conn["head_sent"] = 0
+            if conn["acked"]:
+                conn["written"] += 1
+            else:
+                message_done(ctx, conn, pending.popleft())
+
+
+## Liest die Bestätigungen (FRAME_BATCH_ACK) einer Pool-Verbindung und meldet die Nachrichten.
+def read_pooled_acks(ctx, conn):
+    """
+    Der Empfänger bestätigt in Sendereihenfolge; eine Bestätigung, die nicht zur ältesten
+    gesendeten Nachricht passt, wird ignoriert.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @return: None
+    @throws OSError: wenn der Empfänger ein zu großes Frame schickt
+    """
+    buf = conn["inbuf"]
+    pending = conn["pending"]
+    pos = 0
+    while len(buf) - pos >= FRAME_HEADER.size:
+        frame_type, length = FRAME_HEADER.unpack_from(buf, pos)
+        if length > MAX_FRAME_BYTES:
+            raise OSError("Antwort des Empfängers zu groß")
+        end = pos + FRAME_HEADER.size + length
+        if len(buf) < end:
+            break
+        if frame_type == FRAME_BATCH_ACK and conn["written"] and buf[pos + FRAME_HEADER.size:end] == pending[0][6]:
+            conn["written"] -= 1
+            conn["attempts"] = 0
+            message_done(ctx, conn, pending.popleft())
+        pos = end
+    del buf[:pos]
+    if not pending and queued_count(ctx["outbox"], conn["recipient"]):
+        # Die Verbindung hat nichts mehr offen: jetzt darf der Ausgang zustellen
+        start_deliveries(ctx)
+
+
+## Meldet eine zugestellte Nachricht einer Pool-Verbindung.
+def message_done(ctx, conn, entry):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @param entry: Eintrag aus conn["pending"]
+    @return: None
+    """
+    _, _, done_msg, report, queued, ref, _ = entry
+    inc(ctx["metrics"], "messages_sent_total")
+    observe(ctx["metrics"], "message_send_seconds", time.monotonic() - queued, peer=conn["recipient"])
+    if report is not None:
+        multi_result(ctx, report, conn["recipient"], None)
+    else:
+        post(ctx["ui_queue"], EVENT_SENT, done_msg, recipient=conn["recipient"], ref=ref)
+
+
+## Schließt die Verbindung einer gesendeten Nachricht im alten Format und startet die nächste.
+def next_legacy(ctx, conn):
+    """
+    Ältere Versionen lesen die Nachricht bis zum Verbindungsende; erst das Schließen stellt sie zu.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @return: None
+    """
+    drop_pooled(ctx, conn)
+    if conn["pending"]:
+        ctx["pool"][conn["recipient"]] = conn
+        open_pooled(ctx, conn)
+    elif queued_count(ctx["outbox"], conn["recipient"]):
+        # Die Verbindung hat nichts mehr offen: jetzt darf der Ausgang zustellen
+        start_deliveries(ctx)
+
+
+## Behandelt eine abgebrochene Pool-Verbindung.
+def fail_pooled(ctx, conn, error):
+    """
+    Sind noch Nachrichten offen, wird die Verbindung bis zu POOL_RECONNECT_ATTEMPTS-mal mit
+    wachsender Wartezeit neu aufgebaut, solange der Empfänger nicht als offline gilt. Danach
+    werden die offenen Nachrichten im Ausgang vorgemerkt (bzw. ohne Ausgang als fehlgeschlagen
+    gemeldet).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @param error: Aufgetretener Fehler
+    @return: None
+    """
+    drop_pooled(ctx, conn)
+    if not conn["pending"]:
+        return
+    recipient = conn["recipient"]
+    inc(ctx["metrics"], "connection_failures_total", peer=recipient)
+    if conn["attempts"] < POOL_RECONNECT_ATTEMPTS and lookup_state(ctx["peers"], recipient) != PEER_DEAD:
+        conn["attempts"] += 1
+        conn["connected"] = False
+        ctx["pool"][recipient] = conn
+        delay = POOL_RETRY_DELAY * 2 ** (conn["attempts"] - 1) * random.uniform(1, 1.5)
+        conn["retry"] = call_later(ctx["timers"], delay, retry_pooled, ctx, conn)
+        return
+    pending = conn["pending"]
+    conn["pending"] = collections.deque()
+    if ctx["defer"]:
+        # Statt zu verwerfen im Ausgang vormerken; zugestellt wird, sobald der Peer wieder da ist
+        defer_pending(ctx, recipient, pending)
+    else:
+        fail_pending(ctx, recipient, pending, error)
+
+
+## Meldet offene Nachrichten einer Pool-Verbindung als fehlgeschlagen (eine Meldung pro Empfänger).
+def fail_pending(ctx, recipient, pending, error):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param pending: Offene Einträge der Verbindung
+    @param error: Grund
+    @return: None
+    """
+    refs = []
+    for _, _, _, report, _, ref, _ in pending:
+        if report is not None:
+            multi_result(ctx, report, recipient, error)
+        else:
+            refs.append(ref)
+    inc(ctx["metrics"], "messages_failed_total", len(pending))
+    if refs:
+        what = "Nachricht" if len(refs) == 1 else f"{len(refs)} Nachrichten"
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] {what} an {recipient} nicht gesendet: {error}",
+             recipient=recipient, count=len(refs), refs=refs, error=str(error))
+
+
+## Merkt offene Nachrichten einer Pool-Verbindung im Ausgang vor (eine Meldung pro Empfänger).
+def defer_pending(ctx, recipient, pending):
+    """
+    Lässt sich der Ausgang nicht beschreiben, werden die restlichen Nachrichten als
+    fehlgeschlagen gemeldet.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param pending: Offene Einträge der Verbindung
+    @return: None
+    """
+    pending = list(pending)
+    refs, count = [], 0
+    for i, (_, body, _, report, _, ref, message_id) in enumerate(pending):
+        try:
+            # Dieselbe ID: Hat der Empfänger die Nachricht schon angezeigt, überspringt er sie
+            count = enqueue_message(ctx["outbox"], recipient, body.decode(), message_id.hex())
+        except OSError as e:
+            fail_pending(ctx, recipient, pending[i:], f"Ausgang nicht beschreibbar ({e})")
+            break
+        inc(ctx["metrics"], "outbox_queued_total")
+        if report is not None:
+            multi_result(ctx, report, recipient, None, queued=True)
+        else:
+            refs.append(ref)
+    if count:
+        schedule_outbox_sync(ctx)
+    if refs:
+        post(ctx["ui_queue"], EVENT_SENT,
+             f"[System] {recipient} ist nicht erreichbar, {len(refs)} Nachricht(en) vorgemerkt ({count} im Ausgang).",
+             recipient=recipient, count=len(refs), refs=refs, queued=count)
+
+
+## Baut eine Pool-Verbindung nach der Wartezeit neu auf.
+def retry_pooled(ctx, conn):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @return: None
+    """
+    conn["retry"] = None
+    if ctx["pool"].get(conn["recipient"]) is conn:
+        open_pooled(ctx, conn)
+
+
+## Entfernt eine Pool-Verbindung und schließt ihren Socket.
+def drop_pooled(ctx, conn):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param conn: Zustand der Pool-Verbindung (dict)
+    @return: None
+    """
+    if ctx["pool"].get(conn["recipient"]) is conn:
+        del ctx["pool"][conn["recipient"]]
+    for timer in ("retry", "watchdog"):
+        if conn[timer] is not None:
+            cancel_timer(conn[timer])
+            conn[timer] = None
+    s = conn.pop("sock", None)
+    if s is not None:
+        try:
+            ctx["sel"].unregister(s)
+        except (KeyError, ValueError):
+            pass
+        s.close()
+
+
+## Startet eine blockweise Dateiübertragung an einen Peer.
+def send_file(ctx, recipient, path, filename, ref=None):
+    """
+    Berechnet zunächst in einem Hintergrund-Thread das Manifest der Datei (und ggf. die
+    Entropie-Stichprobe), damit die Ereignisschleife beim Hashen großer Dateien nicht blockiert.
+    Ältere Versionen (ohne Fähigkeiten) erhalten die Datei ohne Manifest im alten Format
+    ("IMG filename size", nach deren OK die Daten am Stück).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param recipient: Nutzername des Empfängers
+    @param path: Pfad der Datei
+    @param filename: Dateiname, unter dem der Empfänger speichert
+    @param ref: Referenz des Auftraggebers für die Ergebnismeldung (meta["ref"]) oder None
+    @return: None
+    """
+    address = lookup_peer(ctx["peers"], recipient)
+    if address is None:
+        post(ctx["ui_queue"], EVENT_WARNING,
+             f"[Warnung] Empfänger {recipient} nicht gefunden. (Tipp: who ausführen)",
+             ref=ref, error="unbekannt")
+        return
+    if lookup_state(ctx["peers"], recipient) == PEER_DEAD:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] {recipient} ist offline, nicht gesendet.",
+             ref=ref, error="offline")
+        return
+    caps = lookup_caps(ctx["peers"], recipient)
+    job = {
+        "recipient": recipient, "address": address, "path": path,
+        "filename": filename, "streams": [], "attempts": 0, "nacks": 0, "finished": False,
+        "started": time.monotonic(), "binary": bool(caps & CAP_BINARY), "legacy": not caps,
+        "compress": bool(ctx["compress"] and caps & CAP_COMPRESS), "key": file_key(path), "ref": ref,
+    }
+    if job["legacy"]:
+        start_job(ctx, job)
+        return
+    cached = ctx["manifests"].get(job["key"])
+    if cached is not None:
+        # Dieselbe, unveränderte Datei wurde gerade erst gesendet (z.B. an mehrere Empfänger)
+        ctx["manifests"].move_to_end(job["key"])
+        manifest_ready(ctx, job, cached, None)
+        return
+    run_in_thread(ctx["threads"], functools.partial(manifest_ready, ctx, job), inspect_file, path)
+
+
+## Schlüssel für den Manifest-Cache des Senders.
+def file_key(path):
+    """
+    @param path: Pfad der Datei
+    @return: (absoluter Pfad, Größe, Änderungszeit) oder None, wenn die Datei fehlt
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+## Berechnet Manifest und Komprimierbarkeit einer Datei (läuft im Hintergrund-Thread).
+def inspect_file(path):
+    """
+    @param path: Pfad der Datei
+    @return: (manifest, compressible) – compressible aus der Entropie-Stichprobe
+    """
+    return build_manifest(path), probe_file(path)
+
+
+## Setzt die Übertragung fort, sobald das Manifest berechnet ist.
+def manifest_ready(ctx, job, result, error):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param job: Sendeauftrag (dict)
+    @param result: (manifest, compressible) aus inspect_file bzw. dem Manifest-Cache oder None
+    @param error: Ausnahme aus inspect_file oder None
+    @return: None
+    """
+    if error is not None:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildversand fehlgeschlagen: {error}",
+             ref=job["ref"], error=str(error))
+        return
+    manifest, compressible = result
+    job["compress"] = job["compress"] and compressible
+    if job["key"] is not None:
+        ctx["manifests"][job["key"]] = result
+        while len(ctx["manifests"]) > MANIFEST_CACHE_SIZE:
+            ctx["manifests"].popitem(last=False)
+    job["manifest"] = manifest
+    start_job(ctx, job)
+
+
+## Öffnet die Datei eines Sendeauftrags und baut die erste Verbindung auf.
+def start_job(ctx, job):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param job: Sendeauftrag (dict)
+    @return: None
+    """
+    try:
+        job["file"] = open(job["path"], "rb")
+    except OSError as e:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildversand fehlgeschlagen: {e}", ref=job["ref"], error=str(e))
+        return
+    ctx["jobs"].append(job)
+    job["queue"] = collections.deque()
+    open_stream(ctx, job, first=True)
+
+
+## Öffnet eine Verbindung für einen Sendeauftrag.
+def open_stream(ctx, job, first):
+    """
+    Die erste Verbindung schickt das OFFER und wartet auf NEED; weitere Verbindungen melden
+    sich mit ATTACH an und beginnen sofort mit dem Senden von Blöcken aus der gemeinsamen Warteschlange.
+    Bei älteren Versionen schickt die einzige Verbindung den Header "IMG filename size" und wartet auf OK.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param job: Sendeauftrag (dict)
+    @param first: True für die Verbindung, die das OFFER sendet
+    @return: None
+    """
+    outbuf = bytearray(FRAME_MAGIC + encode_frame(FRAME_HELLO, ctx["username"].encode()))
+    if job["legacy"]:
+        # Größe bei jedem Versuch neu lesen, gesendet wird am Stück bis zu dieser Länge
+        job["size"] = os.fstat(job["file"].fileno()).st_size
+        outbuf = bytearray(f"IMG {job['filename']} {job['size']}\n".encode())
+    elif first and job["binary"]:
+        outbuf += encode_frame(FRAME_OFFER_BIN, encode_offer(job["filename"], job["manifest"]))
+    elif first:
+        offer = {"name": job["filename"], "manifest": job["manifest"]}
+        outbuf += encode_frame(FRAME_OFFER, json.dumps(offer).encode())
+    else:
+        outbuf += encode_frame(FRAME_ATTACH, job["manifest"]["id"].encode())
+    stream = {
+        "job": job, "outbuf": outbuf, "buf": bytearray(), "connected": False,
+        "ready": not first, "inflight": collections.deque(), "sending": None, "packing": False,
+        "progress": time.monotonic(), "watchdog": None,
+    }
+    try:
+        stream["sock"] = connect_nonblocking(job["address"])
+    except OSError as e:
+        stream_failed(ctx, stream, e)
+        return
+    job["streams"].append(stream)
+    ctx["sel"].register(stream["sock"], selectors.EVENT_WRITE, (handle_stream, stream))
+    watch_progress(ctx, stream, check_stream)
+
+
+## Bricht eine Sendeverbindung ab, die zu lange keinen Fortschritt macht.
+def check_stream(ctx, stream):
+    """
+    Als untätig gilt eine Verbindung nur, solange sie noch etwas zu senden hat oder auf eine
+    Antwort des Empfängers (NEED, ACK) wartet.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @return: None
+    """
+    stream["watchdog"] = None
+    busy = (not stream["connected"] or not stream["ready"] or stream["outbuf"]
+            or stream["sending"] is not None or stream["packing"] or stream["inflight"])
+    if busy and time.monotonic() - stream["progress"] >= progress_limit(stream):
+        phase = "Senden" if stream["connected"] else "Verbindungsaufbau"
+        stream_failed(ctx, stream, TimeoutError(f"Zeitüberschreitung beim {phase}"))
+        return
+    watch_progress(ctx, stream, check_stream)
+
+
+## Bedient eine Sendeverbindung einer Dateiübertragung.
+def handle_stream(ctx, stream, mask):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @param mask: Ereignismaske des Selectors
+    @return: None
+    """
+    s = stream["sock"]
+    try:
+        if not stream["connected"]:
+            err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise OSError(err, os.strerror(err))
+            stream["connected"] = True
+        stream["progress"] = time.monotonic()
+        if mask & selectors.EVENT_READ:
+            data = s.recv(CHUNK_SIZE)
+            if not data:
+                raise ConnectionResetError("Verbindung vom Empfänger geschlossen")
+            inc(ctx["metrics"], "bytes_received_total", len(data))
+            stream["buf"] += data
+            if stream["job"]["legacy"]:
+                read_legacy_reply(stream)
+            else:
+                read_stream_frames(ctx, stream)
+            if stream["job"]["finished"]:
+                return
+        try:
+            want_write = pump_stream(ctx, stream)
+        except (BlockingIOError, InterruptedError):
+            want_write = True
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError as e:
+        stream_failed(ctx, stream, e)
+        return
+    if stream["job"]["legacy"] and stream["ready"] and not want_write:
+        # Ältere Versionen bestätigen nicht: vollständig gesendet gilt als zugestellt
+        finish_job(ctx, stream["job"])
+        return
+    events = selectors.EVENT_READ | (selectors.EVENT_WRITE if want_write else 0)
+    ctx["sel"].modify(s, events, (handle_stream, stream))
+
+
+## Schreibt Frames und Blockdaten, solange der Socket Daten annimmt.
+def pump_stream(ctx, stream):
+    """
+    Holt sich den nächsten fehlenden Block aus der gemeinsamen Warteschlange, sobald der
+    vorherige vollständig gesendet ist. Schnelle Verbindungen übernehmen so automatisch mehr Blöcke.
+    Bei komprimierter Übertragung wird der nächste Block schon gepackt, während der vorherige
+    noch gesendet wird (pack_next).
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @return: True, wenn noch Daten zu senden sind
+    @throws BlockingIOError: wenn der Socket-Puffer voll ist
+    """
+    s, job = stream["sock"], stream["job"]
+    if job["compress"]:
+        pack_next(ctx, stream)
+    while True:
+        if stream["outbuf"]:
+            sent = s.send(stream["outbuf"])
+            inc(ctx["metrics"], "bytes_sent_total", sent)
+            del stream["outbuf"][:sent]
+            if stream["outbuf"]:
+                return True
+        if stream["sending"] is not None:
+            offset, end = stream["sending"]
+            sent = send_file_block(s, job["file"], offset, end)
+            inc(ctx["metrics"], "bytes_sent_total", sent)
+            offset += sent
+            stream["sending"] = (offset, end) if offset < end else None
+            continue
+        if job["compress"]:
+            # Gepackte Blöcke kommen über chunk_packed in den Sendepuffer
+            pack_next(ctx, stream)
+            return False
+        if not stream["ready"] or not job["queue"] or len(stream["inflight"]) >= STREAM_WINDOW:
+            return False
+        index = job["queue"].popleft()
+        length = chunk_length(job["manifest"], index)
+        offset = index * job["manifest"]["chunk_size"]
+        stream["outbuf"] += FRAME_HEADER.pack(FRAME_CHUNK, CHUNK_INDEX.size + length) + CHUNK_INDEX.pack(index)
+        stream["inflight"].append(index)
+        stream["sending"] = (offset, offset + length)
+
+
+## Lässt den nächsten fehlenden Block in einem Hintergrund-Thread lesen und komprimieren.
+def pack_next(ctx, stream):
+    """
+    Pro Verbindung wird höchstens ein Block gleichzeitig gepackt, und nur, solange weniger als
+    ein Block auf das Senden wartet. Der Speicherbedarf bleibt so unabhängig von der Dateigröße.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @return: None
+    """
+    job = stream["job"]
+    if stream["packing"] or not stream["ready"] or not job["queue"] \
+            or len(stream["inflight"]) >= STREAM_WINDOW or len(stream["outbuf"]) >= job["manifest"]["chunk_size"]:
+        return
+    index = job["queue"].popleft()
+    stream["inflight"].append(index)
+    stream["packing"] = True
+    run_in_thread(ctx["threads"], functools.partial(chunk_packed, ctx, stream, index), compress_block,
+                  job["path"], index * job["manifest"]["chunk_size"], chunk_length(job["manifest"], index))
+
+
+## Hängt einen gepackten Block an den Sendepuffer der Verbindung an.
+def chunk_packed(ctx, stream, index, result, error):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @param index: Blocknummer
+    @param result: (compressed, data) aus compress_block oder None
+    @param error: Ausnahme aus compress_block oder None
+    @return: None
+    """
+    stream["packing"] = False
+    if stream not in stream["job"]["streams"]:
+        # Verbindung inzwischen geschlossen, der Block liegt wieder in der Warteschlange
+        return
+    if error is not None:
+        stream_failed(ctx, stream, error)
+        return
+    compressed, data = result
+    if compressed:
+        inc(ctx["metrics"], "compression_input_bytes_total",
+            chunk_length(stream["job"]["manifest"], index), kind="file")
+        inc(ctx["metrics"], "compression_output_bytes_total", len(data), kind="file")
+    frame_type = FRAME_CHUNK_Z if compressed else FRAME_CHUNK
+    stream["outbuf"] += FRAME_HEADER.pack(frame_type, CHUNK_INDEX.size + len(data)) + CHUNK_INDEX.pack(index)
+    stream["outbuf"] += data
+    if stream["connected"]:
+        ctx["sel"].modify(stream["sock"], selectors.EVENT_READ | selectors.EVENT_WRITE, (handle_stream, stream))
+
+
+## Verarbeitet die Antworten des Empfängers (NEED, ACK, NACK).
+def read_stream_frames(ctx, stream):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @return: None
+    """
+    job, buf = stream["job"], stream["buf"]
+    pos = 0
+    while len(buf) - pos >= FRAME_HEADER.size and not job["finished"]:
+        frame_type, length = FRAME_HEADER.unpack_from(buf, pos)
+        if length > MAX_FRAME_BYTES:
+            raise OSError("Antwort des Empfängers zu groß")
+        end = pos + FRAME_HEADER.size + length
+        if len(buf) < end:
+            break
+        payload = bytes(buf[pos + FRAME_HEADER.size:end])
+        pos = end
+        if frame_type in (FRAME_NEED, FRAME_NEED_BIN):
+            try:
+                needed = decode_need(payload) if frame_type == FRAME_NEED_BIN else json.loads(payload)
+            except ValueError as e:
+                raise OSError(f"ungültige NEED-Antwort: {e}") from e
+            job["queue"] = collections.deque(needed)
+            job["remaining"] = set(needed)
+            stream["ready"] = True
+            if not needed:
+                finish_job(ctx, job)
+                return
+            if job["manifest"]["size"] >= PARALLEL_THRESHOLD:
+                extra = min(PARALLEL_STREAMS, len(needed)) - len(job["streams"])
+                for _ in range(extra):
+                    open_stream(ctx, job, first=False)
+        elif frame_type in (FRAME_ACK, FRAME_NACK):
+            (index,) = CHUNK_INDEX.unpack(payload)
+            if index in stream["inflight"]:
+                stream["inflight"].remove(index)
+            if frame_type == FRAME_ACK:
+                job["remaining"].discard(index)
+                if not job["remaining"]:
+                    finish_job(ctx, job)
+                    return
+            else:
+                job["nacks"] += 1
+                if job["nacks"] > MAX_NACKS:
+                    finish_job(ctx, job, OSError("Prüfsummen stimmen wiederholt nicht (Datei verändert?)"))
+                    return
+                job["queue"].appendleft(index)
+                wake_streams(ctx, job)
+    del buf[:pos]
+
+
+## Wertet die Antwort einer älteren Version auf den Bild-Header aus.
+def read_legacy_reply(stream):
+    """
+    Nach OK wird die ganze Datei zum Senden vorgemerkt (stream["sending"]).
+
+    @param stream: Zustand der Verbindung (dict)
+    @return: None
+    @throws OSError: wenn der Empfänger etwas anderes als OK antwortet
+    """
+    if stream["ready"] or len(stream["buf"]) < 2:
+        return
+    if not stream["buf"].startswith(b"OK"):
+        raise OSError("Empfänger hat das Bild abgelehnt")
+    size = stream["job"]["size"]
+    stream["ready"] = True
+    stream["sending"] = (0, size) if size else None
+
+
+## Aktiviert die Schreibbereitschaft aller Verbindungen eines Sendeauftrags.
+def wake_streams(ctx, job):
+    """
+    Wird aufgerufen, wenn Blöcke in die Warteschlange zurückgelegt wurden.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param job: Sendeauftrag (dict)
+    @return: None
+    """
+    for stream in job["streams"]:
+        if stream["connected"]:
+            ctx["sel"].modify(stream["sock"], selectors.EVENT_READ | selectors.EVENT_WRITE, (handle_stream, stream))
+
+
+## Behandelt den Abbruch einer Sendeverbindung.
+def stream_failed(ctx, stream, error):
+    """
+    Unbestätigte Blöcke gehen zurück in die Warteschlange. Ist keine Verbindung mehr übrig,
+    wird der Transfer nach einer wachsenden Wartezeit mit einem neuen OFFER fortgesetzt.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @param error: Aufgetretener Fehler
+    @return: None
+    """
+    job = stream["job"]
+    close_stream(ctx, stream)
+    inc(ctx["metrics"], "connection_failures_total", peer=job["recipient"])
+    if job["finished"]:
+        return
+    job["queue"].extendleft(reversed(stream["inflight"]))
+    if job["streams"]:
+        wake_streams(ctx, job)
+        return
+    if job["attempts"] >= TRANSFER_RETRIES:
+        finish_job(ctx, job, error)
+        return
+    job["attempts"] += 1
+    delay = 2 ** (job["attempts"] - 1)
+    post(ctx["ui_queue"], EVENT_WARNING,
+         f"[System] Verbindung zu {job['recipient']} unterbrochen ({error}), "
+         f"neuer Versuch in {delay} s.")
+    call_later(ctx["timers"], delay, resume_job, ctx, job)
+
+
+## Setzt einen unterbrochenen Sendeauftrag mit einem neuen OFFER fort.
+def resume_job(ctx, job):
+    """
+    Eine geänderte Adresse des Empfängers (z.B. nach neuem WHO) wird dabei übernommen. Gilt der
+    Empfänger inzwischen als offline, wird der Auftrag abgebrochen.
+
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param job: Sendeauftrag (dict)
+    @return: None
+    """
+    if lookup_state(ctx["peers"], job["recipient"]) == PEER_DEAD:
+        finish_job(ctx, job, f"{job['recipient']} ist offline")
+        return
+    job["address"] = lookup_peer(ctx["peers"], job["recipient"]) or job["address"]
+    job["queue"].clear()
+    open_stream(ctx, job, first=True)
+
+
+## Schließt eine Sendeverbindung.
+def close_stream(ctx, stream):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param stream: Zustand der Verbindung (dict)
+    @return: None
+    """
+    if stream in stream["job"]["streams"]:
+        stream["job"]["streams"].remove(stream)
+    if stream["watchdog"] is not None:
+        cancel_timer(stream["watchdog"])
+        stream["watchdog"] = None
+    s = stream.get("sock")
+    if s is not None:
+        try:
+            ctx["sel"].unregister(s)
+        except (KeyError, ValueError):
+            pass
+        s.close()
+
+
+## Beendet einen Sendeauftrag und meldet das Ergebnis an das UI.
+def finish_job(ctx, job, error=None):
+    """
+    @param ctx: Laufzeitkontext des Netzwerkprozesses (dict)
+    @param job: Sendeauftrag (dict)
+    @param error: None bei Erfolg, sonst der Grund des Abbruchs
+    @return: None
+    """
+    job["finished"] = True
+    for stream in list(job["streams"]):
+        close_stream(ctx, stream)
+    job["file"].close()
+    if job in ctx["jobs"]:
+        ctx["jobs"].remove(job)
+    if error is None:
+        post(ctx["ui_queue"], EVENT_IMAGE, f"[System] Bild an {job['recipient']} gesendet: {job['filename']}",
+             recipient=job["recipient"], ref=job["ref"])
+        inc(ctx["metrics"], "images_sent_total")
+        observe(ctx["metrics"], "image_send_seconds", time.monotonic() - job["started"], peer=job["recipient"])
+    else:
+        post(ctx["ui_queue"], EVENT_ERROR, f"[Fehler] Bildversand fehlgeschlagen: {error}",
+             recipient=job["recipient"], ref=job["ref"], error=str(error))
+        inc(ctx["metrics"], "images_failed_total")
+
+
+## Sendet den nächsten Abschnitt einer Datei auf einem nicht-blockierenden Socket.
+def send_file_block(sock, file, offset, size):
+    """
+    Nutzt os.sendfile(), sodass die Daten ohne Kopie durch Python vom Dateisystem in den Socket
+    gelangen. Ohne sendfile (z.B. unter Windows) wird ein Block gelesen und normal gesendet.
+
+    @param sock: Verbundener, nicht-blockierender Socket
+    @param file: Geöffnete Quelldatei (Binärmodus)
+    @param offset: Position in der Datei, ab der gesendet wird
+    @param size: Angekündigte Gesamtgröße der Datei
+    @return: Anzahl gesendeter Bytes
+    @throws BlockingIOError: wenn der Socket-Puffer gerade voll ist
+    @throws OSError: wenn die Datei kürzer als angekündigt ist
+    """
+    count = min(SENDFILE_BLOCK, size - offset)
+    if hasattr(os, "sendfile"):
+        sent = os.sendfile(sock.fileno(), file.fileno(), offset, count)
+    else:
+        file.seek(offset)
+        block = file.read(min(CHUNK_SIZE, count))
+        sent = sock.send(block) if block else 0
+    if sent == 0:
+        raise OSError("Datei ist kürzer als angekündigt")
+    return sent
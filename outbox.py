@@ -0,0 +1,308 @@
+"""
+@file outbox.py
+@brief Dauerhafter Ausgang (Store-and-Forward) für den Peer-to-Peer-Chat "Plauderkiste".
+
+Ist ein Empfänger unbekannt oder offline, oder scheitert die Zustellung auch nach den
+Wiederholungen der Pool-Verbindung, legt der Netzwerkprozess die Nachricht hier ab, statt sie zu
+verwerfen. Jeder Empfänger hat eine eigene Datei, an die nur angehängt wird:
+
+    <outboxpath>/<Name als Hex>.queue   eine JSON-Zeile je Nachricht: {"id", "time", "text"}
+
+Sobald die Discovery den Empfänger wieder meldet, gehen seine Nachrichten in Stapeln
+(BATCH_MESSAGES) über eine einzige Verbindung hinaus, in der Reihenfolge, in der sie vorgemerkt
+wurden. Erst wenn der Empfänger einen Stapel bestätigt hat, wird er aus der Datei entfernt
+(confirm_batch schreibt den Rest atomar neu). Bricht die Verbindung vorher ab, wird derselbe Stapel
+später noch einmal gesendet.
+
+Damit eine Nachricht dabei nicht doppelt angezeigt wird, trägt jede eine zufällige ID. Der
+Empfänger merkt sich die IDs der zuletzt angezeigten Nachrichten (DEDUP_IDS) ebenfalls in diesem
+Ordner und überspringt Wiederholungen:
+
+    <outboxpath>/delivered.ids          16 Bytes je angezeigter Nachrichten-ID
+
+Nachrichten, die älter als MAX_AGE sind, werden beim Öffnen verworfen (z.B. an einen vertippten
+Namen, der nie online kommt).
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import collections
+import json
+import os
+import time
+import uuid
+
+## Dateiendung der Warteschlange eines Empfängers.
+QUEUE_EXT = "queue"
+## Datei mit den IDs bereits angezeigter Nachrichten.
+DELIVERED_FILE = "delivered.ids"
+## Länge einer Nachrichten-ID in Bytes.
+ID_BYTES = 16
+## Höchstzahl an Nachrichten pro Stapel.
+BATCH_MESSAGES = 500
+## Höchstgröße der Texte eines Stapels in Bytes (ein Frame darf höchstens 16 MiB groß sein).
+BATCH_BYTES = 4 * 1024 * 1024
+## Vorgemerkte Nachrichten, die älter sind (Sekunden), werden verworfen.
+MAX_AGE = 7 * 24 * 3600
+## Anzahl der zuletzt angezeigten Nachrichten-IDs, die für die Duplikaterkennung gemerkt werden.
+DEDUP_IDS = 20000
+
+
+## Öffnet den Ausgang in einem Ordner (legt ihn bei Bedarf an).
+def open_outbox_store(folder, max_age=MAX_AGE):
+    """
+    @param folder: Ordner für Warteschlangen und Duplikaterkennung
+    @param max_age: Höchstalter vorgemerkter Nachrichten in Sekunden
+    @return: Ausgang (dict) mit queues (Empfänger -> deque der Einträge), expired (beim Öffnen
+             verworfene Nachrichten) und den Daten der Duplikaterkennung
+    @throws OSError: wenn der Ordner nicht angelegt werden kann
+    """
+    os.makedirs(folder, exist_ok=True)
+    store = {
+        "folder": folder,
+        "queues": {},         # Empfänger -> deque der Einträge {"id", "time", "text"}
+        "files": {},          # Empfänger -> zum Anhängen geöffnete Datei
+        "dirty": set(),       # Empfänger, deren Datei noch nicht auf die Platte geschrieben ist
+        "expired": 0,
+        "seen": set(),        # IDs bereits angezeigter Nachrichten (bytes)
+        "seen_order": collections.deque(),
+        "seen_file": None,
+        "seen_dirty": False,
+    }
+    oldest = time.time() - max_age
+    for name in sorted(os.listdir(folder)):
+        stem, ext = os.path.splitext(name)
+        if ext != "." + QUEUE_EXT:
+            continue
+        try:
+            recipient = bytes.fromhex(stem).decode()
+        except ValueError:
+            continue
+        entries = read_queue(os.path.join(folder, name))
+        fresh = collections.deque(e for e in entries if e["time"] >= oldest)
+        store["expired"] += len(entries) - len(fresh)
+        if fresh:
+            store["queues"][recipient] = fresh
+        if len(fresh) != len(entries):
+            rewrite_queue(store, recipient)
+    load_delivered(store)
+    return store
+
+
+## Liest die Warteschlange eines Empfängers.
+def read_queue(path):
+    """
+    Eine nach einem Absturz unvollständige letzte Zeile wird ignoriert.
+
+    @param path: Pfad der .queue-Datei
+    @return: Liste der Einträge
+    """
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries.append({"id": str(entry["id"]), "time": float(entry["time"]), "text": str(entry["text"])})
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+## Pfad der Warteschlange eines Empfängers.
+def queue_path(store, recipient):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @param recipient: Nutzername des Empfängers
+    @return: Pfad der .queue-Datei (Name als Hex, damit jedes Zeichen erlaubt ist)
+    """
+    return os.path.join(store["folder"], f"{recipient.encode().hex()}.{QUEUE_EXT}")
+
+
+## Merkt eine Nachricht für einen Empfänger vor.
+def enqueue_message(store, recipient, text, message_id=None):
+    """
+    Die Zeile wird sofort geschrieben; sync_outbox_store bringt sie auf die Platte.
+
+    @param store: Ausgang aus open_outbox_store
+    @param recipient: Nutzername des Empfängers
+    @param text: Nachrichtentext
+    @param message_id: ID als Hex-Text, falls die Nachricht schon einmal (unbestätigt) gesendet
+                       wurde; sonst wird eine neue erzeugt
+    @return: Anzahl der nun vorgemerkten Nachrichten für diesen Empfänger
+    @throws OSError: wenn die Datei nicht geschrieben werden kann
+    """
+    entry = {"id": message_id or uuid.uuid4().hex, "time": time.time(), "text": text}
+    f = store["files"].get(recipient)
+    if f is None:
+        f = store["files"][recipient] = open(queue_path(store, recipient), "a", encoding="utf-8")
+    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    store["dirty"].add(recipient)
+    queue = store["queues"].setdefault(recipient, collections.deque())
+    queue.append(entry)
+    return len(queue)
+
+
+## Anzahl der vorgemerkten Nachrichten für einen Empfänger.
+def queued_count(store, recipient):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @param recipient: Nutzername des Empfängers
+    @return: Anzahl
+    """
+    queue = store["queues"].get(recipient)
+    return len(queue) if queue else 0
+
+
+## Liefert die Empfänger mit vorgemerkten Nachrichten.
+def queued_recipients(store):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @return: Liste der Nutzernamen
+    """
+    return list(store["queues"])
+
+
+## Liefert den nächsten Stapel eines Empfängers (die ältesten Nachrichten).
+def next_batch(store, recipient, limit=BATCH_MESSAGES, max_bytes=BATCH_BYTES):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @param recipient: Nutzername des Empfängers
+    @param limit: Höchstzahl an Nachrichten
+    @param max_bytes: Höchstgröße der Texte (mindestens eine Nachricht kommt immer mit)
+    @return: Liste der Einträge in Reihenfolge
+    """
+    batch, size = [], 0
+    for entry in store["queues"].get(recipient, ()):
+        size += len(entry["text"].encode())
+        if len(batch) >= limit or (batch and size > max_bytes):
+            break
+        batch.append(entry)
+    return batch
+
+
+## Entfernt einen bestätigten Stapel aus der Warteschlange.
+def confirm_batch(store, recipient, count):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @param recipient: Nutzername des Empfängers
+    @param count: Anzahl der zugestellten Nachrichten am Anfang der Warteschlange
+    @return: Anzahl der weiterhin vorgemerkten Nachrichten
+    """
+    queue = store["queues"].get(recipient)
+    if not queue:
+        return 0
+    for _ in range(min(count, len(queue))):
+        queue.popleft()
+    rewrite_queue(store, recipient)
+    return len(queue)
+
+
+## Schreibt die Warteschlange eines Empfängers neu (atomar) bzw. löscht die leere Datei.
+def rewrite_queue(store, recipient):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @param recipient: Nutzername des Empfängers
+    @return: None
+    """
+    f = store["files"].pop(recipient, None)
+    if f is not None:
+        f.close()
+    store["dirty"].discard(recipient)
+    path = queue_path(store, recipient)
+    queue = store["queues"].get(recipient)
+    try:
+        if not queue:
+            store["queues"].pop(recipient, None)
+            os.remove(path)
+            return
+        temp = path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as out:
+            out.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in queue)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp, path)
+    except FileNotFoundError:
+        pass
+
+
+## Lädt die IDs bereits angezeigter Nachrichten.
+def load_delivered(store):
+    """
+    Die Datei wird dabei auf die letzten DEDUP_IDS Einträge gekürzt und zum Anhängen geöffnet.
+
+    @param store: Ausgang aus open_outbox_store
+    @return: None
+    """
+    path = os.path.join(store["folder"], DELIVERED_FILE)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        data = b""
+    usable = len(data) - len(data) % ID_BYTES
+    ids = [data[i:i + ID_BYTES] for i in range(max(0, usable - DEDUP_IDS * ID_BYTES), usable, ID_BYTES)]
+    store["seen_order"].extend(ids)
+    store["seen"].update(ids)
+    if usable != len(data) or len(ids) * ID_BYTES != usable:
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(b"".join(ids))
+        os.replace(temp, path)
+    store["seen_file"] = open(path, "ab")
+
+
+## Prüft, ob eine Nachricht zum ersten Mal ankommt, und merkt sich ihre ID.
+def first_delivery(store, message_id):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @param message_id: Nachrichten-ID (16 Bytes)
+    @return: True, wenn die ID noch nicht angezeigt wurde
+    """
+    if message_id in store["seen"]:
+        return False
+    store["seen"].add(message_id)
+    store["seen_order"].append(message_id)
+    if len(store["seen_order"]) > DEDUP_IDS:
+        store["seen"].discard(store["seen_order"].popleft())
+    store["seen_file"].write(message_id)
+    store["seen_dirty"] = True
+    return True
+
+
+## Schreibt alle neu vorgemerkten Nachrichten und IDs auf die Platte (fsync).
+def sync_outbox_store(store):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @return: None
+    @throws OSError: wenn das Schreiben scheitert
+    """
+    for recipient in store["dirty"]:
+        f = store["files"].get(recipient)
+        if f is not None:
+            f.flush()
+            os.fsync(f.fileno())
+    store["dirty"].clear()
+    if store["seen_dirty"]:
+        store["seen_file"].flush()
+        os.fsync(store["seen_file"].fileno())
+        store["seen_dirty"] = False
+
+
+## Schreibt alles auf die Platte und schließt die Dateien.
+def close_outbox_store(store):
+    """
+    @param store: Ausgang aus open_outbox_store
+    @return: None
+    """
+    try:
+        sync_outbox_store(store)
+    except OSError:
+        pass
+    for f in store["files"].values():
+        f.close()
+    store["files"].clear()
+    store["seen_file"].close()
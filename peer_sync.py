@@ -0,0 +1,275 @@
+"""
+@file peer_sync.py
+@brief Versionierte Peer-Liste und SEEN-Datagramme für die Discovery im Peer-to-Peer-Chat "Plauderkiste".
+
+Jeder Peer führt seine Peer-Liste mit einem Generationszähler: Jede Änderung (neuer Peer,
+neue Adresse, Abmeldung) erhöht den Zähler und vermerkt ihn am geänderten Eintrag. Abgemeldete
+Peers bleiben als Löscheintrag (Tombstone) erhalten, damit auch Abmeldungen weitergegeben werden.
+Zusätzlich zum Zähler gibt es eine zufällige Epoche pro Programmstart (ein neu gestarteter
+Peer beginnt wieder bei 0) und einen Digest über den Inhalt der Liste.
+
+Ein SEEN kann die ganze Liste (Modus F) oder nur die Änderungen seit einer Generation (Modus D)
+enthalten. Es wird auf mehrere nummerierte Datagramme verteilt, die jeweils unter
+LEGACY_DATAGRAM_BYTES bleiben:
+
+    SEEN <absender> <epoche> <generation> <digest> <F|D> <seit> <seite> <seiten>;,<eintrag>,<eintrag>,...
+
+Ein Eintrag ist "name ip port" bzw. "-name" für eine Abmeldung. Da jede Seite vollständige
+Einträge enthält, kann der Empfänger sie sofort übernehmen; die Seitennummern dienen nur dazu,
+festzustellen, wann ein SEEN vollständig angekommen ist.
+
+Ältere Versionen kennen nur "SEEN <name> <ip> <port>, <name> <ip> <port>, ..." ohne Kopf
+(Modus L beim Dekodieren) und lesen höchstens LEGACY_DATAGRAM_BYTES pro Datagramm. Sie zerlegen
+jedes SEEN an Kommas und überspringen Teile, die nicht aus genau drei Wörtern bestehen. Das Komma
+nach dem Kopf sorgt deshalb dafür, dass sie den Kopf verwerfen und alle Einträge übernehmen.
+Fragt ein älterer Peer mit einem WHO ohne Digest, erhält er die Liste im alten Format
+(encode_seen_legacy).
+
+Das Protokoll selbst (WHO, SEEN, Unterdrückung doppelter Antworten) steht in discovery_comm.py.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import random
+import zlib
+
+## Empfangspuffer älterer Versionen; längere Datagramme werden dort abgeschnitten (unter Windows: Fehler).
+LEGACY_DATAGRAM_BYTES = 512
+## Höchstzahl gespeicherter Löscheinträge; ältere werden verworfen.
+MAX_TOMBSTONES = 1024
+## Modus eines SEEN: vollständige Liste.
+SEEN_FULL = "F"
+## Modus eines SEEN: nur Änderungen seit einer Generation.
+SEEN_DELTA = "D"
+## Modus eines SEEN: altes Format ohne Kopf (nur beim Dekodieren).
+SEEN_LEGACY = "L"
+
+
+## Legt eine neue versionierte Peer-Liste an, die den eigenen Eintrag enthält.
+def new_peer_list(nickname, address):
+    """
+    @param nickname: Eigener Nutzername
+    @param address: Eigene Adresse (IP, TCP-Port)
+    @return: Peer-Liste (dict)
+    """
+    peer_list = {
+        "peers": {},          # Name -> (IP, Port)
+        "versions": {},       # Name -> Generation der letzten Änderung
+        "removed": {},        # Name -> Generation der Abmeldung (Tombstone)
+        "gen": 0,
+        "epoch": f"{random.getrandbits(32):08x}",
+        "pruned": 0,          # Änderungen bis zu dieser Generation sind nicht mehr vollständig bekannt
+        "digest": None,       # Zwischengespeicherter Digest (None = neu berechnen)
+        "full_pages": None,   # Zwischengespeicherte Datagramme der vollständigen Liste
+    }
+    set_peer(peer_list, nickname, address)
+    return peer_list
+
+
+## Trägt einen Peer ein oder aktualisiert seine Adresse.
+def set_peer(peer_list, name, address):
+    """
+    @param peer_list: Versionierte Peer-Liste
+    @param name: Nutzername
+    @param address: (IP, TCP-Port)
+    @return: True, wenn sich die Liste geändert hat
+    """
+    if peer_list["peers"].get(name) == address:
+        return False
+    peer_list["gen"] += 1
+    peer_list["peers"][name] = address
+    peer_list["versions"][name] = peer_list["gen"]
+    peer_list["removed"].pop(name, None)
+    invalidate(peer_list)
+    return True
+
+
+## Entfernt einen Peer und vermerkt die Abmeldung als Löscheintrag.
+def remove_peer(peer_list, name):
+    """
+    @param peer_list: Versionierte Peer-Liste
+    @param name: Nutzername
+    @return: True, wenn sich die Liste geändert hat
+    """
+    if name not in peer_list["peers"]:
+        return False
+    peer_list["gen"] += 1
+    del peer_list["peers"][name]
+    del peer_list["versions"][name]
+    removed = peer_list["removed"]
+    removed[name] = peer_list["gen"]
+    if len(removed) > MAX_TOMBSTONES:
+        # Ältesten Löscheintrag verwerfen; Änderungen bis dahin nur noch als vollständige Liste
+        oldest = min(removed, key=removed.get)
+        peer_list["pruned"] = max(peer_list["pruned"], removed.pop(oldest))
+    invalidate(peer_list)
+    return True
+
+
+## Verwirft zwischengespeicherte Werte nach einer Änderung.
+def invalidate(peer_list):
+    """
+    @param peer_list: Versionierte Peer-Liste
+    @return: None
+    """
+    peer_list["digest"] = None
+    peer_list["full_pages"] = None
+
+
+## Digest über den Inhalt der Peer-Liste (unabhängig von Reihenfolge und Generation).
+def list_digest(peer_list):
+    """
+    Zwei Peers mit gleichem Digest kennen dieselben Peers unter denselben Adressen.
+
+    @param peer_list: Versionierte Peer-Liste
+    @return: Digest als 8-stelliger Hex-String
+    """
+    if peer_list["digest"] is None:
+        lines = "\n".join(sorted(f"{n} {ip} {p}" for n, (ip, p) in peer_list["peers"].items()))
+        peer_list["digest"] = f"{zlib.crc32(lines.encode()):08x}"
+    return peer_list["digest"]
+
+
+## Prüft, ob die Änderungen seit einer Generation noch als Delta geliefert werden können.
+def delta_available(peer_list, epoch, since):
+    """
+    @param peer_list: Versionierte Peer-Liste
+    @param epoch: Epoche, auf die sich since bezieht
+    @param since: Generation, die der Fragende bereits kennt
+    @return: True, wenn ein Delta möglich ist
+    """
+    return epoch == peer_list["epoch"] and peer_list["pruned"] <= since <= peer_list["gen"]
+
+
+## Erzeugt die Datagramme eines SEEN (vollständige Liste oder Änderungen seit since).
+def encode_seen(peer_list, sender, since=None):
+    """
+    Die Datagramme der vollständigen Liste werden bis zur nächsten Änderung zwischengespeichert.
+
+    @param peer_list: Versionierte Peer-Liste
+    @param sender: Eigener Nutzername
+    @param since: Generation für ein Delta oder None für die vollständige Liste
+    @return: Liste der Datagramme (bytes)
+    """
+    if since is None and peer_list["full_pages"] is not None:
+        return peer_list["full_pages"]
+    if since is None:
+        mode, since = SEEN_FULL, 0
+        entries = list(peer_list["peers"].items())
+    else:
+        mode = SEEN_DELTA
+        versions = peer_list["versions"]
+        entries = [(n, address) for n, address in peer_list["peers"].items() if versions[n] > since]
+        entries += [(n, None) for n, gen in peer_list["removed"].items() if gen > since]
+    header = {
+        "sender": sender, "epoch": peer_list["epoch"], "gen": peer_list["gen"],
+        "digest": list_digest(peer_list), "mode": mode, "since": since,
+    }
+    pages = encode_seen_text(header, entries)
+    if mode == SEEN_FULL:
+        peer_list["full_pages"] = pages
+    return pages
+
+
+## Verteilt SEEN-Einträge auf Seiten, die jeweils höchstens budget Bytes belegen.
+def split_pages(entries, budget, entry_size):
+    """
+    @param entries: Liste von (Name, Adresse oder None)
+    @param budget: Verfügbare Bytes pro Seite
+    @param entry_size: Funktion, die die Größe eines Eintrags liefert
+    @return: Liste von Seiten (Listen von Einträgen); mindestens eine, ggf. leere Seite
+    """
+    pages, current, size = [], [], 0
+    for entry in entries:
+        length = entry_size(entry)
+        if current and size + length > budget:
+            pages.append(current)
+            current, size = [], 0
+        current.append(entry)
+        size += length
+    pages.append(current)
+    return pages
+
+
+## Erzeugt die Datagramme eines SEEN im Textformat.
+def encode_seen_text(header, entries):
+    """
+    @param header: Kopf des SEEN (sender, epoch, gen, digest, mode, since)
+    @param entries: Liste von (Name, Adresse oder None)
+    @return: Liste der Datagramme (bytes)
+    """
+    def text(entry):
+        name, address = entry
+        return f"-{name}" if address is None else f"{name} {address[0]} {address[1]}"
+
+    prefix = (f"SEEN {header['sender']} {header['epoch']} {header['gen']} {header['digest']} "
+              f"{header['mode']} {header['since']}")
+    # Platz für " <seite> <seiten>;" wird großzügig freigehalten
+    budget = LEGACY_DATAGRAM_BYTES - len(prefix.encode()) - 16
+    pages = split_pages(entries, budget, lambda entry: len(text(entry).encode()) + 1)
+    return [f"{prefix} {i} {len(pages)};{''.join(',' + text(e) for e in page)}".encode()
+            for i, page in enumerate(pages)]
+
+
+## Erzeugt die Datagramme eines SEEN im Format älterer Versionen (vollständige Liste ohne Kopf).
+def encode_seen_legacy(peer_list):
+    """
+    Jedes Datagramm ist für sich ein vollständiges SEEN; Abmeldungen kennt das alte Format nicht.
+
+    @param peer_list: Versionierte Peer-Liste
+    @return: Liste der Datagramme (bytes)
+    """
+    texts = [f"{n} {ip} {p}" for n, (ip, p) in peer_list["peers"].items()]
+    budget = LEGACY_DATAGRAM_BYTES - len("SEEN ")
+    pages = split_pages(texts, budget, lambda entry: len(entry.encode()) + 2)
+    return [f"SEEN {', '.join(page)}".encode() for page in pages]
+
+
+## Zerlegt ein SEEN-Datagramm.
+def decode_seen(msg):
+    """
+    @param msg: Dekodierter Inhalt des Datagramms
+    @return: (header, additions, removals) – header als dict (sender, epoch, gen, digest, mode,
+             since, page, pages), additions als dict Name -> (IP, Port), removals als Liste von Namen
+    @throws ValueError: bei fehlerhaftem Aufbau
+    """
+    if ";" not in msg:
+        return decode_seen_legacy(msg)
+    head, _, body = msg.partition(";")
+    _, sender, epoch, gen, digest, mode, since, page, pages = head.split()
+    header = {
+        "sender": sender, "epoch": epoch, "gen": int(gen), "digest": digest, "mode": mode,
+        "since": int(since), "page": int(page), "pages": int(pages),
+    }
+    if mode not in (SEEN_FULL, SEEN_DELTA) or not 0 <= header["page"] < header["pages"]:
+        raise ValueError("ungültiger SEEN-Kopf")
+    additions, removals = {}, []
+    for entry in body.split(","):
+        parts = entry.split()
+        if len(parts) == 3:
+            additions[parts[0]] = (parts[1], int(parts[2]))
+        elif len(parts) == 1 and parts[0].startswith("-"):
+            removals.append(parts[0][1:])
+    return header, additions, removals
+
+
+## Zerlegt ein SEEN im Format älterer Versionen.
+def decode_seen_legacy(msg):
+    """
+    Einträge, die nicht aus Name, IP und Port bestehen, werden wie bei älteren Versionen übersprungen.
+
+    @param msg: Dekodierter Inhalt des Datagramms ("SEEN <name> <ip> <port>, ...")
+    @return: (header, additions, []) wie bei decode_seen; header hat den Modus SEEN_LEGACY und
+             keinen Absender (sender ist None)
+    """
+    header = {
+        "sender": None, "epoch": None, "gen": 0, "digest": None, "mode": SEEN_LEGACY,
+        "since": 0, "page": 0, "pages": 1,
+    }
+    additions = {}
+    for entry in msg[len("SEEN"):].split(","):
+        parts = entry.split()
+        if len(parts) == 3 and parts[2].isdigit():
+            additions[parts[0]] = (parts[1], int(parts[2]))
+    return header, additions, []
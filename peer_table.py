@@ -0,0 +1,298 @@
+"""
+@file peer_table.py
+@brief Gemeinsame Peer-Tabelle im Shared Memory für den Peer-to-Peer-Chat "Plauderkiste".
+
+Die Tabelle ersetzt die Manager-Objekte (Kontaktbuch, Status, DND). Sie liegt in einem Block
+multiprocessing.shared_memory, den alle Prozesse direkt lesen – ohne Umweg über einen
+Manager-Prozess.
+
+Aufbau des Speicherblocks:
+ - Statusblock: Sequenznummer, DND-Flag, eigener Status (UTF-8, max. 64 Bytes)
+ - Peer-Kopf: Sequenznummer, Anzahl der Einträge
+ - Peer-Einträge fester Größe: Name (UTF-8, max. 32 Bytes), IPv4-Adresse, TCP-Port, Zustand
+   (erreichbar, unsicher, offline – siehe Heartbeats in discovery_comm.py) und Fähigkeiten
+   (Bitmaske, siehe protocol.py)
+
+Jeder Bereich hat genau einen Schreiber (Peers: Discovery, Status: CLI) und wird über ein
+Seqlock geschützt: Der Schreiber setzt die Sequenznummer vor dem Schreiben auf einen ungeraden
+und danach auf den nächsten geraden Wert. Ein Leser kopiert die Daten und wiederholt den
+Vorgang, falls sich die Sequenznummer dazwischen geändert hat oder ungerade war.
+Solange sich die Sequenznummer nicht ändert, liefern die Lesefunktionen ein zwischengespeichertes
+Ergebnis, sodass eine Abfrage nur acht Bytes aus dem Shared Memory liest.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import socket
+import struct
+from multiprocessing import shared_memory
+
+## Maximale Anzahl an Peers in der Tabelle.
+PEER_CAPACITY = 1024
+## Statusblock: Sequenznummer, DND-Flag, Status (auf 80 Bytes aufgefüllt).
+STATUS_BLOCK = struct.Struct("!QB64s7x")
+## Peer-Kopf: Sequenznummer, Anzahl der Einträge.
+PEER_HEADER = struct.Struct("!QI4x")
+## Peer-Eintrag: Name, IPv4-Adresse, TCP-Port, Zustand, Fähigkeiten.
+PEER_RECORD = struct.Struct("!32s4sHBB")
+## Sequenznummer am Anfang jedes Bereichs.
+SEQUENCE = struct.Struct("!Q")
+## Zustand eines Peers: Heartbeats kommen regelmäßig an.
+PEER_ALIVE = 0
+## Zustand eines Peers: Heartbeats bleiben seit einiger Zeit aus.
+PEER_SUSPECT = 1
+## Zustand eines Peers: gilt als offline, Sendeversuche schlagen sofort fehl.
+PEER_DEAD = 2
+
+
+## Legt eine neue Peer-Tabelle an (nur im Startprozess).
+def create_peer_table(capacity=PEER_CAPACITY):
+    """
+    @param capacity: Maximale Anzahl an Peers
+    @return: Tabelle (dict); der Name für andere Prozesse steht unter "name"
+    """
+    size = STATUS_BLOCK.size + PEER_HEADER.size + capacity * PEER_RECORD.size
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    shm.buf[:size] = bytes(size)
+    table = wrap_table(shm, capacity)
+    set_local_status(table, "Online", False)
+    return table
+
+
+## Öffnet eine bestehende Peer-Tabelle in einem Kindprozess.
+def attach_peer_table(name):
+    """
+    Die Kapazität ergibt sich aus der Größe des Speicherblocks.
+
+    @param name: Name des Shared-Memory-Blocks (create_peer_table()["name"])
+    @return: Tabelle (dict)
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    capacity = (shm.size - STATUS_BLOCK.size - PEER_HEADER.size) // PEER_RECORD.size
+    return wrap_table(shm, capacity)
+
+
+## Baut das Tabellen-Dictionary um einen Shared-Memory-Block.
+def wrap_table(shm, capacity):
+    """
+    @param shm: SharedMemory-Objekt
+    @param capacity: Maximale Anzahl an Peers
+    @return: Tabelle (dict) mit Puffer und Lese-Caches
+    """
+    return {
+        "shm": shm,
+        "name": shm.name,
+        "buf": shm.buf,
+        "capacity": capacity,
+        "peer_offset": STATUS_BLOCK.size,
+        # Zwischengespeicherte Leseergebnisse: (Sequenznummer, Wert)
+        "peer_cache": (None, ({}, {}, {})),
+        "status_cache": (None, ("Online", False)),
+    }
+
+
+## Liest einen Bereich konsistent nach dem Seqlock-Verfahren.
+def read_consistent(buf, offset, cache, decode):
+    """
+    @param buf: Puffer des Shared-Memory-Blocks
+    @param offset: Beginn des Bereichs (dort liegt die Sequenznummer)
+    @param cache: Bisheriges Ergebnis (Sequenznummer, Wert)
+    @param decode: Funktion, die den Bereich aus dem Puffer liest
+    @return: (Sequenznummer, Wert)
+    """
+    while True:
+        (seq,) = SEQUENCE.unpack_from(buf, offset)
+        if seq == cache[0]:
+            return cache
+        if seq & 1:
+            # Schreiber ist gerade aktiv
+            continue
+        value = decode(buf)
+        if SEQUENCE.unpack_from(buf, offset)[0] == seq:
+            return seq, value
+
+
+## Schreibt einen Bereich nach dem Seqlock-Verfahren (nur vom zuständigen Prozess).
+def write_consistent(buf, offset, encode):
+    """
+    @param buf: Puffer des Shared-Memory-Blocks
+    @param offset: Beginn des Bereichs (dort liegt die Sequenznummer)
+    @param encode: Funktion, die den Bereich in den Puffer schreibt
+    @return: None
+    """
+    (seq,) = SEQUENCE.unpack_from(buf, offset)
+    SEQUENCE.pack_into(buf, offset, seq + 1)
+    encode(buf)
+    SEQUENCE.pack_into(buf, offset, seq + 2)
+
+
+## Liefert alle bekannten Peers.
+def peer_snapshot(table):
+    """
+    Das Ergebnis wird zwischengespeichert und darf nicht verändert werden.
+
+    @param table: Peer-Tabelle
+    @return: dict Name -> (IP, Port)
+    """
+    return read_peers(table)[0]
+
+
+## Liefert den Zustand aller bekannten Peers.
+def peer_states(table):
+    """
+    Das Ergebnis wird zwischengespeichert und darf nicht verändert werden.
+
+    @param table: Peer-Tabelle
+    @return: dict Name -> Zustand (PEER_ALIVE, PEER_SUSPECT, PEER_DEAD)
+    """
+    return read_peers(table)[1]
+
+
+## Liest Adressen, Zustände und Fähigkeiten aller Peers (zwischengespeichert pro Sequenznummer).
+def read_peers(table):
+    """
+    @param table: Peer-Tabelle
+    @return: (Adressen, Zustände, Fähigkeiten) – drei dicts mit dem Namen als Schlüssel
+    """
+    offset = table["peer_offset"]
+
+    def decode(buf):
+        _, count = PEER_HEADER.unpack_from(buf, offset)
+        peers, states, caps = {}, {}, {}
+        start = offset + PEER_HEADER.size
+        for i in range(min(count, table["capacity"])):
+            name, ip, port, state, flags = PEER_RECORD.unpack_from(buf, start + i * PEER_RECORD.size)
+            name = name.rstrip(b"\0").decode(errors="replace")
+            peers[name] = (socket.inet_ntoa(ip), port)
+            states[name] = state
+            caps[name] = flags
+        return peers, states, caps
+
+    table["peer_cache"] = read_consistent(table["buf"], offset, table["peer_cache"], decode)
+    return table["peer_cache"][1]
+
+
+## Liefert die Sequenznummer der Peer-Einträge (ändert sich mit jedem Schreiben der Discovery).
+def peers_sequence(table):
+    """
+    Liest nur acht Bytes; geeignet, um regelmäßig auf Änderungen (JOIN, SEEN, Zustandswechsel)
+    zu prüfen.
+
+    @param table: Peer-Tabelle
+    @return: Sequenznummer
+    """
+    return SEQUENCE.unpack_from(table["buf"], table["peer_offset"])[0]
+
+
+## Sucht die Adresse eines Peers.
+def lookup_peer(table, name):
+    """
+    @param table: Peer-Tabelle
+    @param name: Nickname
+    @return: (IP, Port) oder None, wenn der Peer unbekannt ist
+    """
+    return peer_snapshot(table).get(name)
+
+
+## Liefert den Zustand eines Peers.
+def lookup_state(table, name):
+    """
+    @param table: Peer-Tabelle
+    @param name: Nickname
+    @return: PEER_ALIVE, PEER_SUSPECT, PEER_DEAD oder None, wenn der Peer unbekannt ist
+    """
+    return peer_states(table).get(name)
+
+
+## Liefert die Fähigkeiten eines Peers.
+def lookup_caps(table, name):
+    """
+    @param table: Peer-Tabelle
+    @param name: Nickname
+    @return: Bitmaske (protocol.CAP_*); 0, wenn der Peer unbekannt ist oder nichts angekündigt hat
+    """
+    return read_peers(table)[2].get(name, 0)
+
+
+## Ersetzt den Inhalt der Peer-Tabelle (nur vom Discovery-Prozess aufzurufen).
+def store_peers(table, peers, states=None, caps=None):
+    """
+    Namen, die länger als 32 Bytes sind, und Adressen, die keine IPv4-Adressen sind, werden
+    übersprungen; ebenso alle Einträge jenseits der Kapazität.
+
+    @param table: Peer-Tabelle
+    @param peers: dict Name -> (IP, Port)
+    @param states: dict Name -> Zustand; fehlende Peers gelten als erreichbar
+    @param caps: dict Name -> Fähigkeiten; fehlende Peers haben keine
+    @return: Anzahl der gespeicherten Einträge
+    """
+    states = states or {}
+    caps = caps or {}
+    records = []
+    for name, (ip, port) in peers.items():
+        raw = name.encode()
+        if len(raw) > 32 or len(records) >= table["capacity"]:
+            continue
+        try:
+            records.append(PEER_RECORD.pack(raw, socket.inet_aton(ip), int(port), states.get(name, PEER_ALIVE),
+                                            caps.get(name, 0) & 0xFF))
+        except (OSError, struct.error, ValueError):
+            continue
+    offset = table["peer_offset"]
+
+    def encode(buf):
+        seq, _ = PEER_HEADER.unpack_from(buf, offset)
+        PEER_HEADER.pack_into(buf, offset, seq, len(records))
+        start = offset + PEER_HEADER.size
+        buf[start:start + len(records) * PEER_RECORD.size] = b"".join(records)
+
+    write_consistent(table["buf"], offset, encode)
+    return len(records)
+
+
+## Liefert den eigenen Status und das DND-Flag.
+def local_status(table):
+    """
+    @param table: Peer-Tabelle
+    @return: (Status-Text, DND aktiv)
+    """
+    def decode(buf):
+        _, dnd, status = STATUS_BLOCK.unpack_from(buf, 0)
+        return status.rstrip(b"\0").decode(errors="replace"), bool(dnd)
+
+    table["status_cache"] = read_consistent(table["buf"], 0, table["status_cache"], decode)
+    return table["status_cache"][1]
+
+
+## Setzt den eigenen Status und das DND-Flag (nur vom CLI-Prozess aufzurufen).
+def set_local_status(table, status, dnd):
+    """
+    Zu lange Texte werden auf 64 Bytes gekürzt (ohne ein UTF-8-Zeichen zu zerteilen).
+
+    @param table: Peer-Tabelle
+    @param status: Status-Text
+    @param dnd: DND aktiv (bool)
+    @return: None
+    """
+    raw = status.encode()[:64].decode(errors="ignore").encode()
+
+    def encode(buf):
+        (seq,) = SEQUENCE.unpack_from(buf, 0)
+        STATUS_BLOCK.pack_into(buf, 0, seq, 1 if dnd else 0, raw)
+
+    write_consistent(table["buf"], 0, encode)
+
+
+## Gibt die Tabelle frei; der Startprozess entfernt den Speicherblock zusätzlich.
+def close_peer_table(table, unlink=False):
+    """
+    @param table: Peer-Tabelle
+    @param unlink: True, um den Speicherblock endgültig zu löschen
+    @return: None
+    """
+    table["buf"] = None
+    table["peer_cache"] = (None, ({}, {}, {}))
+    table["shm"].close()
+    if unlink:
+        table["shm"].unlink()
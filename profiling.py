@@ -0,0 +1,112 @@
+"""
+@file profiling.py
+@brief Profiling-Modus (CPU und Speicher) für den Peer-to-Peer-Chat "Plauderkiste".
+
+Mit "python start.py config1.toml --profile" läuft jeder Prozess (Discovery, Netzwerk, CLI und
+der Ausgabe-Thread des CLI) unter cProfile; zusätzlich zeichnet tracemalloc in jedem Prozess die
+Speicherreservierungen auf. Beim Beenden schreibt jeder Teil in den Profilordner:
+
+ - <name>.prof: CPU-Profil im pstats-Format (z.B. für "python -m pstats" oder snakeviz)
+ - <name>.alloc.txt: Codestellen mit dem meisten belegten Speicher und Spitzenwert (nur Prozesse)
+
+Nachdem alle Prozesse beendet sind, fasst write_report() die CPU-Profile zu report.txt zusammen:
+die PROFILE_TOP teuersten Funktionen über alle Prozesse (eigene und kumulierte Zeit), danach
+je Prozess die eigene Top-Liste.
+
+cProfile misst nur den Thread, in dem es gestartet wurde. Hilfs-Threads (Queue-Weiterleitung,
+Prüfsummen) erscheinen deshalb nicht im CPU-Profil, ihre Speicherreservierungen aber schon.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import cProfile
+import glob
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import tracemalloc
+
+## Anzahl der Funktionen bzw. Codestellen in den Berichten.
+PROFILE_TOP = 30
+## Anzahl der Stack-Frames, die tracemalloc pro Speicherreservierung aufzeichnet.
+TRACEMALLOC_FRAMES = 10
+## Name des zusammengefassten Berichts im Profilordner.
+PROFILE_REPORT = "report.txt"
+
+
+## Führt eine Funktion unter cProfile (und optional tracemalloc) aus und speichert die Ergebnisse.
+def run_profiled(name, out_dir, memory, func, *args):
+    """
+    Eignet sich als target für multiprocessing.Process und threading.Thread. Im Hauptthread
+    eines Prozesses beendet SIGTERM die Funktion mit SystemExit, sodass das Profil auch bei
+    Process.terminate() noch geschrieben wird.
+
+    @param name: Name des Profils (z.B. "network"), bestimmt die Dateinamen
+    @param out_dir: Profilordner
+    @param memory: True, um zusätzlich Speicherreservierungen aufzuzeichnen (einmal pro Prozess)
+    @param func: Auszuführende Funktion (z.B. network_service)
+    @param args: Argumente für func
+    @return: Rückgabewert von func
+    """
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if memory:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func(*args)
+    finally:
+        profiler.disable()
+        if memory:
+            # Vor dump_stats, damit dessen Speicher nicht im Bericht auftaucht
+            write_allocations(os.path.join(out_dir, f"{name}.alloc.txt"))
+            tracemalloc.stop()
+        profiler.dump_stats(os.path.join(out_dir, f"{name}.prof"))
+
+
+## Schreibt die Codestellen mit dem meisten belegten Speicher in eine Textdatei.
+def write_allocations(path, top=PROFILE_TOP):
+    """
+    @param path: Zieldatei
+    @param top: Anzahl der Codestellen
+    @return: None
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    stats = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    )).statistics("lineno")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"Belegt beim Beenden: {current / 1024:.1f} KiB, Spitze: {peak / 1024:.1f} KiB\n\n")
+        for stat in stats[:top]:
+            f.write(f"{stat}\n")
+
+
+## Fasst alle CPU-Profile eines Profilordners zu einem Bericht zusammen.
+def write_report(out_dir, top=PROFILE_TOP):
+    """
+    @param out_dir: Profilordner
+    @param top: Anzahl der Funktionen je Liste
+    @return: Pfad des Berichts oder None, wenn keine Profile vorhanden sind
+    """
+    paths = sorted(glob.glob(os.path.join(out_dir, "*.prof")))
+    if not paths:
+        return None
+    out = io.StringIO()
+    out.write(f"Profile: {', '.join(os.path.basename(p) for p in paths)}\n")
+    combined = pstats.Stats(*paths, stream=out)
+    for key, title in (("tottime", "eigene Zeit"), ("cumulative", "kumulierte Zeit")):
+        out.write(f"\n=== Alle Prozesse, sortiert nach {title} ===\n")
+        combined.sort_stats(key).print_stats(top)
+    for path in paths:
+        out.write(f"\n=== {os.path.basename(path)}, sortiert nach eigener Zeit ===\n")
+        pstats.Stats(path, stream=out).sort_stats("tottime").print_stats(top)
+    report = os.path.join(out_dir, PROFILE_REPORT)
+    with open(report, "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+    return report
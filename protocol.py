@@ -0,0 +1,205 @@
+"""
+@file protocol.py
+@brief Binäres Protokoll (Dateiangebote, Nachrichtenstapel, interne Kommandos) für den Peer-to-Peer-Chat "Plauderkiste".
+
+Dateiangebote und Nachrichtenstapel werden mit struct kodiert statt als Text, der auf der
+Gegenseite wieder an Leerzeichen, Kommas oder "::" zerlegt werden müsste. Texte (Namen,
+Dateinamen) haben ein Längenpräfix und dürfen damit beliebige Zeichen enthalten.
+
+Discovery-Datagramme bleiben im Textformat: Ältere Peers dekodieren jedes Datagramm als UTF-8 und
+brechen an einem binären ab, und fast alles in der Discovery geht per Broadcast hinaus, den auch
+sie hören. Selbst die wenigen Unicast-Antworten gehen an Peers, deren JOIN die Fähigkeiten gerade
+zurückgesetzt hat.
+
+Fähigkeiten (Bitmaske, LOCAL_CAPS für diese Version) stehen im Heartbeat
+("HB <name> <port> <fähigkeiten>"), den ältere Peers ignorieren (siehe discovery_comm.py).
+Die Fähigkeiten stehen in der Peer-Tabelle, sodass der Netzwerkprozess sie kennt
+und Dateiangebote (OFFER/NEED) binär statt als JSON überträgt. An Peers mit CAP_COMPRESS sendet er
+Nachrichten und Dateiblöcke komprimiert. Peers mit CAP_OUTBOX erhalten vorgemerkte Nachrichten
+gesammelt als BATCH-Frame (Stapel-ID und je Nachricht ID, Zeitpunkt und Text) und bestätigen ihn;
+auch jede Nachricht der Pool-Verbindung trägt dann eine ID und wird einzeln bestätigt.
+
+Kommandos vom CLI an Discovery- und Netzwerkprozess sind Tupel, deren erstes Element ein CMD_*-Kennzeichen
+ist, z.B. (CMD_IMG_SEND, empfänger, dateiname, pfad). multiprocessing überträgt sie per pickle;
+ein Zerlegen auf der Empfängerseite entfällt.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import struct
+
+## Längenpräfix eines Textfelds.
+TEXT_LENGTH = struct.Struct("!H")
+## Fähigkeit: versteht binäre OFFER/NEED-Frames.
+CAP_BINARY = 1
+## Fähigkeit: entpackt zlib-komprimierte Nachrichten und Dateiblöcke (siehe compression.py).
+CAP_COMPRESS = 2
+## Fähigkeit: bestätigt BATCH-Frames und Nachrichten mit ID (FRAME_MSG_ID, siehe outbox.py).
+CAP_OUTBOX = 4
+## Fähigkeiten dieser Version.
+LOCAL_CAPS = CAP_BINARY | CAP_COMPRESS | CAP_OUTBOX
+## Feste Felder eines binären OFFER: Transfer-ID (16 Byte), Größe, Blockgröße, Anzahl Blöcke.
+OFFER_HEADER = struct.Struct("!16sQII")
+## Länge einer Blockprüfsumme (SHA-256) im binären OFFER.
+HASH_BYTES = 32
+## Anzahl der Blocknummern eines binären NEED.
+NEED_COUNT = struct.Struct("!I")
+## Kopf eines BATCH-Frames: Stapel-ID (16 Byte), Anzahl der Nachrichten.
+BATCH_HEADER = struct.Struct("!16sI")
+## Nachricht eines BATCH-Frames: Nachrichten-ID (16 Byte), Zeitpunkt des Sendeauftrags, Textlänge.
+BATCH_ENTRY = struct.Struct("!16sdI")
+
+## Kommando an Discovery: WHO-Folge senden und Antworten sammeln.
+CMD_WHO = "WHO"
+## Kommando an Discovery: JOIN senden (Name, TCP-Port).
+CMD_JOIN = "JOIN"
+## Kommando an Discovery: LEAVE senden (Name).
+CMD_LEAVE = "LEAVE"
+## Kommando an Discovery: bekannte Peers an das UI melden.
+CMD_PEERS = "PEERS"
+## Kommando an Discovery und Netzwerk: Metriken sofort melden.
+CMD_STATS = "STATS"
+## Kommando an Discovery und Netzwerk: Schleife beenden.
+CMD_STOP = "STOP"
+## Kommando an Netzwerk: Textnachricht senden (Empfänger, Text[, Referenz]).
+CMD_MSG = "MSG"
+## Kommando an Netzwerk: Textnachricht an mehrere Empfänger (Bezeichnung, Liste der Empfänger, Text[, Referenz]).
+CMD_MSG_MULTI = "MSG_MULTI"
+## Kommando an Netzwerk: Bild senden (Empfänger, Dateiname, Pfad[, Referenz]).
+CMD_IMG_SEND = "IMG_SEND"
+
+
+## Hängt ein Textfeld mit Längenpräfix an.
+def pack_text(out, text):
+    """
+    @param out: bytearray, an das angehängt wird
+    @param text: Text (str)
+    @return: None
+    @throws ValueError: wenn der Text länger als 65535 Bytes ist
+    """
+    raw = text.encode()
+    if len(raw) > 0xFFFF:
+        raise ValueError("Textfeld zu lang")
+    out += TEXT_LENGTH.pack(len(raw)) + raw
+
+
+## Liest ein Textfeld mit Längenpräfix.
+def unpack_text(data, pos):
+    """
+    @param data: Datagramm bzw. Nutzdaten (bytes)
+    @param pos: Position des Längenpräfixes
+    @return: (Text, Position nach dem Feld)
+    @throws ValueError: bei abgeschnittenen Daten oder ungültigem UTF-8
+    """
+    (length,) = TEXT_LENGTH.unpack_from(data, pos)
+    pos += TEXT_LENGTH.size
+    if pos + length > len(data):
+        raise ValueError("Textfeld abgeschnitten")
+    return data[pos:pos + length].decode(), pos + length
+
+
+## Kodiert ein Dateiangebot (Dateiname und Manifest) im binären Format.
+def encode_offer(filename, manifest):
+    """
+    @param filename: Dateiname
+    @param manifest: Manifest aus file_transfer.build_manifest
+    @return: Nutzdaten des OFFER-Frames (bytes)
+    """
+    out = bytearray(OFFER_HEADER.pack(bytes.fromhex(manifest["id"]), manifest["size"],
+                                      manifest["chunk_size"], len(manifest["hashes"])))
+    pack_text(out, filename)
+    out += bytes.fromhex("".join(manifest["hashes"]))
+    return bytes(out)
+
+
+## Dekodiert ein binäres Dateiangebot.
+def decode_offer(payload):
+    """
+    @param payload: Nutzdaten des OFFER-Frames
+    @return: (Dateiname, Manifest als dict wie in file_transfer.build_manifest)
+    @throws ValueError: bei fehlerhaftem Aufbau
+    """
+    try:
+        raw_id, size, chunk_size, count = OFFER_HEADER.unpack_from(payload, 0)
+        filename, pos = unpack_text(payload, OFFER_HEADER.size)
+    except struct.error as e:
+        raise ValueError(f"OFFER abgeschnitten: {e}") from e
+    if len(payload) - pos != count * HASH_BYTES:
+        raise ValueError("OFFER mit falscher Anzahl an Prüfsummen")
+    digests = payload[pos:].hex()
+    hashes = [digests[i:i + 2 * HASH_BYTES] for i in range(0, len(digests), 2 * HASH_BYTES)]
+    return filename, {"id": raw_id.hex(), "size": size, "chunk_size": chunk_size, "hashes": hashes}
+
+
+## Kodiert die Liste der fehlenden Blöcke (NEED) im binären Format.
+def encode_need(indices):
+    """
+    @param indices: Blocknummern (aufsteigend sortiert)
+    @return: Nutzdaten des NEED-Frames (bytes)
+    """
+    return NEED_COUNT.pack(len(indices)) + struct.pack(f"!{len(indices)}I", *indices)
+
+
+## Dekodiert die Liste der fehlenden Blöcke.
+def decode_need(payload):
+    """
+    @param payload: Nutzdaten des NEED-Frames
+    @return: Liste der Blocknummern
+    @throws ValueError: bei fehlerhaftem Aufbau
+    """
+    try:
+        (count,) = NEED_COUNT.unpack_from(payload, 0)
+        return list(struct.unpack_from(f"!{count}I", payload, NEED_COUNT.size))
+    except struct.error as e:
+        raise ValueError(f"NEED abgeschnitten: {e}") from e
+
+
+## Kodiert einen Stapel vorgemerkter Nachrichten (BATCH).
+def encode_batch(batch_id, entries):
+    """
+    @param batch_id: Stapel-ID (16 Bytes), wird in der Bestätigung zurückgeschickt
+    @param entries: Liste von (Nachrichten-ID als 16 Bytes, Zeitpunkt als Unixzeit, Text)
+    @return: Nutzdaten des BATCH-Frames (bytes)
+    """
+    out = bytearray(BATCH_HEADER.pack(batch_id, len(entries)))
+    for message_id, stamp, text in entries:
+        raw = text.encode()
+        out += BATCH_ENTRY.pack(message_id, stamp, len(raw))
+        out += raw
+    return bytes(out)
+
+
+## Liest nur die Anzahl der Nachrichten eines BATCH (z.B. für die Ratenbegrenzung).
+def batch_size(data, offset=0):
+    """
+    @param data: Puffer mit dem BATCH-Frame
+    @param offset: Beginn der Nutzdaten im Puffer
+    @return: Anzahl der Nachrichten (0 bei abgeschnittenem Kopf)
+    """
+    if len(data) - offset < BATCH_HEADER.size:
+        return 0
+    return BATCH_HEADER.unpack_from(data, offset)[1]
+
+
+## Dekodiert einen Stapel vorgemerkter Nachrichten.
+def decode_batch(payload):
+    """
+    @param payload: Nutzdaten des BATCH-Frames
+    @return: (Stapel-ID, Liste von (Nachrichten-ID, Zeitpunkt, Text))
+    @throws ValueError: bei fehlerhaftem Aufbau
+    """
+    try:
+        batch_id, count = BATCH_HEADER.unpack_from(payload, 0)
+        pos = BATCH_HEADER.size
+        entries = []
+        for _ in range(count):
+            message_id, stamp, length = BATCH_ENTRY.unpack_from(payload, pos)
+            pos += BATCH_ENTRY.size
+            if pos + length > len(payload):
+                raise ValueError("BATCH abgeschnitten")
+            entries.append((message_id, stamp, payload[pos:pos + length].decode(errors="replace")))
+            pos += length
+    except struct.error as e:
+        raise ValueError(f"BATCH abgeschnitten: {e}") from e
+    return batch_id, entries
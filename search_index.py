@@ -0,0 +1,235 @@
+"""
+@file search_index.py
+@brief Invertierter Suchindex für den Chatverlauf im Peer-to-Peer-Chat "Plauderkiste".
+
+Zu jedem Segment des Verlaufs (siehe data_manager.py) gehört ein Index, der jedes Wort auf die
+Positionen der Nachrichten abbildet, in denen es vorkommt (Position = Nummer des Eintrags in der
+.idx-Datei des Segments). Gesucht wird daher nur in den Listen der gesuchten Wörter, nie im
+gesamten Log.
+
+Neben den Wörtern enthält der Index Pseudowörter für den Gesprächspartner und die Art der
+Nachricht ("text" oder "image"). Filter nach Peer und Art sind damit ebenfalls nur eine
+Schnittmenge; Zeitfilter löst data_manager über die Zeitstempel im Segmentindex.
+
+Der Index wird bei jedem add_message im Speicher erweitert und beim Speichern, beim Wechsel des
+Segments und beim Beenden in eine Datei neben dem Segment geschrieben:
+
+    000001.search   Kopf (Kennung, Version, erfasste Einträge, Anzahl Wörter und Positionen),
+                    danach die Anzahl der Positionen je Wort, alle Positionen hintereinander
+                    (uint32) und die Wörter (UTF-8, durch Zeilenumbrüche getrennt)
+
+Beim Laden werden nur drei Blöcke gelesen; die Positionsliste eines Wortes wird erst bei einer
+Suche aus dem gemeinsamen Array herausgeschnitten. Neue Positionen landen in eigenen Listen und
+werden beim nächsten Speichern zusammengeführt.
+
+Fehlen nach einem Absturz Einträge im Index, ergänzt data_manager sie beim Laden aus dem Log.
+Abgeschlossene Segmente ändern sich nicht mehr; ihr Index wird nur einmal gelesen.
+
+@author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhel
+@date 2025
+"""
+
+import array
+import itertools
+import os
+import re
+import struct
+import sys
+
+## Dateiendung des Suchindex eines Segments.
+INDEX_EXT = "search"
+## Dateikopf: Kennung, Version, erfasste Einträge, Anzahl der Wörter und der Positionen.
+INDEX_HEADER = struct.Struct("!4sBIII")
+## Kennung der Indexdatei.
+INDEX_MAGIC = b"PKSX"
+## Formatversion der Indexdatei.
+INDEX_VERSION = 1
+## Wörter, die länger sind, werden abgeschnitten (z.B. Links oder Prüfsummen).
+MAX_TERM_CHARS = 64
+## Präfix der Pseudowörter für den Gesprächspartner.
+PEER_PREFIX = "\x00p:"
+## Präfix der Pseudowörter für die Art der Nachricht.
+KIND_PREFIX = "\x00k:"
+## Erkennt Wörter (Buchstaben und Ziffern, auch Umlaute).
+WORD_PATTERN = re.compile(r"\w+")
+
+
+## Legt einen leeren Index für ein Segment an.
+def new_index():
+    """
+    @return: Index (dict) mit base (Wort -> Nummer im geladenen Block), starts und positions (geladener
+             Block), terms (Wort -> array neuer Positionen), covered (erfasste Einträge) und dirty
+    """
+    return {"base": {}, "starts": array.array("I", [0]), "positions": array.array("I"),
+            "terms": {}, "covered": 0, "dirty": False}
+
+
+## Zerlegt einen Text in die Wörter des Index.
+def tokenize(text):
+    """
+    @param text: Beliebiger Text
+    @return: Menge der Wörter (klein geschrieben, höchstens MAX_TERM_CHARS Zeichen)
+    """
+    return {word[:MAX_TERM_CHARS] for word in WORD_PATTERN.findall(text.casefold())}
+
+
+## Nimmt eine Nachricht in den Index auf.
+def index_record(index, position, kind, peer, text):
+    """
+    Positionen müssen lückenlos aufsteigend ankommen; so bleiben alle Listen sortiert.
+
+    @param index: Index aus new_index oder load_index
+    @param position: Nummer des Eintrags im Segment (muss index["covered"] sein)
+    @param kind: Art der Nachricht ("text" oder "image")
+    @param peer: Gesprächspartner oder ""
+    @param text: Text der Nachricht
+    @return: None
+    @throws ValueError: wenn die Position nicht die nächste erwartete ist
+    """
+    if position != index["covered"]:
+        raise ValueError(f"Suchindex erwartet Eintrag {index['covered']}, nicht {position}")
+    terms = tokenize(text)
+    terms.add(KIND_PREFIX + kind)
+    if peer:
+        terms.add(PEER_PREFIX + peer.casefold().replace("\n", " "))
+    postings = index["terms"]
+    for term in terms:
+        if term not in postings:
+            postings[term] = array.array("I")
+        postings[term].append(position)
+    index["covered"] = position + 1
+    index["dirty"] = True
+
+
+## Liefert alle Positionen eines Wortes (geladener Block und neue Positionen).
+def postings(index, term):
+    """
+    @param index: Index eines Segments
+    @param term: Wort
+    @return: Aufsteigend sortiertes array der Positionen (leer, wenn das Wort fehlt)
+    """
+    added = index["terms"].get(term)
+    slot = index["base"].get(term)
+    if slot is None:
+        return added if added is not None else array.array("I")
+    base = index["positions"][index["starts"][slot]:index["starts"][slot + 1]]
+    return base + added if added is not None else base
+
+
+## Zerlegt eine Suchanfrage in Wörter und Präfixe.
+def parse_query(query):
+    """
+    Ein "*" am Ende eines Wortes sucht alle Wörter mit diesem Anfang (z.B. "bild*").
+
+    @param query: Suchbegriffe, durch Leerzeichen getrennt
+    @return: Liste von (Wort, ist_präfix)
+    """
+    result = []
+    for part in query.split():
+        prefix = part.endswith("*")
+        for word in tokenize(part):
+            result.append((word, prefix))
+    return result
+
+
+## Sucht die Positionen aller Nachrichten, die alle Bedingungen erfüllen.
+def lookup(index, terms, peer=None, kind=None):
+    """
+    @param index: Index eines Segments
+    @param terms: Liste von (Wort, ist_präfix) aus parse_query
+    @param peer: Nur Nachrichten mit diesem Gesprächspartner (optional)
+    @param kind: Nur Nachrichten dieser Art (optional)
+    @return: Aufsteigend sortierte Liste der Positionen
+    """
+    lists = []
+    for word, prefix in terms:
+        if prefix:
+            words = {t for t in itertools.chain(index["base"], index["terms"]) if t.startswith(word)}
+            lists.append(set().union(*(postings(index, t) for t in words)))
+        else:
+            lists.append(postings(index, word))
+    if peer:
+        lists.append(postings(index, PEER_PREFIX + peer.casefold()))
+    if kind:
+        lists.append(postings(index, KIND_PREFIX + kind))
+    if not lists:
+        return list(range(index["covered"]))
+    lists.sort(key=len)
+    result = set(lists[0])
+    for other in lists[1:]:
+        if not result:
+            break
+        result.intersection_update(other)
+    return sorted(result)
+
+
+## Pfad der Indexdatei zu einer Segmentdatei.
+def index_path(log_path):
+    """
+    @param log_path: Pfad der .log-Datei des Segments
+    @return: Pfad der .search-Datei
+    """
+    return os.path.splitext(log_path)[0] + "." + INDEX_EXT
+
+
+## Liest den Index eines Segments von der Festplatte.
+def load_index(path):
+    """
+    Eine fehlende oder beschädigte Datei ergibt einen leeren Index; data_manager baut ihn
+    dann aus dem Log neu auf.
+
+    @param path: Pfad der Indexdatei
+    @return: Index (dict)
+    """
+    index = new_index()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, covered, term_count, total = INDEX_HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            return index
+        counts_end = INDEX_HEADER.size + 4 * term_count
+        positions_end = counts_end + 4 * total
+        counts = array.array("I", data[INDEX_HEADER.size:counts_end])
+        positions = array.array("I", data[counts_end:positions_end])
+        words = data[positions_end:].decode().split("\n") if term_count else []
+    except (OSError, struct.error, UnicodeDecodeError, ValueError):
+        return index
+    if len(counts) != term_count or len(positions) != total or len(words) != term_count:
+        return index
+    if sys.byteorder == "little":
+        counts.byteswap()
+        positions.byteswap()
+    index["base"] = dict(zip(words, range(term_count)))
+    index["starts"] = array.array("I", itertools.accumulate(counts, initial=0))
+    index["positions"], index["covered"] = positions, covered
+    return index
+
+
+## Schreibt den Index eines Segments auf die Festplatte (atomar über eine temporäre Datei).
+def save_index(index, path):
+    """
+    @param index: Index des Segments
+    @param path: Pfad der Indexdatei
+    @return: None
+    @throws OSError: wenn die Datei nicht geschrieben werden kann
+    """
+    if not index["dirty"]:
+        return
+    words = list(index["base"]) + [t for t in index["terms"] if t not in index["base"]]
+    counts, positions = array.array("I"), array.array("I")
+    for term in words:
+        merged = postings(index, term)
+        counts.append(len(merged))
+        positions.extend(merged)
+    if sys.byteorder == "little":
+        counts.byteswap()
+        positions.byteswap()
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, index["covered"], len(words), len(positions)))
+        f.write(counts.tobytes())
+        f.write(positions.tobytes())
+        f.write("\n".join(words).encode())
+    os.replace(temp, path)
+    index["dirty"] = False
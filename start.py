@@ -6,18 +6,32 @@ Dieses Modul ist der Einstiegspunkt der Anwendung. Es kümmert sich um das Laden
 startet alle benötigten Prozesse (Discovery, Netzwerk, UI) und verwaltet die Kommunikation zwischen ihnen.
 Es kann über Kommandozeilenargumente die zu verwendende Konfigurationsdatei wählen.
 
-Die einzelnen Komponenten kommunizieren über multiprocessing.Queue und teilen Daten über Manager-Objekte.
+Die einzelnen Komponenten kommunizieren über multiprocessing.Queue. Kontakte, Status und
+Nicht-stören-Modus liegen in einer gemeinsamen Peer-Tabelle im Shared Memory (peer_table.py).
+
+Beim Beenden erhalten Discovery- und Netzwerkprozess das Kommando STOP und schließen ihre
+Sockets selbst; nur wenn sie nicht innerhalb von STOP_TIMEOUT Sekunden enden, werden sie
+terminiert. Mit --profile [Ordner] laufen alle Prozesse unter cProfile und tracemalloc
+(siehe profiling.py); die Ergebnisse und ein zusammengefasster Bericht landen im Profilordner.
+
+Schneller Start: Mit der Startmethode "spawn" führt jeder Kindprozess die Importe dieses Moduls
+erneut aus. Hier stehen deshalb nur leichte Importe; CLI, Konfiguration und Profiling werden erst
+in main() geladen, Discovery- und Netzwerkmodul erst im jeweiligen Kindprozess (run_service). Das
+CLI zeigt den Prompt sofort, während die Dienste im Hintergrund starten.
 
 @author Mahir Ahmad, Sena Akpolad, Onur Ücelehan, Meriam Lakhrissi, Najiba Sulaimankhels
 @date 2025
 """
 
+import argparse
+import importlib
 import multiprocessing
-import sys
-import toml
-from discovery_comm import discovery_service
-from network_comm import network_service
-from ui_cli import start_cli
+import os
+from protocol import CMD_STOP
+from flow_control import UI_QUEUE_LIMIT, COMMAND_QUEUE_LIMIT
+
+## Sekunden, die Discovery- und Netzwerkprozess nach STOP zum Beenden haben.
+STOP_TIMEOUT = 3.0
 
 ## Hauptfunktion: Initialisiert Konfiguration und startet alle Komponenten.
 def main():
@@ -32,28 +46,44 @@ def main():
     """
     multiprocessing.set_start_method("spawn")
 
+    parser = argparse.ArgumentParser(description="Plauderkiste – Peer-to-Peer-Chat")
     # Konfigurationsdatei als Argument, Standard: 'config1.toml'
-    config_path = sys.argv[1] if len(sys.argv) > 1 else "config1.toml"
+    parser.add_argument("config", nargs="?", default="config1.toml", help="Konfigurationsdatei (TOML)")
+    parser.add_argument("--profile", nargs="?", const="", metavar="ORDNER",
+                        help="CPU- und Speicherprofile aller Prozesse schreiben (Standard: ./profile_<handle>)")
+    args = parser.parse_args()
+    # Erst hier laden: Die Kindprozesse brauchen weder CLI noch TOML-Parser
+    import toml
+    from ui_cli import start_cli
+    from data_manager import open_history, close_history
+    from peer_table import create_peer_table, close_peer_table
+    config_path = args.config
     config = toml.load(config_path)
     config["config_path"] = config_path
+    profile_dir = None
+    if args.profile is not None:
+        profile_dir = args.profile or f"./profile_{config['handle']}"
+        os.makedirs(profile_dir, exist_ok=True)
+        config["profile_dir"] = profile_dir
 
     # Gemeinsame Datenstrukturen und Queues für Prozesskommunikation
-    manager = multiprocessing.Manager()
-    contacts = manager.dict()
-    chat_history = manager.list()
-    dnd = manager.Value('b', False)    # Nicht-Stören-Modus (bool)
-    status = manager.Value('u', "Online")  # Status als Unicode-String
+    # Kontakte, Status und DND: Die Kindprozesse öffnen die Tabelle über ihren Namen
+    peers = create_peer_table()
+    # Der Chatverlauf wird nur vom CLI-Prozess genutzt und liegt direkt auf der Festplatte
+    chat_history = open_history(config.get("historypath", f"./verlauf_{config['handle']}"))
 
-    ui_queue = multiprocessing.Queue()
-    disc_queue = multiprocessing.Queue()
-    net_queue = multiprocessing.Queue()
+    # Begrenzte Queues: Bei einer Flut wartet der Erzeuger bzw. greift die Überlaufstrategie (flow_control.py)
+    ui_queue = multiprocessing.Queue(UI_QUEUE_LIMIT)
+    disc_queue = multiprocessing.Queue(COMMAND_QUEUE_LIMIT)
+    net_queue = multiprocessing.Queue(COMMAND_QUEUE_LIMIT)
 
     # Start der Discovery- und Netzwerkprozesse
-    proc_discovery = multiprocessing.Process(
-        target=discovery_service, args=(ui_queue, disc_queue, config, contacts)
+    proc_discovery = service_process(
+        "discovery", ("discovery_comm", "discovery_service"), (ui_queue, disc_queue, config, peers["name"]),
+        profile_dir
     )
-    proc_network = multiprocessing.Process(
-        target=network_service, args=(ui_queue, net_queue, config, contacts)
+    proc_network = service_process(
+        "network", ("network_comm", "network_service"), (ui_queue, net_queue, config, peers["name"]), profile_dir
     )
 
     proc_discovery.start()
@@ -61,15 +91,75 @@ def main():
 
     try:
         # Start des User-Interfaces (CLI)
-        start_cli(ui_queue, disc_queue, net_queue, config, contacts, chat_history, dnd, status)
+        cli_args = (ui_queue, disc_queue, net_queue, config, peers, chat_history)
+        if profile_dir:
+            from profiling import run_profiled
+            run_profiled("cli", profile_dir, True, start_cli, *cli_args)
+        else:
+            start_cli(*cli_args)
     except KeyboardInterrupt:
         print("\n[System] Abbruch durch Nutzer (KeyboardInterrupt).")
     finally:
-        # Prozesse werden beim Beenden sauber terminiert
-        proc_discovery.terminate()
-        proc_network.terminate()
-        proc_discovery.join()
-        proc_network.join()
+        # Prozesse werden beim Beenden sauber gestoppt
+        stop_services([(proc_discovery, disc_queue), (proc_network, net_queue)])
+        close_history(chat_history)
+        close_peer_table(peers, unlink=True)
+        if profile_dir:
+            from profiling import write_report
+            print(f"[System] Profilbericht: {write_report(profile_dir)}")
+
+
+## Erzeugt den Prozess für einen Hintergrunddienst (im Profiling-Modus unter cProfile).
+def service_process(name, service, args, profile_dir):
+    """
+    @param name: Name des Dienstes (Dateiname des Profils)
+    @param service: (Modul, Funktion), z.B. ("network_comm", "network_service")
+    @param args: Argumente für die Dienstfunktion
+    @param profile_dir: Profilordner oder None
+    @return: multiprocessing.Process (noch nicht gestartet)
+    """
+    if profile_dir:
+        return multiprocessing.Process(target=run_service, args=(*service, profile_dir, name) + args)
+    return multiprocessing.Process(target=run_service, args=(*service, None, None) + args)
+
+
+## Importiert die Dienstfunktion im Kindprozess und führt sie aus.
+def run_service(module, function, profile_dir, name, *args):
+    """
+    So lädt nur der Kindprozess das Modul seines Dienstes, nicht der CLI-Prozess und nicht der
+    jeweils andere Dienst.
+
+    @param module: Modulname (z.B. "discovery_comm")
+    @param function: Name der Dienstfunktion
+    @param profile_dir: Profilordner oder None
+    @param name: Name des Profils (nur mit profile_dir)
+    @param args: Argumente für die Dienstfunktion
+    @return: None
+    """
+    service = getattr(importlib.import_module(module), function)
+    if profile_dir:
+        from profiling import run_profiled
+        run_profiled(name, profile_dir, True, service, *args)
+    else:
+        service(*args)
+
+
+## Beendet die Hintergrundprozesse über das Kommando STOP.
+def stop_services(services, timeout=STOP_TIMEOUT):
+    """
+    Prozesse, die nach timeout Sekunden noch laufen, werden terminiert.
+
+    @param services: Liste von (Prozess, Kommando-Queue)
+    @param timeout: Sekunden, die jeder Prozess zum Beenden hat
+    @return: None
+    """
+    for _, command_queue in services:
+        command_queue.put((CMD_STOP,))
+    for proc, _ in services:
+        proc.join(timeout)
+        if proc.is_alive():
+            proc.terminate()
+            proc.join()
 
 ## Standard-Einstiegspunkt für das Skript.
 if __name__ == "__main__":
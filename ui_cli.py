@@ -6,7 +6,10 @@ Dieses Modul bietet eine textbasierte, farbige Chat-Oberfläche. Nutzer können
 Bilder übertragen, Kontakte verwalten und ihren Status setzen. Die Oberfläche zeigt alle wichtigen
 Informationen wie Status, DND (Nicht-stören), Kontakte und Chatverlauf an und gibt nützliche Hilfetexte aus.
 
-Das Interface kommuniziert über Queues mit den Discovery- und Netzwerkmodulen.
+Das Interface kommuniziert über Queues mit den Discovery- und Netzwerkmodulen. Eingehende
+Ereignisse (siehe events.py) werden von einem Hintergrund-Thread blockweise ausgegeben.
+Metriken der Discovery- und Netzwerkprozesse kommen ebenfalls als Ereignis an; das CLI fasst sie
+mit den eigenen zusammen, zeigt sie mit "stats" an und exportiert sie (siehe metrics.py).
 Für die Farbdarstellung wird das Paket colorama verwendet.
 
 Das CLI ist so gestaltet, dass es ohne Klassen auskommt und auch für technisch weniger erfahrene
@@ -18,11 +21,41 @@ Nutzer leicht zu bedienen ist.
 
 import threading
 import os
+import sys
 import time
+import queue
+import datetime
 from colorama import init, Fore, Style
+from data_manager import add_message, read_history, search_history
+from peer_table import peer_snapshot, peer_states, lookup_peer, lookup_state, local_status, set_local_status
+from peer_table import PEER_SUSPECT, PEER_DEAD
+from events import EVENT_SYSTEM, EVENT_SENT, EVENT_MESSAGE, EVENT_IMAGE, EVENT_PEER, EVENT_WARNING, EVENT_ERROR
+from events import EVENT_METRICS
+from metrics import (new_metrics, inc, set_gauge, observe, snapshot, render_prometheus, format_stats,
+                     write_prometheus_file, serve_metrics)
+from protocol import CMD_WHO, CMD_LEAVE, CMD_STATS, CMD_MSG, CMD_MSG_MULTI, CMD_IMG_SEND
 
 init(autoreset=True)
 
+## Anzahl der Verlaufseinträge, die "history" ohne Angabe anzeigt.
+HISTORY_PAGE = 50
+## Maximale Anzahl an Ereignissen, die der Watcher in einem Schreibvorgang ausgibt.
+EVENT_BATCH = 256
+## Maximale Wartezeit in Sekunden auf aktuelle Metriken für "stats".
+STATS_WAIT = 1.0
+## Maximale Wartezeit in Sekunden, bis der Watcher beim Beenden die letzten Ereignisse ausgegeben hat.
+WATCHER_STOP_WAIT = 1.0
+## Farbe je Ereignisart.
+EVENT_COLORS = {
+    EVENT_SYSTEM: Fore.WHITE,
+    EVENT_SENT: Fore.GREEN,
+    EVENT_MESSAGE: Fore.WHITE,
+    EVENT_IMAGE: Fore.MAGENTA,
+    EVENT_PEER: Fore.CYAN,
+    EVENT_WARNING: Fore.YELLOW,
+    EVENT_ERROR: Fore.RED,
+}
+
 ## Gibt einen Hilfetext für alle verfügbaren Kommandos aus.
 def print_help():
     """
@@ -31,72 +64,294 @@ def print_help():
     print(Fore.CYAN + """
 Befehle:
   msg <Benutzer> <Text>         - Sende eine Textnachricht an einen Kontakt
+  msg all <Text>                - Sende eine Textnachricht an alle bekannten Kontakte
+  msg @<Gruppe> <Text>          - Sende eine Textnachricht an eine Gruppe aus der Konfiguration
   img <Benutzer> <Pfad>         - Übertrage ein Bild an einen Kontakt
   who                           - Aktualisiere die Nutzerliste im lokalen Netzwerk
   contacts                      - Zeige alle bekannten Kontakte an
-  history                       - Zeige den bisherigen Chatverlauf
+  stats                         - Zeige Laufzeitmetriken (Queues, Bytes, Fehler, Latenzen)
+  history [Anzahl]              - Zeige die letzten Einträge des Chatverlaufs (Standard: 50)
+  history --before <Zeit>       - Zeige ältere Einträge vor einem Zeitpunkt (Zeitstempel oder JJJJ-MM-TT[THH:MM])
+  history search <Begriffe>     - Durchsuche den Verlauf (alle Begriffe müssen vorkommen, 'wort*' für Wortanfänge)
+      [--peer <Name>] [--type text|image] [--from <Zeit>] [--to <Zeit>] [--limit <Anzahl>]
   status <Text>                 - Setze deinen eigenen Status (z.B. 'Abwesend')
   dnd                           - Aktiviere/deaktiviere Nicht-Stören-Modus
-  save                          - Speichere den bisherigen Chatverlauf in einer Datei
+  save                          - Schreibe den Chatverlauf sofort auf die Festplatte
   reload                        - Lade die Konfiguration neu (z.B. nach Änderungen)
   help                          - Zeige diese Hilfe an
   leave                         - Verlasse den Chat und beende die Sitzung
 """)
 
+## Ermittelt die Empfänger einer Gruppennachricht ("all" oder "@gruppe").
+def group_recipients(target, config, peers):
+    """
+    Gruppen stehen in der Konfiguration unter [groups], z.B. team = ["Hulk", "Superman"].
+    Der eigene Nutzername wird nie als Empfänger eingetragen.
+
+    @param target: "all" oder "@" gefolgt vom Gruppennamen
+    @param config: Konfiguration (dict)
+    @param peers: Gemeinsame Peer-Tabelle
+    @return: Liste der Nutzernamen oder None, wenn die Gruppe nicht existiert
+    """
+    if target == "all":
+        members = list(peer_snapshot(peers))
+    else:
+        members = config.get("groups", {}).get(target[1:])
+        if members is None:
+            return None
+    return [name for name in members if name != config.get("handle")]
+
+## Holt wartende Ereignisse aus der UI-Queue, ohne zu blockieren.
+def drain_events(ui_queue, batch, limit):
+    """
+    @param ui_queue: Queue mit Ereignissen (kind, text, meta)
+    @param batch: Liste, an die die Ereignisse angehängt werden
+    @param limit: Maximale Länge von batch
+    @return: None
+    """
+    while len(batch) < limit:
+        try:
+            batch.append(ui_queue.get_nowait())
+        except queue.Empty:
+            return
+
+
 ## Gibt alle neuen Nachrichten aus der UI-Queue farbig auf dem Terminal aus.
-def watcher(ui_queue):
+def watcher(ui_queue, chat_history, telemetry):
     """
-    Gibt alle eingegangenen System- oder Chatnachrichten, die sich in der Queue befinden, farbig aus.
+    Wartet blockierend auf das nächste Ereignis und holt danach alle bereits wartenden
+    Ereignisse dazu (höchstens EVENT_BATCH). Der ganze Block wird mit einem einzigen
+    Schreibvorgang ausgegeben, sodass auch viele Nachrichten auf einmal ohne Verzögerung
+    erscheinen. Die Farbe ergibt sich aus der Art des Ereignisses (events.EVENT_*).
+    Empfangene Nachrichten und Bilder werden zusätzlich im Chatverlauf gespeichert,
+    Metriken der anderen Prozesse werden nicht ausgegeben, sondern in telemetry abgelegt.
+    Ein None in der Queue beendet den Watcher, nachdem der aktuelle Block ausgegeben ist.
 
-    @param ui_queue: Queue mit neuen Nachrichten
+    @param ui_queue: Queue mit Ereignissen (kind, text, meta)
+    @param chat_history: Chatverlauf aus data_manager.open_history
+    @param telemetry: Metriken des CLI und der anderen Prozesse (siehe new_telemetry)
     """
-    while True:
-        while not ui_queue.empty():
-            msg = ui_queue.get()
-            if "fehler" in msg.lower():
-                print(Fore.RED + msg)
-            elif "bild" in msg.lower():
-                print(Fore.MAGENTA + msg)
-            elif "chat verlassen" in msg.lower():
-                print(Fore.CYAN + msg)
-            elif "gesendet" in msg.lower():
-                print(Fore.GREEN + msg)
+    metrics = telemetry["cli"]
+    stopping = False
+    while not stopping:
+        batch = [ui_queue.get()]
+        started = time.perf_counter()
+        drain_events(ui_queue, batch, EVENT_BATCH)
+        set_gauge(metrics, "ui_batch_events", len(batch))
+        lines = []
+        for event in batch:
+            if event is None:
+                stopping = True
+                continue
+            kind, text, meta = event
+            inc(metrics, "ui_events_total", kind=kind)
+            if kind == EVENT_METRICS:
+                update_telemetry(telemetry, meta["process"], meta["metrics"])
+                continue
+            if kind == EVENT_MESSAGE:
+                sender, body = meta.get("sender", ""), meta["body"]
+                add_message(chat_history, f"{sender}: {body}" if sender else body, peer=sender)
+            elif kind == EVENT_IMAGE and "filename" in meta:
+                add_message(chat_history, text, peer=meta.get("sender", ""), kind="image")
+            lines.append(EVENT_COLORS.get(kind, Fore.WHITE) + text + Style.RESET_ALL + "\n")
+        if lines:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+        observe(metrics, "ui_render_seconds", time.perf_counter() - started)
+
+## Legt die Metriken des CLI an und startet den HTTP-Export, falls konfiguriert.
+def new_telemetry(config):
+    """
+    Konfiguration: "metricsfile" (Pfad für den Prometheus-Export, wird bei jeder neuen Meldung
+    überschrieben) und "metricsport" (Port des HTTP-Endpunkts auf 127.0.0.1).
+
+    @param config: Konfiguration (dict)
+    @return: dict mit den eigenen Metriken ("cli"), den letzten Meldungen der anderen Prozesse
+             ("processes") und dem Zeitpunkt jeder Meldung ("received")
+    """
+    telemetry = {"cli": new_metrics("cli"), "processes": {}, "received": {}, "file": config.get("metricsfile")}
+    port = config.get("metricsport")
+    if port:
+        try:
+            serve_metrics(int(port), lambda: render_prometheus(all_snapshots(telemetry)))
+        except OSError as e:
+            print(Fore.RED + f"Metrik-Endpunkt auf Port {port} nicht verfügbar: {e}")
+    return telemetry
+
+## Liefert die Metriken aller Prozesse einschließlich des CLI.
+def all_snapshots(telemetry):
+    """
+    @param telemetry: Metriken aus new_telemetry
+    @return: dict Prozessname -> Kopie der Metriken
+    """
+    return {**telemetry["processes"], "cli": snapshot(telemetry["cli"])}
+
+## Übernimmt die gemeldeten Metriken eines Prozesses und aktualisiert die Exportdatei.
+def update_telemetry(telemetry, process, metrics):
+    """
+    @param telemetry: Metriken aus new_telemetry
+    @param process: Name des meldenden Prozesses
+    @param metrics: Kopie seiner Metriken
+    @return: None
+    """
+    telemetry["processes"][process] = metrics
+    telemetry["received"][process] = time.monotonic()
+    if telemetry["file"]:
+        try:
+            write_prometheus_file(telemetry["file"], render_prometheus(all_snapshots(telemetry)))
+        except OSError:
+            pass
+
+## Fordert aktuelle Metriken an und gibt sie aus (Befehl "stats").
+def print_stats(telemetry, discovery_queue, network_queue):
+    """
+    Wartet höchstens STATS_WAIT Sekunden auf die Antworten von Discovery und Netzwerk; fehlt eine,
+    werden die zuletzt gemeldeten Werte angezeigt.
+
+    @param telemetry: Metriken aus new_telemetry
+    @param discovery_queue: Queue für Kommandos an die Discovery-Komponente
+    @param network_queue: Queue für Kommandos an das Netzwerkmodul
+    """
+    requested = time.monotonic()
+    discovery_queue.put((CMD_STATS,))
+    network_queue.put((CMD_STATS,))
+    while time.monotonic() - requested < STATS_WAIT:
+        received = telemetry["received"]
+        if all(received.get(p, 0) >= requested for p in ("discovery", "network")):
+            break
+        time.sleep(0.02)
+    print(Fore.CYAN + "Laufzeitmetriken:")
+    for line in format_stats(all_snapshots(telemetry)):
+        print((Fore.YELLOW if line.startswith("[") else Fore.WHITE) + line)
+
+## Wandelt die Zeitangabe von "history --before" bzw. "--from"/"--to" in einen Unix-Zeitstempel um.
+def parse_before(value):
+    """
+    Akzeptiert einen Unix-Zeitstempel (wie in der Verlaufsausgabe angezeigt),
+    ein Datum (JJJJ-MM-TT) oder Datum mit Uhrzeit (JJJJ-MM-TTTHH:MM[:SS]).
+
+    @param value: Zeitangabe als Text
+    @return: Unix-Zeitstempel (float)
+    @throws ValueError: bei unbekanntem Format
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+## Gibt eine Seite des Chatverlaufs aus.
+def print_history(chat_history, args):
+    """
+    Zeigt die letzten Einträge (Standard: HISTORY_PAGE) bzw. die Einträge vor einem Zeitpunkt an.
+    Am Ende steht der Befehl, mit dem die vorherige Seite abgerufen werden kann.
+
+    @param chat_history: Chatverlauf aus data_manager.open_history
+    @param args: Argumente nach "history" (Liste von Strings)
+    """
+    if args and args[0] == "search":
+        print_search(chat_history, args[1:])
+        return
+    count, before = HISTORY_PAGE, None
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == "--before" and args:
+                before = parse_before(args.pop(0))
             else:
-                print(Fore.WHITE + msg)
-        time.sleep(0.1)
+                count = int(arg)
+    except ValueError:
+        print(Fore.RED + "Aufruf: history [Anzahl] [--before <Zeit>]")
+        return
+    entries = read_history(chat_history, count, before)
+    if not entries:
+        print(Fore.LIGHTBLACK_EX + "Noch keine Nachrichten im Verlauf.")
+        return
+    print(Fore.CYAN + "Chatverlauf:")
+    for ts, kind, peer, text in entries:
+        stamp = time.strftime("%d.%m. %H:%M", time.localtime(ts))
+        color = Fore.MAGENTA if kind == "image" else Fore.WHITE
+        print(Fore.LIGHTBLACK_EX + f"[{stamp}] " + color + text)
+    if len(entries) == count:
+        print(Fore.LIGHTBLACK_EX + f"Ältere Einträge: history {count} --before {entries[0][0]:.3f}")
+
+## Durchsucht den Chatverlauf und gibt die Treffer aus.
+def print_search(chat_history, args):
+    """
+    Alle Argumente, die keine Option sind, bilden die Suchanfrage.
+
+    @param chat_history: Chatverlauf aus data_manager.open_history
+    @param args: Argumente nach "history search" (Liste von Strings)
+    """
+    words, filters, limit = [], {}, HISTORY_PAGE
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg in ("--peer", "--type", "--from", "--to", "--limit") and not args:
+                raise ValueError(arg)
+            if arg == "--peer":
+                filters["peer"] = args.pop(0)
+            elif arg == "--type":
+                filters["kind"] = args.pop(0)
+                if filters["kind"] not in ("text", "image"):
+                    raise ValueError(arg)
+            elif arg == "--from":
+                filters["since"] = parse_before(args.pop(0))
+            elif arg == "--to":
+                filters["until"] = parse_before(args.pop(0))
+            elif arg == "--limit":
+                limit = int(args.pop(0))
+            else:
+                words.append(arg)
+    except ValueError:
+        print(Fore.RED + "Aufruf: history search <Begriffe> [--peer <Name>] [--type text|image] "
+                         "[--from <Zeit>] [--to <Zeit>] [--limit <Anzahl>]")
+        return
+    started = time.perf_counter()
+    entries, total = search_history(chat_history, " ".join(words), limit=limit, **filters)
+    elapsed = (time.perf_counter() - started) * 1000
+    if not entries:
+        print(Fore.LIGHTBLACK_EX + f"Keine Treffer ({elapsed:.1f} ms).")
+        return
+    print(Fore.CYAN + f"Suchergebnisse ({total} Treffer, {elapsed:.1f} ms):")
+    for ts, kind, peer, text in entries:
+        stamp = time.strftime("%d.%m.%y %H:%M", time.localtime(ts))
+        color = Fore.MAGENTA if kind == "image" else Fore.WHITE
+        print(Fore.LIGHTBLACK_EX + f"[{stamp}] " + color + text)
+    if total > len(entries):
+        print(Fore.LIGHTBLACK_EX + f"Ältere Treffer: mit --to {entries[0][0]:.3f} weitersuchen")
 
 ## Zeigt aktuelle Nutzerinformationen (Nickname, Status, DND) im Terminal an.
-def print_status(handle, status, dnd):
+def print_status(handle, peers):
     """
     Zeigt in einer farbigen Zeile an, unter welchem Nickname der Nutzer aktiv ist,
     welchen Status er gesetzt hat und ob der Nicht-stören-Modus aktiv ist.
 
     @param handle: Aktueller Nutzername 
-    @param status: Aktueller Statuswert 
-    @param dnd: DND-Modus (Nicht stören)
+    @param peers: Gemeinsame Peer-Tabelle mit Status und DND-Modus
     """
-    dnd_str = (Fore.RED + "🛑 Nicht stören") if dnd.value else (Fore.GREEN + "🟢 Erreichbar")
+    status, dnd = local_status(peers)
+    dnd_str = (Fore.RED + "🛑 Nicht stören") if dnd else (Fore.GREEN + "🟢 Erreichbar")
     print(
         f"{Fore.YELLOW}[{handle}{Style.RESET_ALL} | "
-        f"{Fore.BLUE}Status: {status.value}{Style.RESET_ALL} | {dnd_str}{Fore.YELLOW}]"
+        f"{Fore.BLUE}Status: {status}{Style.RESET_ALL} | {dnd_str}{Fore.YELLOW}]"
     )
 
 ## Hauptfunktion für die farbige Kommandozeilensteuerung von Plauderkiste.
-def start_cli(ui_queue, discovery_queue, network_queue, config, contacts, chat_history, dnd, status):
+def start_cli(ui_queue, discovery_queue, network_queue, config, peers, chat_history):
     """
     Startet die textbasierte, farbige Oberfläche des Plauderkiste-Chats.
     Nutzer können Kommandos eingeben, Nachrichten versenden und Systeminformationen einsehen.
 
-    Die Funktion läuft in einer Schleife bis der Nutzer den Chat verlässt.
+    Die Funktion läuft in einer Schleife bis der Nutzer den Chat verlässt. Danach gibt der
+    Watcher noch die wartenden Ereignisse aus. Ist "profile_dir" in der Konfiguration gesetzt
+    (start.py --profile), läuft der Watcher unter cProfile (siehe profiling.py).
 
     @param ui_queue: Queue für neue System- und Chatnachrichten 
     @param discovery_queue: Queue für Kommandos an die Discovery-Komponente
     @param network_queue: Queue für Kommandos an das Netzwerkmodul 
     @param config: Konfiguration (dict), enthält Nutzername, Port, u.a.
-    @param contacts: Gemeinsame Kontaktliste
-    @param chat_history: Gemeinsame Chat-Historie 
-    @param dnd: Status für Nicht-stören 
-    @param status: Freitext-Statusanzeige
+    @param peers: Gemeinsame Peer-Tabelle (Kontakte, eigener Status, Nicht-stören)
+    @param chat_history: Chatverlauf aus data_manager.open_history
     @return: None
     """
     handle = config.get("handle", "Unbekannt")
@@ -106,13 +361,41 @@ def start_cli(ui_queue, discovery_queue, network_queue, config, contacts, chat_h
     print(Fore.GREEN + "Willkommen bei Plauderkiste – deinem privaten Chat!")
     print_help()
 
-    threading.Thread(target=watcher, args=(ui_queue,), daemon=True).start()
-    
+    telemetry = new_telemetry(config)
+    watcher_args = (ui_queue, chat_history, telemetry)
+    if config.get("profile_dir"):
+        # Nur im Profiling-Modus laden (cProfile, pstats und tracemalloc kosten beim Start Zeit)
+        from profiling import run_profiled
+        watcher_thread = threading.Thread(
+            target=run_profiled, args=("cli-watcher", config["profile_dir"], False, watcher) + watcher_args,
+            daemon=True)
+    else:
+        watcher_thread = threading.Thread(target=watcher, args=watcher_args, daemon=True)
+    watcher_thread.start()
+    try:
+        command_loop(handle, discovery_queue, network_queue, config, peers, chat_history, telemetry)
+    finally:
+        ui_queue.put(None)
+        watcher_thread.join(WATCHER_STOP_WAIT)
+
+
+## Liest Kommandos ein und führt sie aus, bis der Nutzer den Chat verlässt.
+def command_loop(handle, discovery_queue, network_queue, config, peers, chat_history, telemetry):
+    """
+    @param handle: Eigener Nutzername
+    @param discovery_queue: Queue für Kommandos an die Discovery-Komponente
+    @param network_queue: Queue für Kommandos an das Netzwerkmodul
+    @param config: Konfiguration (dict)
+    @param peers: Gemeinsame Peer-Tabelle (Kontakte, eigener Status, Nicht-stören)
+    @param chat_history: Chatverlauf aus data_manager.open_history
+    @param telemetry: Metriken des CLI und der anderen Prozesse (siehe new_telemetry)
+    @return: None
+    """
     while True:
         # Ausgabe aller Systemnachrichten (Chat, Netzwerk, Fehler, etc.)
         ### watcher(ui_queue)
         # Statuszeile mit Nutzername, Status und DND
-        print_status(handle, status, dnd)
+        print_status(handle, peers)
         # Mini-Hinweis für Kommandos unter dem Prompt
         print(Fore.LIGHTBLACK_EX + "[help] für Kommandos.", end="")
         try:
@@ -130,44 +413,50 @@ def start_cli(ui_queue, discovery_queue, network_queue, config, contacts, chat_h
             print_help()
         elif cmd == "leave":
             # Nutzer verlässt den Chat sauber, benachrichtigt das Netzwerk
-            discovery_queue.put(f"LEAVE {handle}")
+            discovery_queue.put((CMD_LEAVE, handle))
             print(Fore.CYAN + "Du hast den Chat verlassen.")
             time.sleep(0.5)
             break
+        elif cmd == "stats":
+            # Zeigt die Metriken aller Prozesse an
+            print_stats(telemetry, discovery_queue, network_queue)
         elif cmd == "who":
             # Fordert eine aktuelle Liste aller erreichbaren Nutzer an
-            discovery_queue.put("WHO")
+            discovery_queue.put((CMD_WHO,))
         elif cmd == "contacts":
-            discovery_queue.put("WHO")
+            discovery_queue.put((CMD_WHO,))
             # Zeigt alle aktuell bekannten Kontakte und deren Adressen
+            contacts, states = peer_snapshot(peers), peer_states(peers)
             if contacts:
                 print(Fore.CYAN + "Bekannte Kontakte:")
                 for name, (ip, port) in contacts.items():
-                    print(Fore.YELLOW + f"  {name} " + Fore.LIGHTBLACK_EX + f"@ {ip}:{port}")
+                    state = states.get(name)
+                    if state == PEER_DEAD:
+                        print(Fore.LIGHTBLACK_EX + f"  {name} @ {ip}:{port} (offline)")
+                    elif state == PEER_SUSPECT:
+                        print(Fore.YELLOW + f"  {name} " + Fore.LIGHTBLACK_EX + f"@ {ip}:{port} (unsicher)")
+                    else:
+                        print(Fore.YELLOW + f"  {name} " + Fore.LIGHTBLACK_EX + f"@ {ip}:{port}")
             else:
                 print(Fore.LIGHTBLACK_EX + "Keine Kontakte gespeichert. (Tipp: who ausführen)")
         elif cmd == "history":
-            # Gibt den bisherigen Chatverlauf aus
-            if chat_history:
-                print(Fore.CYAN + "Chatverlauf:")
-                for line in chat_history:
-                    print(Fore.WHITE + line)
-            else:
-                print(Fore.LIGHTBLACK_EX + "Noch keine Nachrichten im Verlauf.")
+            # Gibt eine Seite des Chatverlaufs aus
+            print_history(chat_history, inp.split()[1:])
         elif cmd == "status" and len(parts) > 1:
             # Ändert den Status des Nutzers (z.B. "Abwesend")
-            status.value = parts[1]
+            set_local_status(peers, parts[1], local_status(peers)[1])
             print(Fore.BLUE + f"Status gesetzt: {parts[1]}")
         elif cmd == "dnd":
             # Schaltet den Nicht-stören-Modus um (z.B. für Meetings)
-            dnd.value = not dnd.value
-            state = "aktiviert" if dnd.value else "deaktiviert"
+            status, dnd = local_status(peers)
+            set_local_status(peers, status, not dnd)
+            state = "deaktiviert" if dnd else "aktiviert"
             print(Fore.BLUE + f"Nicht-Stören-Modus {state}.")
         elif cmd == "save":
-            # Speichert den Chatverlauf in eine lokale Textdatei
+            # Schreibt den Chatverlauf sofort auf die Festplatte
             from data_manager import save_history
             save_history(chat_history)
-            print(Fore.GREEN + "Verlauf gespeichert (verlauf.txt).")
+            print(Fore.GREEN + f"Verlauf gespeichert ({chat_history['dir']}).")
         elif cmd == "reload":
             # Lädt die Konfiguration neu, falls Einstellungen geändert wurden
             from data_manager import reload_config
@@ -178,16 +467,35 @@ def start_cli(ui_queue, discovery_queue, network_queue, config, contacts, chat_h
                 print(Fore.GREEN + "Konfiguration neu geladen.")
             except Exception as e:
                 print(Fore.RED + f"Fehler beim Reload: {e}")
+        elif cmd == "msg" and len(parts) > 2 and (parts[1] == "all" or parts[1].startswith("@")):
+            # Sendet eine Textnachricht an alle Kontakte bzw. an eine Gruppe
+            target, message = parts[1], parts[2]
+            recipients = group_recipients(target, config, peers)
+            if recipients is None:
+                print(Fore.RED + f"Gruppe {target[1:]} ist nicht in der Konfiguration definiert.")
+            elif not recipients:
+                print(Fore.LIGHTBLACK_EX + "Keine Empfänger. (Tipp: who ausführen)")
+            else:
+                network_queue.put((CMD_MSG_MULTI, target, recipients, message))
+                add_message(chat_history, f"Du an {target}: {message}", peer=target)
+                print(Fore.GREEN + f"Nachricht an {target} wird an {len(recipients)} Empfänger gesendet...")
         elif cmd == "msg" and len(parts) > 2:
             # Sendet eine Textnachricht an einen Kontakt
             recipient = parts[1]
             message = parts[2]
-            if recipient not in contacts:
+            unknown = lookup_peer(peers, recipient) is None
+            offline = not unknown and lookup_state(peers, recipient) == PEER_DEAD
+            if (unknown or offline) and config.get("outbox", True):
+                # Der Netzwerkprozess merkt die Nachricht im Ausgang vor und meldet das selbst
+                network_queue.put((CMD_MSG, recipient, message))
+                add_message(chat_history, f"Du an {recipient}: {message}", peer=recipient)
+            elif unknown:
                 print(Fore.RED + f"Empfänger {recipient} unbekannt. (Tipp: who ausführen)")
+            elif offline:
+                print(Fore.RED + f"{recipient} ist offline, Nachricht nicht gesendet.")
             else:
-                network_queue.put(f"MSG {recipient} {message}")
-                from data_manager import add_message
-                add_message(chat_history, f"Du an {recipient}: {message}")
+                network_queue.put((CMD_MSG, recipient, message))
+                add_message(chat_history, f"Du an {recipient}: {message}", peer=recipient)
         elif cmd == "img" and len(parts) > 2:
             # Überträgt ein Bild an einen Kontakt
             recipient = parts[1]
@@ -196,10 +504,8 @@ def start_cli(ui_queue, discovery_queue, network_queue, config, contacts, chat_h
                 print(Fore.RED + "Dateipfad existiert nicht!")
                 continue
             filename = os.path.basename(path)
-            size = os.path.getsize(path)
-            network_queue.put(f"IMG_SEND {recipient} {filename} {size}::{path}")
-            from data_manager import add_message
-            add_message(chat_history, f"[Bild an {recipient} gesendet: {filename}]")
+            network_queue.put((CMD_IMG_SEND, recipient, filename, path))
+            add_message(chat_history, f"[Bild an {recipient} gesendet: {filename}]", peer=recipient, kind="image")
             print(Fore.MAGENTA + f"Bild wird an {recipient} gesendet...")
         else:
             # Fehlermeldung für ungültige Kommandos